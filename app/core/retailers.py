@@ -0,0 +1,41 @@
+import re
+
+# Shared by the scraper and the catalog crawler; no heavy imports, so the crawler
+# does not load the browser agent or the catalog database engine
+LAPTOP_SERVER_RETAILERS = {
+    "fptshop.com.vn": "FPT Shop",
+    "thegioididong.com": "Thế Giới Di Động", 
+    "cellphones.com.vn": "CellphoneS",
+    "hoanghamobile.com": "Hoàng Hà Mobile",
+    "phongvu.vn": "Phong Vũ",
+    "gearvn.com": "GearVN",
+    "anphatpc.com.vn": "An Phát PC",
+    "phucanh.vn": "Phúc Anh",
+    "trananh.vn": "Trần Anh",
+    "nguyenkim.com": "Nguyễn Kim",
+    "mediamart.vn": "MediaMart",
+    "dienmayxanh.com": "Điện Máy Xanh",
+    "tgdđ.com": "Thế Giới Di Động",
+    "fpt.com.vn": "FPT",
+    "viettelstore.vn": "Viettel Store",
+    "vinaphone.com.vn": "Vinaphone"
+}
+
+def extract_model_from_title(title: str) -> str:
+    """Extract model/SKU from product title."""
+    # Common laptop/server model patterns
+    patterns = [
+        r'\b[A-Z]{2,4}\d{3,4}[A-Z]?\b',  # HP 15, Dell XPS 13, etc.
+        r'\b[A-Z]{2,4}-\d{3,4}[A-Z]?\b',  # HP-15, Dell-XPS-13, etc.
+        r'\b[A-Z]{2,4}\s+\d{3,4}[A-Z]?\b',  # HP 15, Dell XPS 13, etc.
+        r'\b[A-Z]{2,4}\d{2,3}[A-Z]{1,2}\d{1,2}\b',  # ThinkPad T14, etc.
+        r'\b[A-Z]{2,4}\d{2,3}[A-Z]{1,2}\b',  # ThinkPad T14, etc.
+        r'\b[A-Z]{2,4}\d{2,3}\b',  # HP 15, etc.
+        r'\b[A-Z]{2,4}\d{2,3}[A-Z]{1,2}\d{1,2}[A-Z]{1,2}\b',  # ThinkPad T14s Gen 2, etc.
+    ]
+    
+    for pattern in patterns:
+        matches = re.findall(pattern, title.upper())
+        if matches:
+            return matches[0]
+    return ""
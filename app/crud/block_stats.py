@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy.orm import Session
+from app.db.local import DomainBlockStats
+
+def record_navigation(db: Session, domain: str, reason: Optional[str] = None):
+    """Counts a navigation to a domain, and a block if `reason` is given."""
+    try:
+        row = db.get(DomainBlockStats, domain)
+        if row is None:
+            row = DomainBlockStats(domain=domain, navigations=0, blocks=0)
+            db.add(row)
+        row.navigations += 1
+        if reason:
+            row.blocks += 1
+            row.last_reason = reason
+            row.last_blocked = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        print(f"BLOCK STATS ERROR: Could not record a navigation to {domain}. Error: {e}")
+        db.rollback()
+
+def get_last_blocked(db: Session, domain: str) -> Optional[datetime]:
+    row = db.get(DomainBlockStats, domain)
+    return row.last_blocked if row else None
+
+def get_block_rates(db: Session) -> Dict[str, Dict]:
+    """Returns the block rate and last block of every domain, most blocked first."""
+    rows = db.query(DomainBlockStats).order_by(DomainBlockStats.blocks.desc()).all()
+    return {
+        row.domain: {
+            "navigations": row.navigations,
+            "blocks": row.blocks,
+            "block_rate": round(row.blocks / row.navigations, 4) if row.navigations else 0.0,
+            "last_reason": row.last_reason,
+            "last_blocked": row.last_blocked.isoformat() if row.last_blocked else None,
+        }
+        for row in rows
+    }
@@ -0,0 +1,93 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.db.local import CatalogUrl, CatalogToken, SitemapState
+from app.crud.sku_index import normalize_sku
+
+def upsert_catalog_entries(db: Session, entries: List[Dict]) -> int:
+    """
+    Inserts or refreshes a batch of catalog entries and their lookup tokens.
+    Entries whose stored lastmod is not older than the incoming one are left untouched.
+
+    Args:
+        db (Session): A session on the local state database.
+        entries: Dicts with 'url', 'domain', 'retailer', 'title', 'model',
+                 'source', 'lastmod' (datetime or None) and 'tokens' (list of str).
+
+    Returns:
+        The number of new or changed entries written.
+    """
+    if not entries:
+        return 0
+    now = datetime.utcnow()
+    written = 0
+    try:
+        existing = {
+            row.url: row
+            for row in db.query(CatalogUrl).filter(CatalogUrl.url.in_([e["url"] for e in entries])).all()
+        }
+        for entry in entries:
+            row = existing.get(entry["url"])
+            if row is not None:
+                if row.lastmod and entry.get("lastmod") and entry["lastmod"] <= row.lastmod:
+                    continue
+                row.title = entry.get("title") or row.title
+                row.model = entry.get("model") or row.model
+                row.lastmod = entry.get("lastmod") or row.lastmod
+                row.last_seen = now
+                db.query(CatalogToken).filter(CatalogToken.catalog_url_id == row.id).delete()
+            else:
+                row = CatalogUrl(
+                    url=entry["url"],
+                    domain=entry["domain"],
+                    retailer=entry.get("retailer"),
+                    title=entry.get("title"),
+                    model=entry.get("model"),
+                    source=entry["source"],
+                    lastmod=entry.get("lastmod"),
+                    first_seen=now,
+                    last_seen=now,
+                )
+                db.add(row)
+                db.flush()
+                existing[row.url] = row
+            for token in {normalize_sku(t) for t in entry.get("tokens", [])}:
+                if token:
+                    db.add(CatalogToken(token=token, catalog_url_id=row.id))
+            written += 1
+        db.commit()
+    except Exception as e:
+        print(f"CATALOG ERROR: Could not write {len(entries)} catalog entries. Error: {e}")
+        db.rollback()
+        return 0
+    return written
+
+def find_catalog_urls(db: Session, sku: str, limit: int = 20) -> List[CatalogUrl]:
+    """Looks up catalog product URLs whose SKU/model tokens match the given SKU."""
+    return (
+        db.query(CatalogUrl)
+        .join(CatalogToken, CatalogToken.catalog_url_id == CatalogUrl.id)
+        .filter(CatalogToken.token == normalize_sku(sku))
+        .order_by(CatalogUrl.last_seen.desc())
+        .limit(limit)
+        .all()
+    )
+
+def get_sitemap_lastmod(db: Session, sitemap_url: str) -> Optional[datetime]:
+    """Returns the lastmod recorded for a sitemap on its previous crawl, if any."""
+    state = db.get(SitemapState, sitemap_url)
+    return state.lastmod if state else None
+
+def set_sitemap_state(db: Session, sitemap_url: str, domain: str, lastmod: Optional[datetime]):
+    """Records that a sitemap has been crawled up to the given lastmod."""
+    try:
+        state = db.get(SitemapState, sitemap_url)
+        if state is None:
+            state = SitemapState(sitemap_url=sitemap_url, domain=domain)
+            db.add(state)
+        state.lastmod = lastmod
+        state.last_crawled = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        print(f"CATALOG ERROR: Could not record sitemap state for {sitemap_url}. Error: {e}")
+        db.rollback()
@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.db.local import PageValidator
+
+def get_page_validator(db: Session, url: str) -> Optional[PageValidator]:
+    """Returns the stored validators for a product page URL, if it was fetched before."""
+    return db.get(PageValidator, url)
+
+def save_page_validator(db: Session, url: str, etag: Optional[str], last_modified: Optional[str],
+                        fragment_hash: Optional[str], price: Optional[float], changed: bool,
+                        render_only: bool = False):
+    """
+    Stores the validators and price-fragment hash seen on the latest fetch of a page.
+
+    Args:
+        db (Session): A session on the local state database.
+        url (str): The product page URL.
+        etag (str): The ETag response header, if any.
+        last_modified (str): The Last-Modified response header, if any.
+        fragment_hash (str): SHA-256 of the price-relevant fragment.
+        price (float): The price parsed from the fragment.
+        changed (bool): Whether the fragment differed from the previous fetch.
+        render_only (bool): The price is rendered by JavaScript, so the HTML
+            validators say nothing about it: stored ones are dropped.
+    """
+    now = datetime.utcnow()
+    try:
+        validator = db.get(PageValidator, url)
+        if validator is None:
+            validator = PageValidator(url=url)
+            db.add(validator)
+        if render_only:
+            validator.etag = validator.last_modified = None
+        else:
+            validator.etag = etag or validator.etag
+            validator.last_modified = last_modified or validator.last_modified
+        validator.fragment_hash = fragment_hash or validator.fragment_hash
+        if price is not None:
+            validator.last_price = price
+        validator.last_checked = now
+        if changed:
+            validator.last_changed = now
+        db.commit()
+    except Exception as e:
+        print(f"VALIDATOR ERROR: Could not save validators for {url}. Error: {e}")
+        db.rollback()
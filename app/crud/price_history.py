@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from app.db.async_db import run_db_sync
+from app.db.models import ProductPriceHistory
+from app.schemas.products import parse_scraped_at
+
+
+def _offer_to_history_row(sku: str, offer: Dict, now: datetime) -> Optional[Dict]:
+    price = offer.get("finalPriceVND")
+    if not isinstance(price, (int, float)):
+        return None
+    scraped_at = parse_scraped_at(offer.get("scrapedAt"))
+    return {
+        # The catalog SKU, not the retailer's spelling, so history joins to Product.Sku
+        "Sku": sku,
+        "Retailer": offer.get("retailer"),
+        "Price": price,
+        "OldPrice": offer.get("oldPriceVND") if isinstance(offer.get("oldPriceVND"), (int, float)) else None,
+        "StockStatus": offer.get("stockStatus"),
+        "Url": offer.get("url"),
+        # The server time stamped by scrape_product_data, stored as naive UTC like the other *OnUtc columns
+        "ScrapedOnUtc": scraped_at.replace(tzinfo=None) if scraped_at else now,
+    }
+
+def add_price_history(db: Session, sku: str, offers: List[Dict], chunk_size: int = 1000) -> int:
+    """
+    Adds the price history rows of scraped offers to the current transaction,
+    without committing (see bulk_update_prices). Returns the number of rows.
+    """
+    now = datetime.utcnow()
+    rows = [row for row in (_offer_to_history_row(sku, offer, now) for offer in offers or []) if row]
+    for start in range(0, len(rows), chunk_size):
+        db.execute(insert(ProductPriceHistory), rows[start:start + chunk_size])
+    return len(rows)
+
+def insert_price_history(db: Session, sku: str, offers: List[Dict], chunk_size: int = 1000,
+                         raise_errors: bool = False) -> int:
+    """
+    Appends scraped offers to the price history with executemany inserts.
+
+    Args:
+        db (Session): The active SQLAlchemy database session.
+        sku (str): The catalog SKU that was scraped; every row is stored under it.
+        offers (List[Dict]): The offers returned by scrape_product_data.
+        raise_errors (bool): Re-raise a database error after the rollback
+            instead of returning 0, so the caller can count it.
+
+    Returns:
+        The number of rows inserted.
+    """
+    try:
+        inserted = add_price_history(db, sku, offers, chunk_size)
+        if inserted:
+            db.commit()
+        return inserted
+    except Exception as e:
+        print(f"DATABASE ERROR: Could not insert price history for SKU {sku}. Transaction rolled back. Error: {e}")
+        db.rollback()
+        if raise_errors:
+            raise
+        return 0
+
+def get_latest_prices_per_retailer(db: Session, sku: str) -> List[ProductPriceHistory]:
+    """Returns the most recent offer of each retailer for a SKU, cheapest first."""
+    ranked = (
+        select(
+            ProductPriceHistory.Id,
+            func.row_number().over(
+                partition_by=ProductPriceHistory.Retailer,
+                order_by=ProductPriceHistory.ScrapedOnUtc.desc()
+            ).label("rn")
+        )
+        .where(ProductPriceHistory.Sku == sku)
+        .subquery()
+    )
+    return (
+        db.query(ProductPriceHistory)
+        .join(ranked, ProductPriceHistory.Id == ranked.c.Id)
+        .filter(ranked.c.rn == 1)
+        .order_by(ProductPriceHistory.Price)
+        .all()
+    )
+
+def get_min_prices_over_window(db: Session, skus: List[str], days: float = 30,
+                               now: Optional[datetime] = None) -> Dict[str, float]:
+    """Returns the lowest price seen per SKU within the last `days` days."""
+    if not skus:
+        return {}
+    since = (now or datetime.utcnow()) - timedelta(days=days)
+    rows = (
+        db.query(ProductPriceHistory.Sku, func.min(ProductPriceHistory.Price))
+        .filter(ProductPriceHistory.Sku.in_(skus), ProductPriceHistory.ScrapedOnUtc >= since)
+        .group_by(ProductPriceHistory.Sku)
+        .all()
+    )
+    return {sku: float(price) for sku, price in rows}
+
+def get_price_series(db: Session, sku: str, days: float = 30, retailer: Optional[str] = None) -> List[ProductPriceHistory]:
+    """Returns the offers of a SKU within the last `days` days, oldest first."""
+    since = datetime.utcnow() - timedelta(days=days)
+    query = db.query(ProductPriceHistory).filter(
+        ProductPriceHistory.Sku == sku,
+        ProductPriceHistory.ScrapedOnUtc >= since
+    )
+    if retailer:
+        query = query.filter(ProductPriceHistory.Retailer == retailer)
+    return query.order_by(ProductPriceHistory.ScrapedOnUtc).all()
+
+async def insert_price_history_async(db: Session, sku: str, offers: List[Dict], chunk_size: int = 1000,
+                                     raise_errors: bool = False) -> int:
+    return await run_db_sync(insert_price_history, db, sku, offers, chunk_size, raise_errors)
@@ -1,7 +1,11 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from app.db import models
 from app.schemas.products import ProductCreate, ProductUpdate
-from typing import List
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from app.db.async_db import run_db_sync
+from app.crud.price_history import add_price_history
 
 # Create product
 def create_product(db: Session, product: ProductCreate):
@@ -53,11 +57,135 @@ def get_all_skus(db: Session) -> List[str]:
         return [] 
 
 
+def iter_sku_pages(db: Session, page_size: int = 1000, updated_before: Optional[datetime] = None) -> Iterator[List[str]]:
+    """
+    Yields the published SKUs page by page, using keyset pagination on the
+    primary key, so work can start on the first page instead of after the
+    whole catalog has been loaded.
+
+    Args:
+        db (Session): The active SQLAlchemy database session.
+        page_size (int): SKUs per page (one query per page).
+        updated_before (datetime): Only products not updated since then (UpdatedOnUtc).
+    """
+    last_id = 0
+    while True:
+        query = db.query(models.Product.Id, models.Product.Sku).filter(
+            models.Product.Published == 1,
+            models.Product.Deleted == 0,
+            models.Product.Id > last_id
+        )
+        if updated_before is not None:
+            query = query.filter(models.Product.UpdatedOnUtc < updated_before)
+        try:
+            rows = query.order_by(models.Product.Id).limit(page_size).all()
+        except Exception as e:
+            print(f"DATABASE ERROR: Could not fetch SKUs after Id {last_id}. Error: {e}")
+            return
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        skus = [sku for _, sku in rows if sku]
+        if skus:
+            yield skus
+        if len(rows) < page_size:
+            return
+
+def iter_skus(db: Session, page_size: int = 1000, updated_before: Optional[datetime] = None) -> Iterator[str]:
+    """Yields the published SKUs one by one (see iter_sku_pages)."""
+    for page in iter_sku_pages(db, page_size=page_size, updated_before=updated_before):
+        yield from page
+
+def get_sku_margins(db: Session, skus: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Fetches the gross margin (Price - ProductCost) / Price of every published SKU,
+    used as a business-value signal by the scheduler.
+
+    Args:
+        skus (List[str]): Only these SKUs (e.g. one page of iter_sku_pages). Defaults to all.
+    """
+    try:
+        query = db.query(models.Product.Sku, models.Product.Price, models.Product.ProductCost).filter(
+            models.Product.Published == 1,
+            models.Product.Deleted == 0
+        )
+        if skus is not None:
+            query = query.filter(models.Product.Sku.in_(skus))
+        rows = query.all()
+        return {
+            sku: float((price - cost) / price)
+            for sku, price, cost in rows
+            if sku and price and cost is not None
+        }
+    except Exception as e:
+        print(f"DATABASE ERROR: Could not fetch SKU margins. Error: {e}")
+        return {}
+
+
 # Get all products
 def get_products(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Product).offset(skip).limit(limit).all()
 
-def update_price_for_sku(db: Session, sku: str, new_price: float):
+class SkuIdMap:
+    """
+    In-process map from SKU (compared like SQL Server's default collation, see
+    normalize) to Product.Id, so price updates are primary-key lookups. Load it
+    once per job with refresh(); later calls only read products added or
+    updated since the previous refresh, and unmap those soft-deleted since.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._skus: Dict[int, str] = {}
+        self._max_id = 0
+        self._max_updated: Optional[datetime] = None
+
+    @staticmethod
+    def normalize(sku: str) -> str:
+        # Same equality as SQL Server's default collation: case-insensitive, no padding
+        return (sku or "").strip().upper()
+
+    def refresh(self, db: Session) -> int:
+        """Loads new and changed products. Returns the number of rows read."""
+        query = db.query(models.Product.Id, models.Product.Sku, models.Product.UpdatedOnUtc, models.Product.Deleted)
+        if self._max_updated is None:
+            query = query.filter(models.Product.Deleted == 0)
+        else:
+            # Changed rows include products deleted since the last refresh, which are unmapped below
+            query = query.filter(or_(models.Product.Id > self._max_id, models.Product.UpdatedOnUtc > self._max_updated))
+        try:
+            rows = query.all()
+        except Exception as e:
+            print(f"DATABASE ERROR: Could not refresh the SKU map. Error: {e}")
+            return 0
+        for product_id, sku, updated_on, deleted in rows:
+            previous = self._skus.pop(product_id, None)
+            if previous is not None and self._ids.get(previous) == product_id:
+                del self._ids[previous]
+            if sku and not deleted:
+                self._ids[self.normalize(sku)] = product_id
+                self._skus[product_id] = self.normalize(sku)
+            self._max_id = max(self._max_id, product_id)
+            if updated_on and (self._max_updated is None or updated_on > self._max_updated):
+                self._max_updated = updated_on
+        if self._max_updated is None:
+            self._max_updated = datetime.min
+        print(f"DATABASE: SKU map refreshed with {len(rows)} products ({len(self._ids)} SKUs mapped).")
+        return len(rows)
+
+    def get(self, sku: str) -> Optional[int]:
+        return self._ids.get(self.normalize(sku))
+
+    def skus(self) -> List[str]:
+        """The mapped catalog SKUs, in normalize() form."""
+        return list(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def update_price_for_sku(db: Session, sku: str, new_price: float, sku_map: Optional[SkuIdMap] = None,
+                         raise_errors: bool = False):
     """
     Finds a product by its SKU and updates its 'OldPrice' column with a new price.
 
@@ -65,17 +193,30 @@ def update_price_for_sku(db: Session, sku: str, new_price: float):
         db (Session): The active SQLAlchemy database session.
         sku (str): The SKU of the product to update.
         new_price (float): The new price to set for the product's OldPrice.
+        sku_map (SkuIdMap): If given, the product is fetched by primary key.
+        raise_errors (bool): Re-raise a database error after the rollback,
+            so the caller can count it and mark the SKU failed.
     """
     print(f"DATABASE: Attempting to update SKU '{sku}' with new price: {new_price}...")
     
     try:
         # Step 1: Find the product in the database that matches the SKU.
         # We use .first() because we expect the SKU to be unique.
-        product_to_update = db.query(models.Product).filter(models.Product.Sku == sku).first()
+        product_id = sku_map.get(sku) if sku_map is not None else None
+        if product_id is not None:
+            product_to_update = db.get(models.Product, product_id)
+        else:
+            product_to_update = db.query(models.Product).filter(
+                models.Product.Sku == sku,
+                models.Product.Deleted == 0
+            ).first()
 
         # Step 2: Check if the product was actually found.
-        if product_to_update:
-            # Step 3a: If found, update the OldPrice field on the product object.
+        if product_to_update and product_to_update.Price is not None and float(product_to_update.Price) == float(new_price):
+            # Step 3a: Unchanged price, skip the write (and the UpdatedOnUtc bump) entirely.
+            print(f"DATABASE: SKU '{sku}' price unchanged at {new_price}. No update was performed.")
+        elif product_to_update:
+            # Step 3b: If found, update the OldPrice field on the product object.
             # IMPORTANT: This assumes your SQLAlchemy model's column is named 'OldPrice'.
             # Adjust the field name if yours is different (e.g., product_to_update.old_price).
             product_to_update.Price = new_price
@@ -85,7 +226,7 @@ def update_price_for_sku(db: Session, sku: str, new_price: float):
             
             print(f"DATABASE: Successfully updated SKU '{sku}'. New Price is now {new_price}.")
         else:
-            # Step 3b: If no product was found, print a warning and do nothing.
+            # Step 3c: If no product was found, print a warning and do nothing.
             print(f"DATABASE: SKU '{sku}' not found in the database. No update was performed.")
 
     except Exception as e:
@@ -93,6 +234,64 @@ def update_price_for_sku(db: Session, sku: str, new_price: float):
         # This prevents the database from being left in a partially updated, inconsistent state.
         print(f"DATABASE ERROR: Could not update SKU {sku}. Transaction rolled back. Error: {e}")
         db.rollback()
+        if raise_errors:
+            raise
+
+def bulk_update_prices(db: Session, prices: Dict[str, float], chunk_size: int = 1000,
+                       sku_map: Optional[SkuIdMap] = None, history: Optional[Dict[str, List[Dict]]] = None) -> int:
+    """
+    Updates the Price of many products in a single transaction.
+    Products whose price is unchanged are not touched.
+
+    Args:
+        db (Session): The active SQLAlchemy database session.
+        prices (Dict[str, float]): The new price per SKU.
+        chunk_size (int): SKUs per lookup query (SQL Server allows ~2100 parameters).
+        sku_map (SkuIdMap): If given, mapped SKUs are fetched by primary key.
+        history (Dict[str, List[Dict]]): Offers per scraped catalog SKU to append to
+            the price history in the same transaction.
+
+    Returns:
+        The number of products updated.
+
+    Raises:
+        Exception: The database error, after the transaction was rolled back;
+            nothing of the batch is written then.
+    """
+    print(f"DATABASE: Bulk updating prices for {len(prices)} SKUs...")
+    updated = 0
+    try:
+        skus = list(prices.keys())
+        if sku_map is not None:
+            ids = {sku_map.get(sku): sku for sku in skus if sku_map.get(sku) is not None}
+            id_list = list(ids)
+            for start in range(0, len(id_list), chunk_size):
+                for product in db.query(models.Product).filter(models.Product.Id.in_(id_list[start:start + chunk_size])).all():
+                    new_price = prices[ids[product.Id]]
+                    if product.Price is not None and float(product.Price) == float(new_price):
+                        continue
+                    product.Price = new_price
+                    updated += 1
+            # Unmapped SKUs (e.g. added after the map was loaded) fall back to the Sku lookup
+            skus = [sku for sku in skus if sku_map.get(sku) is None]
+        # The database may match a SKU case-insensitively, so results are keyed by the normalized SKU
+        normalized_prices = {SkuIdMap.normalize(sku): prices[sku] for sku in skus}
+        for start in range(0, len(skus), chunk_size):
+            chunk = skus[start:start + chunk_size]
+            for product in db.query(models.Product).filter(models.Product.Sku.in_(chunk), models.Product.Deleted == 0).all():
+                new_price = normalized_prices.get(SkuIdMap.normalize(product.Sku))
+                if new_price is None or (product.Price is not None and float(product.Price) == float(new_price)):
+                    continue
+                product.Price = new_price
+                updated += 1
+        history_rows = sum(add_price_history(db, sku, offers, chunk_size) for sku, offers in (history or {}).items())
+        db.commit()
+        print(f"DATABASE: Bulk update committed. {updated} products changed, {history_rows} price history rows.")
+    except Exception as e:
+        print(f"DATABASE ERROR: Bulk price update failed. Transaction rolled back. Error: {e}")
+        db.rollback()
+        raise
+    return updated
 
 # Update product
 def update_product(db: Session, product_id: int, update: ProductUpdate):
@@ -112,3 +311,35 @@ def delete_product(db: Session, product_id: int):
         db.delete(db_product)
         db.commit()
     return db_product
+
+
+# --- Async counterparts ---
+# SQL Server is reached through pyodbc, which has no async API: these run the
+# functions above on the DB thread pool so the event loop is never blocked.
+
+async def get_all_skus_async(db: Session) -> List[str]:
+    return await run_db_sync(get_all_skus, db)
+
+async def get_sku_margins_async(db: Session, skus: Optional[List[str]] = None) -> Dict[str, float]:
+    return await run_db_sync(get_sku_margins, db, skus)
+
+async def iter_sku_pages_async(db: Session, page_size: int = 1000,
+                               updated_before: Optional[datetime] = None) -> AsyncIterator[List[str]]:
+    pages = iter_sku_pages(db, page_size=page_size, updated_before=updated_before)
+    while True:
+        # Each page query runs on the DB thread pool; the generator is resumed by one thread at a time
+        page = await run_db_sync(next, pages, None)
+        if page is None:
+            return
+        yield page
+
+async def get_product_by_sku_async(db: Session, sku: str):
+    return await run_db_sync(get_product_by_sku, db, sku)
+
+async def update_price_for_sku_async(db: Session, sku: str, new_price: float, sku_map: Optional[SkuIdMap] = None,
+                                     raise_errors: bool = False):
+    return await run_db_sync(update_price_for_sku, db, sku, new_price, sku_map, raise_errors)
+
+async def bulk_update_prices_async(db: Session, prices: Dict[str, float], chunk_size: int = 1000,
+                                   sku_map: Optional[SkuIdMap] = None, history: Optional[Dict[str, List[Dict]]] = None) -> int:
+    return await run_db_sync(bulk_update_prices, db, prices, chunk_size, sku_map, history)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Dict, Iterable
+from sqlalchemy.orm import Session
+from app.db.local import QueryTemplateStats
+
+def get_template_yields(db: Session, templates: Iterable[str], prior_searches: float = 1.0,
+                        prior_yield: float = 2.0) -> Dict[str, float]:
+    """
+    Returns the smoothed number of new URLs per search of each template.
+    Untried templates get the optimistic prior, so they are tried early.
+    """
+    templates = list(templates)
+    rows = {row.template: row for row in db.query(QueryTemplateStats).filter(QueryTemplateStats.template.in_(templates)).all()}
+    yields = {}
+    for template in templates:
+        row = rows.get(template)
+        searches = row.searches if row else 0
+        new_urls = row.new_urls if row else 0
+        yields[template] = (new_urls + prior_yield * prior_searches) / (searches + prior_searches)
+    return yields
+
+def record_template_result(db: Session, template: str, results: int, new_urls: int):
+    """Adds one search of a template and the URLs it returned to its statistics."""
+    try:
+        row = db.get(QueryTemplateStats, template)
+        if row is None:
+            row = QueryTemplateStats(template=template, searches=0, results=0, new_urls=0)
+            db.add(row)
+        row.searches += 1
+        row.results += results
+        row.new_urls += new_urls
+        row.last_used = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        print(f"QUERY STATS ERROR: Could not record a search for '{template}'. Error: {e}")
+        db.rollback()
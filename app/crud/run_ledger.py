@@ -0,0 +1,160 @@
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.crud.sku_index import normalize_sku
+from app.db.local import PriceUpdateRun, PriceUpdateRunItem
+
+# Separators stripped in SQL to find ledger rows by normalize_sku() form
+_SKU_SEPARATORS = "-_ ./"
+
+def _normalized_sku_column():
+    column = func.upper(func.trim(PriceUpdateRunItem.sku))
+    for separator in _SKU_SEPARATORS:
+        column = func.replace(column, separator, "")
+    return column
+
+def start_or_resume_run(db: Session, window_hours: float = 24) -> PriceUpdateRun:
+    """
+    Resumes the latest unfinished run started within the run window, or starts a new one.
+
+    Args:
+        db (Session): A session on the local state database.
+        window_hours (float): How far back an unfinished run may be resumed.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=window_hours)
+    run = (
+        db.query(PriceUpdateRun)
+        .filter(PriceUpdateRun.status == "running", PriceUpdateRun.started_at >= cutoff)
+        .order_by(PriceUpdateRun.started_at.desc())
+        .first()
+    )
+    if run:
+        print(f"LEDGER: Resuming price update run #{run.id} started at {run.started_at}.")
+        return run
+    run = PriceUpdateRun(status="running", started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+    print(f"LEDGER: Started price update run #{run.id}.")
+    return run
+
+def start_batch_run(db: Session) -> PriceUpdateRun:
+    """Starts a run for an on-demand batch lookup; it is never resumed by run_price_update_job."""
+    run = PriceUpdateRun(status="batch", started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+    print(f"LEDGER: Started batch lookup run #{run.id}.")
+    return run
+
+def get_recent_results(db: Session, skus: List[str], max_age_hours: float = 24) -> Dict[str, List[dict]]:
+    """
+    Returns the offers of the latest completed scrape of each SKU within the
+    window, keyed by the requested spelling. SKUs are matched in normalize_sku()
+    form; a SKU whose latest scrape found no offers is not returned.
+    """
+    wanted = {}
+    for sku in skus:
+        wanted.setdefault(normalize_sku(sku), sku)
+    wanted.pop("", None)
+    if not wanted:
+        return {}
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    rows = (
+        db.query(PriceUpdateRunItem.sku, PriceUpdateRunItem.result)
+        .filter(
+            _normalized_sku_column().in_(list(wanted)),
+            PriceUpdateRunItem.status == "done",
+            PriceUpdateRunItem.updated_at >= cutoff
+        )
+        .order_by(PriceUpdateRunItem.updated_at)
+        .all()
+    )
+    # Ordered oldest first, so the newest result of a SKU wins
+    latest = {}
+    for sku, result in rows:
+        key = normalize_sku(sku)
+        if key in wanted:
+            latest[wanted[key]] = json.loads(result or "[]")
+    return {sku: products for sku, products in latest.items() if products}
+
+def get_completed_skus(db: Session, window_hours: float = 24) -> Set[str]:
+    """
+    Returns the SKUs completed by a price update run within the run window.
+    Batch lookups do not update prices, so their SKUs are not counted.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=window_hours)
+    rows = db.query(PriceUpdateRunItem.sku).join(
+        PriceUpdateRun, PriceUpdateRun.id == PriceUpdateRunItem.run_id
+    ).filter(
+        PriceUpdateRun.status != "batch",
+        PriceUpdateRunItem.status == "done",
+        PriceUpdateRunItem.updated_at >= cutoff
+    ).all()
+    return {row[0] for row in rows}
+
+def get_exhausted_skus(db: Session, run_id: int, max_attempts: int = 3) -> Set[str]:
+    """Returns the SKUs of a run that failed (or crashed mid-way) too many times to retry."""
+    rows = db.query(PriceUpdateRunItem.sku).filter(
+        PriceUpdateRunItem.run_id == run_id,
+        PriceUpdateRunItem.status != "done",
+        PriceUpdateRunItem.attempts >= max_attempts
+    ).all()
+    return {row[0] for row in rows}
+
+def _get_or_create_item(db: Session, run_id: int, sku: str) -> PriceUpdateRunItem:
+    item = db.query(PriceUpdateRunItem).filter(PriceUpdateRunItem.run_id == run_id, PriceUpdateRunItem.sku == sku).first()
+    if item is None:
+        item = PriceUpdateRunItem(run_id=run_id, sku=sku, status="pending", attempts=0)
+        db.add(item)
+    return item
+
+def mark_sku_started(db: Session, run_id: int, sku: str):
+    """Records an attempt on a SKU before scraping it, so a crash counts as an attempt."""
+    try:
+        item = _get_or_create_item(db, run_id, sku)
+        item.status = "running"
+        item.attempts += 1
+        item.updated_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        print(f"LEDGER ERROR: Could not mark SKU {sku} as started. Error: {e}")
+        db.rollback()
+
+def mark_sku_done(db: Session, run_id: int, sku: str, products: Optional[List[dict]]):
+    """Records a SKU as completed together with the offers it produced."""
+    try:
+        item = _get_or_create_item(db, run_id, sku)
+        item.status = "done"
+        item.result = json.dumps(products or [], ensure_ascii=False)
+        item.updated_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        print(f"LEDGER ERROR: Could not mark SKU {sku} as done. Error: {e}")
+        db.rollback()
+
+def mark_sku_failed(db: Session, run_id: int, sku: str, error: str):
+    """Records a failed attempt on a SKU; it is retried on resume until max attempts."""
+    try:
+        item = _get_or_create_item(db, run_id, sku)
+        item.status = "failed"
+        item.result = error
+        item.updated_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        print(f"LEDGER ERROR: Could not mark SKU {sku} as failed. Error: {e}")
+        db.rollback()
+
+def finish_run(db: Session, run_id: int):
+    """Marks a run as finished so the next job starts a fresh one. Batch runs keep their status."""
+    try:
+        run = db.get(PriceUpdateRun, run_id)
+        if run:
+            if run.status != "batch":
+                run.status = "finished"
+            run.finished_at = datetime.utcnow()
+            db.commit()
+            print(f"LEDGER: Price update run #{run_id} finished.")
+    except Exception as e:
+        print(f"LEDGER ERROR: Could not finish run #{run_id}. Error: {e}")
+        db.rollback()
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.db.local import SerpCacheEntry
+
+# fetched_at of a row created only to claim a first fetch; never served
+_NEVER_FETCHED = datetime(1970, 1, 1)
+
+def get_serp_entry(db: Session, query_key: str, locale: str) -> Optional[SerpCacheEntry]:
+    """Returns the cached SERP of a normalized query, if it was ever fetched."""
+    entry = db.get(SerpCacheEntry, (query_key, locale))
+    if entry is None or entry.fetched_at <= _NEVER_FETCHED:
+        return None
+    return entry
+
+def get_serp_candidates(entry: SerpCacheEntry) -> List[Dict]:
+    try:
+        return json.loads(entry.candidates)
+    except ValueError:
+        return []
+
+def claim_serp_refresh(db: Session, query_key: str, locale: str, query: str, lease_seconds: float) -> bool:
+    """
+    Marks a SERP as being fetched by the caller for `lease_seconds`. Only one
+    caller gets True until the fetch is saved or the lease runs out, so
+    workers do not search Google for the same query at the same time.
+    """
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=lease_seconds)
+    try:
+        claimed = db.execute(
+            update(SerpCacheEntry)
+            .where(
+                SerpCacheEntry.query_key == query_key,
+                SerpCacheEntry.locale == locale,
+                or_(SerpCacheEntry.refreshing_until.is_(None), SerpCacheEntry.refreshing_until < now),
+            )
+            .values(refreshing_until=until)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return True
+        if db.get(SerpCacheEntry, (query_key, locale)) is not None:
+            return False
+        db.add(SerpCacheEntry(query_key=query_key, locale=locale, query=query, candidates="[]",
+                              fetched_at=_NEVER_FETCHED, refreshing_until=until))
+        db.commit()
+        return True
+    except IntegrityError:
+        # Another worker created the row first
+        db.rollback()
+        return False
+    except Exception as e:
+        print(f"SERP CACHE ERROR: Could not claim '{query}'. Error: {e}")
+        db.rollback()
+        return True
+
+def save_serp_entry(db: Session, query_key: str, locale: str, query: str, candidates: List[Dict]):
+    """Stores a fetched SERP and releases the refresh claim."""
+    try:
+        entry = db.get(SerpCacheEntry, (query_key, locale))
+        if entry is None:
+            entry = SerpCacheEntry(query_key=query_key, locale=locale)
+            db.add(entry)
+        entry.query = query
+        entry.candidates = json.dumps(candidates, ensure_ascii=False)
+        entry.fetched_at = datetime.utcnow()
+        entry.refreshing_until = None
+        db.commit()
+    except Exception as e:
+        print(f"SERP CACHE ERROR: Could not save '{query}'. Error: {e}")
+        db.rollback()
+
+def release_serp_refresh(db: Session, query_key: str, locale: str):
+    """Drops a refresh claim after a failed fetch, so another worker may retry."""
+    try:
+        db.execute(
+            update(SerpCacheEntry)
+            .where(SerpCacheEntry.query_key == query_key, SerpCacheEntry.locale == locale)
+            .values(refreshing_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception as e:
+        print(f"SERP CACHE ERROR: Could not release '{query_key}'. Error: {e}")
+        db.rollback()
+
+def purge_serp_cache(db: Session, older_than_seconds: float) -> int:
+    """Deletes SERPs fetched longer ago than `older_than_seconds`."""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    try:
+        deleted = db.query(SerpCacheEntry).filter(
+            SerpCacheEntry.fetched_at < cutoff,
+            or_(SerpCacheEntry.refreshing_until.is_(None), SerpCacheEntry.refreshing_until < datetime.utcnow()),
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except Exception as e:
+        print(f"SERP CACHE ERROR: Could not purge old entries. Error: {e}")
+        db.rollback()
+        return 0
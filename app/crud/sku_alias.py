@@ -0,0 +1,115 @@
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.crud.sku_index import normalize_sku
+from app.db.local import SkuAlias
+
+# Trailing SKU parts retailers add for the colour or packaging of the same product
+SKU_SUFFIXES = {
+    "BLACK", "BLK", "SILVER", "SLV", "GREY", "GRAY", "WHITE", "BLUE", "GOLD", "PINK", "RED", "GREEN",
+    "BK", "SV", "GY", "WH", "BOX", "TRAY", "NEW", "FULLBOX", "CHINHHANG",
+}
+
+def canonicalize_sku(sku: str) -> str:
+    """
+    Reduces a SKU to the form catalog and retailer spellings share: separators,
+    case and known suffixes removed ("n5i5101w1-Black" -> "N5I5101W1").
+    """
+    if not sku:
+        return ""
+    parts = [part for part in re.split(r"[^A-Z0-9]+", sku.upper()) if part]
+    while len(parts) > 1 and parts[-1] in SKU_SUFFIXES:
+        parts.pop()
+    return "".join(parts)
+
+def get_sku_aliases(db: Session) -> Dict[str, str]:
+    """Returns every stored alias with its catalog SKU."""
+    return {alias: catalog_sku for alias, catalog_sku in db.query(SkuAlias.alias, SkuAlias.catalog_sku).all()}
+
+def record_sku_aliases(db: Session, aliases: Iterable[Tuple[str, str]], source: str):
+    """
+    Upserts confirmed (alias, catalog SKU) pairs. A re-confirmed alias gets a
+    fresh last_seen; an alias confirmed for another SKU is moved to it.
+    """
+    now = datetime.utcnow()
+    pairs = {normalize_sku(alias): catalog_sku for alias, catalog_sku in aliases if normalize_sku(alias)}
+    if not pairs:
+        return
+    try:
+        existing = {row.alias: row for row in db.query(SkuAlias).filter(SkuAlias.alias.in_(list(pairs))).all()}
+        for alias, catalog_sku in pairs.items():
+            row = existing.get(alias)
+            if row:
+                row.catalog_sku = catalog_sku
+                row.hit_count += 1
+                row.last_seen = now
+            else:
+                db.add(SkuAlias(alias=alias, catalog_sku=catalog_sku, source=source, first_seen=now, last_seen=now))
+        db.commit()
+    except Exception as e:
+        print(f"SKU ALIAS ERROR: Could not record {len(pairs)} aliases. Error: {e}")
+        db.rollback()
+
+
+class SkuAliasMap:
+    """
+    Maps scraped SKUs to catalog SKUs with dict lookups: the exact normalized
+    SKU, then its canonical form, each against the catalog and the stored
+    aliases. Aliases learned while resolving are kept in memory and written
+    with save().
+    """
+
+    def __init__(self):
+        self._aliases: Dict[str, str] = {}
+        self._learned: Dict[str, str] = {}
+
+    def load(self, db: Session, catalog_skus: Iterable[str]) -> "SkuAliasMap":
+        """Loads the catalog SKUs and the stored aliases. Stored aliases win."""
+        for sku in catalog_skus:
+            if sku:
+                self._aliases.setdefault(normalize_sku(sku), sku)
+                self._aliases.setdefault(canonicalize_sku(sku), sku)
+        self._aliases.update(get_sku_aliases(db))
+        return self
+
+    def resolve(self, sku: str) -> Optional[str]:
+        """Returns the catalog SKU a scraped SKU refers to, or None."""
+        if not sku:
+            return None
+        return self._aliases.get(normalize_sku(sku)) or self._aliases.get(canonicalize_sku(sku))
+
+    def learn(self, alias: str, catalog_sku: str):
+        key = normalize_sku(alias)
+        if key and self._aliases.get(key) != catalog_sku:
+            self._aliases[key] = catalog_sku
+            self._learned[key] = catalog_sku
+
+    def resolve_offer(self, offer: Dict) -> Optional[str]:
+        """
+        Resolves an offer's 'sku'. If it is unknown but the offer was found by
+        searching a catalog SKU whose code appears in its title or URL, the
+        match is confirmed and the offer's SKU is learned as an alias.
+        """
+        catalog_sku = self.resolve(offer.get("sku"))
+        if catalog_sku:
+            return catalog_sku
+        searched = self.resolve(offer.get("searchQuery"))
+        code = canonicalize_sku(searched or "")
+        if searched and len(code) >= 5 and code in normalize_sku(f"{offer.get('productName', '')} {offer.get('url', '')}"):
+            if offer.get("sku"):
+                self.learn(offer["sku"], searched)
+            return searched
+        return None
+
+    def save(self, db: Session) -> int:
+        """Persists the aliases learned since the last save. Returns their number."""
+        learned: List[Tuple[str, str]] = list(self._learned.items())
+        if learned:
+            record_sku_aliases(db, learned, source="search")
+            print(f"SKU ALIAS: Learned {len(learned)} new aliases.")
+            self._learned.clear()
+        return len(learned)
+
+    def __len__(self) -> int:
+        return len(self._aliases)
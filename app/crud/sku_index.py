@@ -0,0 +1,105 @@
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from app.db.local import SkuUrlIndex
+
+# Entries below this confidence are candidates, not URLs trusted for a direct visit
+MIN_TRUSTED_CONFIDENCE = 0.3
+# Unverified Google results: indexed for the query planner, below the trusted threshold
+SERP_CANDIDATE_CONFIDENCE = 0.2
+
+def normalize_sku(sku: str) -> str:
+    """
+    Normalizes a SKU for index lookups: upper case, separators and spaces removed.
+    """
+    if not sku:
+        return ""
+    return re.sub(r"[^A-Z0-9]", "", sku.upper())
+
+def get_known_urls(db: Session, sku: str, max_age_hours: float = 72,
+                   min_confidence: float = MIN_TRUSTED_CONFIDENCE) -> List[SkuUrlIndex]:
+    """
+    Returns fresh, trusted product URLs known for a SKU, most confident first.
+
+    Args:
+        db (Session): A session on the local state database.
+        sku (str): The SKU being scraped (raw or normalized).
+        max_age_hours (float): Entries not seen for longer than this are considered stale.
+        min_confidence (float): Entries below this confidence are ignored.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    return (
+        db.query(SkuUrlIndex)
+        .filter(
+            SkuUrlIndex.sku == normalize_sku(sku),
+            SkuUrlIndex.last_seen >= cutoff,
+            SkuUrlIndex.confidence >= min_confidence,
+        )
+        .order_by(SkuUrlIndex.confidence.desc(), SkuUrlIndex.last_seen.desc())
+        .all()
+    )
+
+def record_sku_urls(db: Session, sku: str, entries: Iterable[Dict[str, Optional[str]]], source: str, confidence: float):
+    """
+    Upserts URLs seen for a SKU. Re-confirmed URLs gain confidence and get a fresh last_seen;
+    observations below MIN_TRUSTED_CONFIDENCE never lift a URL past their own confidence.
+
+    Args:
+        db (Session): A session on the local state database.
+        sku (str): The SKU the URLs belong to.
+        entries: Dicts with a 'url' and an optional 'retailer' key.
+        source (str): Where the URLs came from ('agent', 'google').
+        confidence (float): Confidence for this observation, between 0 and 1.
+    """
+    normalized = normalize_sku(sku)
+    if not normalized:
+        return
+    now = datetime.utcnow()
+    try:
+        for entry in entries:
+            url = entry.get("url")
+            if not url:
+                continue
+            row = db.query(SkuUrlIndex).filter(SkuUrlIndex.sku == normalized, SkuUrlIndex.url == url).first()
+            if row:
+                if confidence >= row.confidence:
+                    row.source = source
+                if confidence >= MIN_TRUSTED_CONFIDENCE:
+                    row.confidence = min(1.0, max(row.confidence, confidence) + 0.1)
+                else:
+                    row.confidence = max(row.confidence, confidence)
+                row.hit_count += 1
+                row.last_seen = now
+                row.retailer = entry.get("retailer") or row.retailer
+            else:
+                db.add(SkuUrlIndex(
+                    sku=normalized,
+                    url=url,
+                    retailer=entry.get("retailer"),
+                    source=source,
+                    confidence=confidence,
+                    first_seen=now,
+                    last_seen=now,
+                ))
+        db.commit()
+    except Exception as e:
+        print(f"SKU INDEX ERROR: Could not record URLs for SKU {sku}. Error: {e}")
+        db.rollback()
+
+def demote_sku_urls(db: Session, sku: str, urls: Iterable[str], factor: float = 0.5):
+    """
+    Lowers the confidence of known URLs that did not yield an offer, so they
+    eventually drop out and trigger rediscovery.
+    """
+    urls = list(urls)
+    if not urls:
+        return
+    try:
+        rows = db.query(SkuUrlIndex).filter(SkuUrlIndex.sku == normalize_sku(sku), SkuUrlIndex.url.in_(urls)).all()
+        for row in rows:
+            row.confidence *= factor
+        db.commit()
+    except Exception as e:
+        print(f"SKU INDEX ERROR: Could not demote URLs for SKU {sku}. Error: {e}")
+        db.rollback()
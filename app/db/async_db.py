@@ -0,0 +1,30 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app.db.engine import DB_POOL_SIZE
+
+T = TypeVar("T")
+
+# Threads for blocking (pyodbc) database calls made from async code. Kept apart
+# from the default executor so DB calls cannot be starved by other to_thread work.
+DB_THREADS = int(os.getenv("DB_THREADS", str(DB_POOL_SIZE)))
+
+_db_executor: ThreadPoolExecutor | None = None
+
+
+async def run_db_sync(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a blocking database call on the DB thread pool and awaits it, so the
+    event loop keeps serving scrapes meanwhile. Used for SQL Server, whose
+    pyodbc driver has no async API.
+
+    A Session may be passed in, but must not be used by two calls at once.
+    """
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,86 @@
+import logging
+import os
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Pool settings shared by the SQL Server and Postgres engines; override per deployment.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle connections before the server or a firewall drops idle ones
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# SQL statement logging; off by default because it sits on the hot path
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Engines created by build_engine, by name, for pool_metrics
+_engines: Dict[str, Engine] = {}
+_pool_events: Dict[str, Dict[str, int]] = {}
+
+
+def build_engine(name: str, url: str, **overrides: Any) -> Engine:
+    """
+    Creates an engine with explicit pool settings and registers it for pool_metrics.
+
+    Args:
+        name (str): Name of the engine in pool_metrics (e.g. "mydb").
+        url (str): The database URL.
+        overrides: Keyword arguments passed to create_engine instead of the defaults.
+    """
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "echo": DB_ECHO,
+    }
+    if url.startswith("mssql+pyodbc"):
+        # Sends executemany() parameter sets in one round trip instead of one per row
+        options["fast_executemany"] = True
+    options.update(overrides)
+
+    engine = create_engine(url, **options)
+    counters = {"connects": 0, "checkouts": 0, "invalidations": 0, "saturated_checkouts": 0}
+    capacity = options["pool_size"] + max(options["max_overflow"], 0)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        counters["connects"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        counters["checkouts"] += 1
+        if engine.pool.checkedout() >= capacity:
+            counters["saturated_checkouts"] += 1
+            logger.warning(f"Connection pool '{name}' is exhausted ({capacity} connections checked out); "
+                           f"further checkouts wait up to {options['pool_timeout']}s.")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        counters["invalidations"] += 1
+
+    _engines[name] = engine
+    _pool_events[name] = counters
+    return engine
+
+def pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the pool state of every engine created so far: configured size,
+    connections checked in/out, current overflow, and event counters.
+    """
+    metrics = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        state = {"status": pool.status()}
+        for attribute in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, attribute, None)
+            if callable(method):
+                state[attribute] = method()
+        state.update(_pool_events[name])
+        metrics[name] = state
+    return metrics
@@ -0,0 +1,226 @@
+import os
+from sqlalchemy import (
+    create_engine, event, Column, String, Integer, Text, Float, DateTime, UniqueConstraint, ForeignKey
+)
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.sql import func
+
+# Local state used by the scraper itself (indexes, caches, ledgers).
+# Kept separate from the nopCommerce database so it can live next to the worker.
+LOCAL_DATABASE_URL = os.getenv("LOCAL_DATABASE_URL", "sqlite:///output/scraper_state.db")
+
+_is_sqlite = LOCAL_DATABASE_URL.startswith("sqlite")
+if LOCAL_DATABASE_URL.startswith("sqlite:///"):
+    os.makedirs(os.path.dirname(os.path.abspath(LOCAL_DATABASE_URL[len("sqlite:///"):])), exist_ok=True)
+
+local_engine = create_engine(
+    LOCAL_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30} if _is_sqlite else {},
+)
+
+if _is_sqlite:
+    @event.listens_for(local_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets several worker processes read and write the state concurrently
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+LocalSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=local_engine)
+LocalBase = declarative_base()
+
+
+class SkuUrlIndex(LocalBase):
+    """Known retailer product URLs for a normalized SKU."""
+    __tablename__ = "sku_url_index"
+    __table_args__ = (UniqueConstraint("sku", "url", name="uq_sku_url_index_sku_url"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sku = Column(String(200), nullable=False, index=True)
+    url = Column(Text, nullable=False)
+    retailer = Column(String(200), nullable=True)
+    source = Column(String(50), nullable=False)          # agent / google
+    confidence = Column(Float, nullable=False, default=0.5)
+    hit_count = Column(Integer, nullable=False, default=1)
+    first_seen = Column(DateTime, server_default=func.now(), nullable=False)
+    last_seen = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class SkuAlias(LocalBase):
+    """A retailer-side SKU spelling confirmed to mean a catalog SKU."""
+    __tablename__ = "sku_aliases"
+
+    alias = Column(String(200), primary_key=True)                # normalize_sku() form
+    catalog_sku = Column(String(200), nullable=False, index=True)
+    source = Column(String(50), nullable=False)                  # search / manual
+    hit_count = Column(Integer, nullable=False, default=1)
+    first_seen = Column(DateTime, server_default=func.now(), nullable=False)
+    last_seen = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class CatalogUrl(LocalBase):
+    """A retailer product URL discovered from a sitemap or category listing."""
+    __tablename__ = "catalog_urls"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    url = Column(String(1000), nullable=False, unique=True)
+    domain = Column(String(200), nullable=False, index=True)
+    retailer = Column(String(200), nullable=True)
+    title = Column(Text, nullable=True)
+    model = Column(String(200), nullable=True)
+    source = Column(String(50), nullable=False)          # sitemap / category
+    lastmod = Column(DateTime, nullable=True)
+    first_seen = Column(DateTime, server_default=func.now(), nullable=False)
+    last_seen = Column(DateTime, server_default=func.now(), nullable=False)
+
+class CatalogToken(LocalBase):
+    """Normalized SKU/model tokens pointing at catalog URLs, for O(log n) lookups."""
+    __tablename__ = "catalog_tokens"
+    __table_args__ = (UniqueConstraint("token", "catalog_url_id", name="uq_catalog_tokens_token_url"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token = Column(String(200), nullable=False, index=True)
+    catalog_url_id = Column(Integer, ForeignKey("catalog_urls.id", ondelete="CASCADE"), nullable=False, index=True)
+
+class SitemapState(LocalBase):
+    """Last seen lastmod of each crawled sitemap, for incremental refreshes."""
+    __tablename__ = "sitemap_state"
+
+    sitemap_url = Column(String(1000), primary_key=True)
+    domain = Column(String(200), nullable=False)
+    lastmod = Column(DateTime, nullable=True)
+    last_crawled = Column(DateTime, nullable=True)
+
+class PageValidator(LocalBase):
+    """HTTP validators and price-fragment hash of a product page, for conditional re-fetch."""
+    __tablename__ = "page_validators"
+
+    url = Column(String(1000), primary_key=True)
+    etag = Column(String(500), nullable=True)
+    last_modified = Column(String(100), nullable=True)
+    fragment_hash = Column(String(64), nullable=True)
+    last_price = Column(Float, nullable=True)
+    last_checked = Column(DateTime, nullable=True)
+    last_changed = Column(DateTime, nullable=True)
+
+class QueryTemplateStats(LocalBase):
+    """How many new product URLs a search query template has yielded."""
+    __tablename__ = "query_template_stats"
+
+    template = Column(String(300), primary_key=True)    # e.g. "{q} khuyến mãi"
+    searches = Column(Integer, nullable=False, default=0)
+    results = Column(Integer, nullable=False, default=0)
+    new_urls = Column(Integer, nullable=False, default=0)
+    last_used = Column(DateTime, nullable=True)
+
+class SerpCacheEntry(LocalBase):
+    """Product candidates of one Google SERP, shared by runs and workers."""
+    __tablename__ = "serp_cache"
+
+    query_key = Column(String(500), primary_key=True)    # normalize_query() form
+    locale = Column(String(100), primary_key=True)       # e.g. "www.google.com.vn|en"
+    query = Column(Text, nullable=False)
+    candidates = Column(Text, nullable=False)            # JSON list
+    fetched_at = Column(DateTime, nullable=False, index=True)
+    refreshing_until = Column(DateTime, nullable=True)   # a worker is fetching it until then
+
+class DomainBlockStats(LocalBase):
+    """Navigations to a domain and how many of them hit a CAPTCHA or block page."""
+    __tablename__ = "domain_block_stats"
+
+    domain = Column(String(200), primary_key=True)
+    navigations = Column(Integer, nullable=False, default=0)
+    blocks = Column(Integer, nullable=False, default=0)
+    last_reason = Column(String(50), nullable=True)     # recaptcha / unusual_traffic / cloudflare / http_403 / http_429
+    last_blocked = Column(DateTime, nullable=True)
+
+class SkuSchedule(LocalBase):
+    """Per-SKU price-change statistics and next-due time for adaptive recrawling."""
+    __tablename__ = "sku_schedule"
+
+    sku = Column(String(200), primary_key=True)
+    last_price = Column(Float, nullable=True)
+    checks = Column(Integer, nullable=False, default=0)
+    changes = Column(Integer, nullable=False, default=0)
+    volatility = Column(Float, nullable=False, default=0.5)   # EWMA of "price changed" per check
+    last_checked = Column(DateTime, nullable=True)
+    last_changed = Column(DateTime, nullable=True)
+    next_due = Column(DateTime, nullable=True, index=True)
+    manual_boost = Column(Float, nullable=False, default=0.0)
+
+class SkuRetailerPrice(LocalBase):
+    """Latest price of a SKU at one retailer, used to detect retailer-level changes."""
+    __tablename__ = "sku_retailer_prices"
+
+    sku = Column(String(200), primary_key=True)
+    retailer = Column(String(200), primary_key=True)
+    last_price = Column(Float, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+
+class RetailerPriceStats(LocalBase):
+    """Per-retailer price-change statistics."""
+    __tablename__ = "retailer_price_stats"
+
+    retailer = Column(String(200), primary_key=True)
+    observations = Column(Integer, nullable=False, default=0)
+    changes = Column(Integer, nullable=False, default=0)
+
+class PriceUpdateRun(LocalBase):
+    """One execution of run_price_update_job, resumable until finished."""
+    __tablename__ = "price_update_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String(20), nullable=False, default="running")   # running / batch / finished
+    started_at = Column(DateTime, server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+class PriceUpdateRunItem(LocalBase):
+    """Per-SKU status of a price update run."""
+    __tablename__ = "price_update_run_items"
+    __table_args__ = (UniqueConstraint("run_id", "sku", name="uq_price_update_run_items_run_sku"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey("price_update_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    sku = Column(String(200), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="pending")   # running / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(Text, nullable=True)                               # JSON offers or error message
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+
+class WorkQueueJob(LocalBase):
+    """A SKU job on the distributed work queue (SQL backend)."""
+    __tablename__ = "work_queue_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    queue = Column(String(100), nullable=False, index=True)
+    sku = Column(String(200), nullable=False)
+    priority = Column(Float, nullable=False, default=0.0)
+    status = Column(String(20), nullable=False, default="queued", index=True)   # queued / leased / done / collected / dead
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_token = Column(String(64), nullable=True, index=True)
+    leased_by = Column(String(200), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    enqueued_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+def create_local_tables():
+    """Ensure the local state tables exist."""
+    LocalBase.metadata.create_all(bind=local_engine)
+
+_tables_ready = False
+
+def get_local_db():
+    """Dependency to get a session on the local state database."""
+    global _tables_ready
+    if not _tables_ready:
+        create_local_tables()
+        _tables_ready = True
+    db = LocalSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
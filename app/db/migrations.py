@@ -0,0 +1,64 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.db.models import Product, ProductPriceHistory
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_SKU_INDEX = "IX_Product_Sku"
+
+# SQL Server compares strings case-insensitively and ignores trailing spaces
+# under the default collation, so this index serves the same equality as
+# SkuIdMap.normalize() (trim + upper case). It does not serve lookups by the
+# separator-free normalize_sku()/canonical forms; those are resolved in memory
+# by SkuAliasMap. INCLUDE covers the price job's reads without key lookups.
+PRODUCT_SKU_INDEX_SQL = {
+    "mssql": (
+        f"CREATE NONCLUSTERED INDEX {PRODUCT_SKU_INDEX} ON [Product] ([Sku]) "
+        "INCLUDE ([Price], [ProductCost], [Published], [Deleted]) WHERE [Sku] IS NOT NULL"
+    ),
+    "default": f'CREATE INDEX {PRODUCT_SKU_INDEX} ON "Product" ("Sku")',
+}
+
+
+def has_index(db: Session, table: str, index_name: str) -> bool:
+    """Checks whether an index exists on a table."""
+    return any(index["name"] == index_name for index in inspect(db.get_bind()).get_indexes(table))
+
+def ensure_product_sku_index(db: Session) -> bool:
+    """
+    Creates the index on Product.Sku if it is missing.
+
+    Returns:
+        True if the index exists afterwards. A missing index is only logged, since
+        the job still works (slowly) when the login may not alter the catalog.
+    """
+    if has_index(db, Product.__tablename__, PRODUCT_SKU_INDEX):
+        return True
+    dialect = db.get_bind().dialect.name
+    statement = PRODUCT_SKU_INDEX_SQL.get(dialect, PRODUCT_SKU_INDEX_SQL["default"])
+    try:
+        print(f"MIGRATION: Creating index {PRODUCT_SKU_INDEX} on Product(Sku)...")
+        db.execute(text(statement))
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Index {PRODUCT_SKU_INDEX} is missing and could not be created; "
+                       f"SKU lookups will scan the Product table. Error: {e}")
+        return False
+
+def run_startup_checks(db: Session):
+    """Schema checks run before a price update job touches the catalog."""
+    ensure_product_sku_index(db)
+    ProductPriceHistory.__table__.create(bind=db.get_bind(), checkfirst=True)
+
+if __name__ == "__main__":
+    from app.db.mydb import get_db
+    session = next(get_db())
+    try:
+        run_startup_checks(session)
+    finally:
+        session.close()
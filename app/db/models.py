@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, String, Numeric, DateTime, ForeignKey, func, Text, Boolean
+    Column, Integer, BigInteger, String, Numeric, DateTime, ForeignKey, func, Text, Boolean, Index
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import declarative_base
@@ -8,6 +8,8 @@ Base = declarative_base()
 
 class Product(Base):
     __tablename__ = "Product"
+    # Created by app/db/migrations.py on existing catalogs
+    __table_args__ = (Index("IX_Product_Sku", "Sku"),)
 
     # Id = Column(Integer, primary_key=True, autoincrement=True)
     # Sku = Column(String(100), nullable=True)     # SKU ngoài web crawl
@@ -26,6 +28,7 @@ class Product(Base):
     Sku = Column(String(400), nullable=True)
     Price = Column(Numeric(18, 4), nullable=False, default=0)
     OldPrice = Column(Numeric(18, 4), nullable=False, default=0)
+    ProductCost = Column(Numeric(18, 4), nullable=False, default=0)
     Published = Column(Boolean, nullable=False, default=True)
     Deleted = Column(Boolean, nullable=False, default=False)
     CreatedOnUtc = Column(DateTime, server_default=func.now())
@@ -35,3 +38,22 @@ class Product(Base):
         return f"<Product(Id={self.Id}, Name='{self.ProductName}')>"
 
 
+class ProductPriceHistory(Base):
+    """Every scraped offer, append-only, for price trend queries."""
+    __tablename__ = "ProductPriceHistory"
+    __table_args__ = (
+        Index("IX_ProductPriceHistory_Sku_ScrapedOnUtc", "Sku", "ScrapedOnUtc"),
+        Index("IX_ProductPriceHistory_Retailer_ScrapedOnUtc", "Retailer", "ScrapedOnUtc"),
+    )
+
+    Id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    Sku = Column(String(400), nullable=False)
+    Retailer = Column(String(200), nullable=True)
+    Price = Column(Numeric(18, 4), nullable=False)
+    OldPrice = Column(Numeric(18, 4), nullable=True)
+    StockStatus = Column(String(100), nullable=True)
+    Url = Column(String(2000), nullable=True)
+    ScrapedOnUtc = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f"<ProductPriceHistory(Sku='{self.Sku}', Retailer='{self.Retailer}', Price={self.Price})>"
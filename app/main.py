@@ -1,18 +1,17 @@
 import os
+import sys
 import json
 import re
 import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
 from typing import Optional, Dict, Any, List
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from browser_use import Browser, Agent, BrowserConfig
-from browser_use.llm import ChatOpenAI
-from browser_use import BrowserSession, Controller, ActionResult
-from app.service.scraping import scraping_products, update_price_for_sku
-from app.db.create import get_db
-import uvicorn
+from app.service.streaming import stream_scrape_events, format_sse, format_ndjson
+# The scraping stack (browser_use, playwright, SQLAlchemy) is imported by the
+# endpoints that use it, so the app and its health check start quickly.
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -23,12 +22,107 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    """ Liveness probe; does not touch the browser or the databases.
+    """
+    return {"status": "ok"}
+
+@app.get("/health/db")
+async def health_db() -> Dict[str, Any]:
+    """ Connection pool metrics of the database engines created so far.
+    """
+    from app.db.engine import pool_metrics
+
+    return {"status": "ok", "pools": pool_metrics()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """ Stage latencies, token, page, cache and error counters in the Prometheus text format.
+    """
+    from app.service.metrics import render_metrics
+
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/scrape-products", response_model=Dict[str, Any])
 async def scrape_products(input_data: Dict[str, Any]) -> Dict[str, Any]:
     """ Scrape product data and return structured JSON.
     """
-    products = await scraping_products(db=get_db(), input_data=input_data)
+    from app.service.scraping import scrape_product_data
+
+    products = await scrape_product_data(
+        searchQuery=input_data.get("searchQuery"),
+        limit=int(input_data.get("limit", 4))
+    )
     return {"status": "success", "data": products}
 
+@app.post("/scrape-products/stream")
+async def scrape_products_stream(input_data: Dict[str, Any], format: str = "sse") -> StreamingResponse:
+    """ Scrape product data and stream progress events, each verified offer
+    as soon as it is extracted, and a final summary.
+
+    Use `?format=ndjson` for newline-delimited JSON instead of Server-Sent Events.
+    """
+    formatter = format_ndjson if format == "ndjson" else format_sse
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+
+    async def body():
+        async for event in stream_scrape_events(
+            input_data.get("searchQuery"),
+            limit=int(input_data.get("limit", 4))
+        ):
+            yield formatter(event)
+
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+
+    
+@app.post("/scrape-products/batch")
+async def scrape_products_batch(input_data: Dict[str, Any], stream: Optional[str] = None):
+    """ Look up many SKUs in one request.
+
+    Body: {"skus": [...], "limit": 4}. Duplicate SKUs are merged, recently
+    scraped SKUs are served from the run ledger, and the rest share the
+    server's browser pool. Use `?stream=ndjson` or `?stream=sse` to receive
+    each SKU's result as soon as it is ready.
+    """
+    from app.service.batch import BATCH_MAX_SKUS, dedupe_skus, iter_batch_results, run_batch_lookup
+
+    skus = input_data.get("skus") or []
+    limit = int(input_data.get("limit", 4))
+    if not isinstance(skus, list) or not skus:
+        raise HTTPException(status_code=422, detail="'skus' must be a non-empty list.")
+    if len(dedupe_skus(skus)) > BATCH_MAX_SKUS:
+        raise HTTPException(status_code=413, detail=f"A batch accepts at most {BATCH_MAX_SKUS} SKUs.")
+
+    if stream in ("ndjson", "sse"):
+        formatter = format_ndjson if stream == "ndjson" else format_sse
+
+        async def body():
+            async for result in iter_batch_results(skus, limit=limit):
+                yield formatter({"event": "result", **result})
+            yield formatter({"event": "summary", "count": len(skus)})
+
+        media_type = "application/x-ndjson" if stream == "ndjson" else "text/event-stream"
+        return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    results = await run_batch_lookup(skus, limit=limit)
+    return {"status": "success", "data": results}
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Only a batch request starts the shared browser pool
+    batch = sys.modules.get("app.service.batch")
+    if batch is not None:
+        await batch.close_browser_pool()
+    result_sink = sys.modules.get("app.service.result_sink")
+    if result_sink is not None:
+        result_sink.close_result_sink()
+    offer_store = sys.modules.get("app.service.offer_store")
+    if offer_store is not None:
+        offer_store.flush_offer_buffer()
 
-    
\ No newline at end of file
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
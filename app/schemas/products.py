@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+import re
+from pydantic import BaseModel, field_validator
+from typing import Any, Optional
+from datetime import datetime, timezone
 
 class ProductBase(BaseModel):
     ExternalSku: Optional[str] = None
@@ -32,3 +33,43 @@ class ProductOut(ProductBase):
 
 class ProductList(BaseModel):
     products: list[ProductCreate]
+
+
+def parse_scraped_at(value: Any) -> Optional[datetime]:
+    """Parses a scrapedAt or loggedAt value into an aware UTC datetime, or None."""
+    if isinstance(value, datetime):
+        parsed = value
+    elif value:
+        try:
+            parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+class ScrapedProduct(BaseModel):
+    """A single verified offer as returned by the scraping agent."""
+    productName: str
+    sku: Optional[str] = None
+    brand: Optional[str] = None
+    finalPriceVND: Optional[int] = None
+    oldPriceVND: Optional[int] = None
+    stockStatus: Optional[str] = None
+    retailer: Optional[str] = None
+    url: Optional[str] = None
+    category: Optional[str] = None
+    scrapedAt: Optional[str] = None    # Set by scrape_product_data to the server time
+
+    @field_validator("finalPriceVND", "oldPriceVND", mode="before")
+    @classmethod
+    def parse_vnd(cls, value):
+        # The LLM sometimes returns "12.990.000đ" instead of a clean integer
+        if value is None or isinstance(value, (int, float)):
+            return value
+        digits = re.sub(r"[^\d]", "", str(value))
+        return int(digits) if digits else None
+
+class ScrapedProductList(BaseModel):
+    """Structured output model enforced on the scraping agent."""
+    products: list[ScrapedProduct] = []
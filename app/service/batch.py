@@ -0,0 +1,134 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.crud.run_ledger import (
+    start_batch_run, get_recent_results, mark_sku_started, mark_sku_done, mark_sku_failed, finish_run
+)
+from app.crud.sku_index import normalize_sku
+from app.db.local import get_local_db
+
+# Largest number of SKUs accepted by one batch request
+BATCH_MAX_SKUS = int(os.getenv("BATCH_MAX_SKUS", "500"))
+# Browsers (and so concurrent agent/LLM runs) shared by all batch requests of this process
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "3"))
+# Ledger results younger than this are served without scraping
+BATCH_CACHE_MAX_AGE_HOURS = float(os.getenv("BATCH_CACHE_MAX_AGE_HOURS", "24"))
+
+_browser_pool = None
+_browser_pool_lock: Optional[asyncio.Lock] = None
+# SKU -> running scrape, so concurrent batches asking for the same SKU share one agent run
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def dedupe_skus(skus: List[str]) -> List[str]:
+    """Drops empty and duplicate SKUs (compared normalized), keeping the first spelling and the order."""
+    seen = set()
+    unique = []
+    for sku in skus:
+        key = normalize_sku(sku or "")
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(sku.strip())
+    return unique
+
+async def _get_browser_pool():
+    """Starts the shared browser pool on first use."""
+    global _browser_pool, _browser_pool_lock
+    from app.service.workers import BrowserPool
+
+    if _browser_pool_lock is None:
+        _browser_pool_lock = asyncio.Lock()
+    async with _browser_pool_lock:
+        if _browser_pool is None:
+            pool = BrowserPool(BATCH_CONCURRENCY)
+            await pool.start()
+            _browser_pool = pool
+    return _browser_pool
+
+async def close_browser_pool():
+    """Closes the shared browser pool (on application shutdown)."""
+    global _browser_pool
+    if _browser_pool is not None:
+        await _browser_pool.close()
+        _browser_pool = None
+
+async def _scrape_on_pool(sku: str, limit: int) -> List[dict]:
+    from app.service.scraping import scrape_product_data
+
+    pool = await _get_browser_pool()
+    async with pool.acquire() as browser:
+        # Errors are raised, so a failed scrape is recorded as failed and never served from the cache
+        return await scrape_product_data(searchQuery=sku, limit=limit, browser=browser, raise_errors=True) or []
+
+def _shared_scrape(sku: str, limit: int) -> asyncio.Task:
+    key = normalize_sku(sku)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_scrape_on_pool(sku, limit))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task
+
+async def iter_batch_results(skus: List[str], limit: int = 4,
+                             max_age_hours: float = BATCH_CACHE_MAX_AGE_HOURS) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Looks up many SKUs at once and yields one result per unique SKU as soon as
+    it is available: cache hits from recent ledger results with offers first,
+    then scraped SKUs in completion order. Misses share the process-wide
+    browser pool, so the number of concurrent agent runs stays at
+    BATCH_CONCURRENCY however many batches are in flight.
+
+    Yields:
+        Dicts with 'sku', 'status' ('cached', 'scraped' or 'failed') and
+        'products' (or 'error').
+    """
+    skus = dedupe_skus(skus)
+    if len(skus) > BATCH_MAX_SKUS:
+        raise ValueError(f"A batch accepts at most {BATCH_MAX_SKUS} SKUs, got {len(skus)}.")
+
+    db = next(get_local_db())
+    try:
+        cached = get_recent_results(db, skus, max_age_hours=max_age_hours)
+        for sku in skus:
+            if sku in cached:
+                yield {"sku": sku, "status": "cached", "products": cached[sku]}
+
+        misses = [sku for sku in skus if sku not in cached]
+        if not misses:
+            return
+        run = start_batch_run(db)
+
+        async def scrape(sku: str):
+            try:
+                # Shielded: cancelling this batch must not cancel a scrape shared with other batches
+                return sku, await asyncio.shield(_shared_scrape(sku, limit)), None
+            except Exception as e:
+                return sku, None, str(e)
+
+        for sku in misses:
+            mark_sku_started(db, run.id, sku)
+        pending = [asyncio.create_task(scrape(sku)) for sku in misses]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                sku, products, error = await next_done
+                if error is None:
+                    mark_sku_done(db, run.id, sku, products)
+                    yield {"sku": sku, "status": "scraped", "products": products}
+                else:
+                    mark_sku_failed(db, run.id, sku, error)
+                    yield {"sku": sku, "status": "failed", "error": error}
+        finally:
+            # Client went away: stop waiting, the shared scrapes finish for other batches
+            for task in pending:
+                task.cancel()
+            finish_run(db, run.id)
+    finally:
+        db.close()
+
+async def run_batch_lookup(skus: List[str], limit: int = 4) -> Dict[str, Dict[str, Any]]:
+    """Collects iter_batch_results into a dictionary keyed by SKU."""
+    results = {}
+    async for result in iter_batch_results(skus, limit=limit):
+        results[result.pop("sku")] = result
+    return results
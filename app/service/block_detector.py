@@ -0,0 +1,142 @@
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Mapping, Optional
+from urllib.parse import urlparse
+
+from app.crud.block_stats import get_last_blocked, record_navigation
+from app.db.local import get_local_db
+
+logger = logging.getLogger(__name__)
+
+# After a block, navigations to the same domain are skipped for this long
+BLOCK_COOLDOWN_SECONDS = float(os.getenv("BLOCK_COOLDOWN_SECONDS", "900"))
+# CAPTCHA interstitials are small pages; a reCAPTCHA widget on a large page is a form, not a block
+CHALLENGE_PAGE_MAX_BYTES = int(os.getenv("CHALLENGE_PAGE_MAX_BYTES", "50000"))
+
+_UNUSUAL_TRAFFIC = re.compile(
+    r"unusual traffic from your computer network|our systems have detected unusual traffic|id=\"captcha-form\"", re.I
+)
+_RECAPTCHA = re.compile(r"www\.google\.com/recaptcha/|recaptcha/(api2|enterprise)/|class=\"g-recaptcha\"", re.I)
+_CLOUDFLARE = re.compile(
+    r"cf-browser-verification|/cdn-cgi/challenge-platform/|cf_chl_opt|cf-chl-|<title>just a moment\.\.\.</title>"
+    r"|attention required! \| cloudflare",
+    re.I,
+)
+
+
+class BlockedError(Exception):
+    """A navigation landed on a CAPTCHA, challenge or rate-limit page."""
+
+    def __init__(self, domain: str, reason: str):
+        super().__init__(f"Blocked on {domain} ({reason}); use another retailer or the fallback path.")
+        self.domain = domain
+        self.reason = reason
+
+
+class BlockStats:
+    """In-process navigation and block counters, by reason."""
+
+    def __init__(self):
+        self.navigations = 0
+        self.blocks: Dict[str, int] = {}
+
+    def as_dict(self) -> Dict:
+        blocked = sum(self.blocks.values())
+        return {
+            "navigations": self.navigations,
+            "blocks": blocked,
+            "block_rate": round(blocked / self.navigations, 4) if self.navigations else 0.0,
+            "by_reason": dict(self.blocks),
+        }
+
+block_stats = BlockStats()
+
+
+def domain_of(url: str) -> str:
+    """The host of a URL (or a bare host name), without 'www.'."""
+    domain = (urlparse(url).netloc if "://" in url else url).lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+def detect_block(status: Optional[int], url: str, html: Optional[str] = None,
+                 frame_urls: Iterable[str] = (), headers: Optional[Mapping[str, str]] = None) -> Optional[str]:
+    """
+    Classifies a loaded page as a block, without asking the LLM.
+
+    Returns:
+        'unusual_traffic', 'recaptcha', 'cloudflare', 'http_429', 'http_403'
+        or None if the page looks like real content.
+    """
+    html = html or ""
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    if "/sorry/" in urlparse(url).path or _UNUSUAL_TRAFFIC.search(html):
+        return "unusual_traffic"
+    if headers.get("cf-mitigated") == "challenge" or _CLOUDFLARE.search(html):
+        return "cloudflare"
+    small_page = len(html) < CHALLENGE_PAGE_MAX_BYTES
+    if any("recaptcha" in frame_url and "bframe" in frame_url for frame_url in frame_urls) and small_page:
+        return "recaptcha"
+    if _RECAPTCHA.search(html) and (small_page or status in (403, 429)):
+        return "recaptcha"
+    if status == 429:
+        return "http_429"
+    if status == 403:
+        return "http_403"
+    return None
+
+def _record(url: str, reason: Optional[str]):
+    domain = domain_of(url)
+    block_stats.navigations += 1
+    if reason:
+        block_stats.blocks[reason] = block_stats.blocks.get(reason, 0) + 1
+        logger.warning(f"Block detected on {domain}: {reason}")
+    db = next(get_local_db())
+    try:
+        record_navigation(db, domain, reason)
+    finally:
+        db.close()
+
+async def check_navigation(page, response=None, url: Optional[str] = None) -> Optional[str]:
+    """
+    Runs the detector on the page after a navigation (page.goto) and records
+    the outcome for the domain that was requested.
+
+    Args:
+        page: The Playwright page object.
+        response: The Response returned by page.goto, if any.
+        url (str): The requested URL; defaults to the page URL.
+
+    Returns:
+        The block reason, or None.
+    """
+    try:
+        html = await page.content()
+    except Exception:
+        html = ""
+    frame_urls = [frame.url for frame in getattr(page, "frames", [])]
+    reason = detect_block(
+        response.status if response is not None else None,
+        page.url or url or "",
+        html,
+        frame_urls,
+        response.headers if response is not None else None,
+    )
+    _record(url or page.url, reason)
+    return reason
+
+def check_response(url: str, status: int, html: str, headers: Optional[Mapping[str, str]] = None) -> Optional[str]:
+    """Same as check_navigation, for a response fetched through page.request."""
+    reason = detect_block(status, url, html, headers=headers)
+    _record(url, reason)
+    return reason
+
+def is_cooling_down(url_or_domain: str) -> bool:
+    """True while a domain blocked us less than BLOCK_COOLDOWN_SECONDS ago (in any worker)."""
+    domain = domain_of(url_or_domain)
+    db = next(get_local_db())
+    try:
+        last_blocked = get_last_blocked(db, domain)
+    finally:
+        db.close()
+    return last_blocked is not None and datetime.utcnow() - last_blocked < timedelta(seconds=BLOCK_COOLDOWN_SECONDS)
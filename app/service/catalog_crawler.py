@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import re
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urljoin, urlparse
+from xml.etree.ElementTree import XMLPullParser
+
+import httpx
+from bs4 import BeautifulSoup
+from sqlalchemy.orm import Session
+
+from app.crud.catalog import upsert_catalog_entries, get_sitemap_lastmod, set_sitemap_state
+from app.db.local import get_local_db
+from app.core.retailers import LAPTOP_SERVER_RETAILERS, extract_model_from_title
+
+logger = logging.getLogger(__name__)
+
+# Product-category listing pages per retailer domain. "{page}" is replaced by the page number.
+RETAILER_CATEGORY_URLS = {
+    "fptshop.com.vn": ["https://fptshop.com.vn/may-tinh-xach-tay?page={page}"],
+    "thegioididong.com": ["https://www.thegioididong.com/laptop?page={page}"],
+    "cellphones.com.vn": ["https://cellphones.com.vn/laptop.html?p={page}"],
+    "phongvu.vn": ["https://phongvu.vn/c/laptop?page={page}"],
+    "gearvn.com": ["https://gearvn.com/collections/laptop?page={page}"],
+    "anphatpc.com.vn": [
+        "https://www.anphatpc.com.vn/may-tinh-xach-tay-laptop.html?page={page}",
+        "https://www.anphatpc.com.vn/may-chu-server.html?page={page}",
+    ],
+    "phucanh.vn": [
+        "https://www.phucanh.vn/may-tinh-xach-tay-laptop.html?page={page}",
+        "https://www.phucanh.vn/may-chu-server.html?page={page}",
+    ],
+}
+
+# URL path fragments that never point at a product page
+NON_PRODUCT_PATH_HINTS = ("/tin-tuc", "/blog", "/news", "/tag", "/tim-kiem", "/search", "/huong-dan", "/khuyen-mai")
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+CATALOG_BATCH_SIZE = 500
+CATEGORY_MAX_PAGES = 5
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    )
+}
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """Parses a sitemap <lastmod> value into a naive UTC datetime."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def extract_catalog_tokens(text: str) -> List[str]:
+    """
+    Extracts SKU-like tokens (letters and digits mixed, at least 5 chars) and
+    the model found by `extract_model_from_title` from a title or URL slug.
+    """
+    tokens = [t for t in re.split(r"[^A-Za-z0-9]+", text) if len(t) >= 5 and re.search(r"\d", t) and re.search(r"[A-Za-z]", t)]
+    model = extract_model_from_title(text)
+    if model:
+        tokens.append(model)
+    return tokens
+
+def build_catalog_entry(url: str, domain: str, source: str, title: Optional[str] = None, lastmod: Optional[datetime] = None) -> Optional[Dict]:
+    """Builds a catalog entry for a URL, or None if it does not look like a product."""
+    path = urlparse(url).path.lower()
+    if not path or path == "/" or any(hint in path for hint in NON_PRODUCT_PATH_HINTS):
+        return None
+    slug_text = re.sub(r"[-_/.]+", " ", path.rsplit("/", 1)[-1].replace(".html", ""))
+    text = f"{title or ''} {slug_text}"
+    tokens = extract_catalog_tokens(text)
+    if not tokens:
+        return None
+    return {
+        "url": url,
+        "domain": domain,
+        "retailer": LAPTOP_SERVER_RETAILERS.get(domain),
+        "title": title,
+        "model": extract_model_from_title(text) or None,
+        "source": source,
+        "lastmod": lastmod,
+        "tokens": tokens,
+    }
+
+async def stream_sitemap(client: httpx.AsyncClient, sitemap_url: str) -> AsyncIterator[Dict]:
+    """
+    Streams a sitemap and yields its entries as they are parsed, without
+    loading the whole document. Yields dicts with 'kind' ('sitemap' for
+    sitemap-index children, 'url' for pages), 'loc' and 'lastmod'.
+    """
+    parser = XMLPullParser(events=("end",))
+    gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS) if sitemap_url.endswith(".gz") else None
+
+    async with client.stream("GET", sitemap_url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            parser.feed(gunzip.decompress(chunk) if gunzip else chunk)
+            for _, element in parser.read_events():
+                tag = element.tag.replace(SITEMAP_NS, "")
+                if tag in ("url", "sitemap"):
+                    yield {
+                        "kind": "url" if tag == "url" else "sitemap",
+                        "loc": (element.findtext(f"{SITEMAP_NS}loc") or element.findtext("loc") or "").strip(),
+                        "lastmod": parse_lastmod(element.findtext(f"{SITEMAP_NS}lastmod") or element.findtext("lastmod")),
+                    }
+                    element.clear()
+
+async def discover_sitemaps(client: httpx.AsyncClient, domain: str) -> List[str]:
+    """Finds a domain's sitemaps from robots.txt, falling back to /sitemap.xml."""
+    base = f"https://{domain}"
+    try:
+        response = await client.get(f"{base}/robots.txt")
+        if response.status_code == 200:
+            sitemaps = [
+                line.split(":", 1)[1].strip()
+                for line in response.text.splitlines()
+                if line.lower().startswith("sitemap:")
+            ]
+            if sitemaps:
+                return sitemaps
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not read robots.txt for {domain}: {e}")
+    return [f"{base}/sitemap.xml"]
+
+async def crawl_sitemap(client: httpx.AsyncClient, db: Session, sitemap_url: str, domain: str,
+                        lastmod: Optional[datetime] = None, full_refresh: bool = False) -> int:
+    """
+    Crawls one sitemap (recursing into sitemap indexes) into the URL catalog.
+    Sitemaps whose lastmod has not changed since the previous crawl are skipped.
+
+    Returns:
+        The number of catalog entries written.
+    """
+    previous = get_sitemap_lastmod(db, sitemap_url)
+    if not full_refresh and lastmod and previous and lastmod <= previous:
+        logger.info(f"Sitemap unchanged since last crawl, skipping: {sitemap_url}")
+        return 0
+
+    written = 0
+    batch = []
+    newest = lastmod
+    try:
+        async for item in stream_sitemap(client, sitemap_url):
+            if not item["loc"]:
+                continue
+            if item["kind"] == "sitemap":
+                written += await crawl_sitemap(client, db, item["loc"], domain, item["lastmod"], full_refresh)
+                continue
+            if newest is None or (item["lastmod"] and item["lastmod"] > newest):
+                newest = item["lastmod"]
+            # Incremental refresh: only pages modified since the previous crawl
+            if not full_refresh and previous and item["lastmod"] and item["lastmod"] <= previous:
+                continue
+            entry = build_catalog_entry(item["loc"], domain, "sitemap", lastmod=item["lastmod"])
+            if entry:
+                batch.append(entry)
+            if len(batch) >= CATALOG_BATCH_SIZE:
+                written += upsert_catalog_entries(db, batch)
+                batch = []
+        written += upsert_catalog_entries(db, batch)
+        set_sitemap_state(db, sitemap_url, domain, newest)
+    except (httpx.HTTPError, SyntaxError) as e:
+        logger.error(f"Error crawling sitemap {sitemap_url}: {e}")
+        written += upsert_catalog_entries(db, batch)
+    return written
+
+async def crawl_category_listings(client: httpx.AsyncClient, db: Session, domain: str, max_pages: int = CATEGORY_MAX_PAGES) -> int:
+    """Crawls a retailer's product-category listings into the URL catalog."""
+    written = 0
+    for template in RETAILER_CATEGORY_URLS.get(domain, []):
+        seen_urls = set()
+        for page_number in range(1, max_pages + 1):
+            listing_url = template.format(page=page_number)
+            try:
+                response = await client.get(listing_url)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error(f"Error fetching category listing {listing_url}: {e}")
+                break
+
+            soup = BeautifulSoup(response.text, "html.parser")
+            batch = []
+            for link in soup.select("a[href]"):
+                url = urljoin(listing_url, link["href"]).split("#", 1)[0]
+                if url in seen_urls or urlparse(url).netloc.lower().removeprefix("www.") != domain:
+                    continue
+                seen_urls.add(url)
+                title = link.get("title") or link.get_text(" ", strip=True)
+                entry = build_catalog_entry(url, domain, "category", title=title)
+                if entry:
+                    batch.append(entry)
+            if not batch:
+                # Past the last page of the listing
+                break
+            written += upsert_catalog_entries(db, batch)
+    return written
+
+async def crawl_retailer_catalogs(domains: Optional[List[str]] = None, full_refresh: bool = False,
+                                  include_categories: bool = True) -> Dict[str, int]:
+    """
+    Ingests sitemaps and category listings for the retailer domains into the
+    local URL catalog, so SKU matching becomes a local lookup.
+
+    Args:
+        domains: The domains to crawl. Defaults to all of LAPTOP_SERVER_RETAILERS.
+        full_refresh (bool): Ignore stored lastmod values and re-ingest everything.
+        include_categories (bool): Also crawl RETAILER_CATEGORY_URLS listings.
+
+    Returns:
+        A dictionary of catalog entries written per domain.
+    """
+    domains = domains or list(LAPTOP_SERVER_RETAILERS.keys())
+    db: Session = next(get_local_db())
+    results = {}
+    try:
+        async with httpx.AsyncClient(headers=HTTP_HEADERS, timeout=30, follow_redirects=True) as client:
+            for domain in domains:
+                logger.info(f"Crawling catalog for {domain}...")
+                written = 0
+                for sitemap_url in await discover_sitemaps(client, domain):
+                    written += await crawl_sitemap(client, db, sitemap_url, domain, full_refresh=full_refresh)
+                if include_categories:
+                    written += await crawl_category_listings(client, db, domain)
+                results[domain] = written
+                print(f"CATALOG: {domain}: {written} product URLs written.")
+    finally:
+        db.close()
+    return results
+
+if __name__ == "__main__":
+    asyncio.run(crawl_retailer_catalogs())
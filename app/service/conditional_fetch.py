@@ -0,0 +1,125 @@
+import hashlib
+import logging
+from typing import Callable, Dict
+
+from app.crud.page_validators import get_page_validator, save_page_validator
+from app.db.local import get_local_db
+from app.service.block_detector import BlockedError, check_navigation, check_response, domain_of, is_cooling_down
+
+logger = logging.getLogger(__name__)
+
+
+class FetchStats:
+    """Hit-rate counters for conditional product page fetches."""
+
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0        # HTTP 304, nothing downloaded or parsed
+        self.fragment_unchanged = 0  # page changed, but the price fragment did not
+        self.changed = 0
+        self.rendered_fallbacks = 0  # price not in raw HTML, full page render needed
+
+    def hit_rate(self) -> float:
+        """Share of fetches that skipped price parsing and DB writes."""
+        if not self.requests:
+            return 0.0
+        return (self.not_modified + self.fragment_unchanged) / self.requests
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "fragment_unchanged": self.fragment_unchanged,
+            "changed": self.changed,
+            "rendered_fallbacks": self.rendered_fallbacks,
+            "hit_rate": round(self.hit_rate(), 4),
+        }
+
+fetch_stats = FetchStats()
+
+
+def hash_fragment(fragment: str) -> str:
+    """SHA-256 of the whitespace-normalized price fragment."""
+    return hashlib.sha256(" ".join(fragment.split()).encode("utf-8")).hexdigest()
+
+async def fetch_price_fragment(page, url: str, selector: str, parse: Callable[[str], float]) -> Dict:
+    """
+    Fetches the price fragment of a product page, reusing stored validators.
+
+    A conditional GET (If-None-Match / If-Modified-Since) is issued through the
+    page's request context, which shares cookies with the browser. On a 304, or
+    when the hash of the price fragment is unchanged, the previous price is
+    returned and `parse` is not called. If the price is not in the raw HTML
+    (rendered by JavaScript), the page is navigated and rendered instead, and
+    no validators are kept for it: a 304 for the unchanged HTML shell would
+    otherwise hide a changed price.
+
+    Args:
+        page: The Playwright page object.
+        url (str): The product page URL.
+        selector (str): CSS selector of the price element.
+        parse: Turns the fragment text into a price.
+
+    Returns:
+        A dict with 'status' ('not_modified', 'unchanged' or 'changed') and 'price'.
+
+    Raises:
+        BlockedError: The retailer answered with a CAPTCHA, challenge or 403/429,
+            or blocked us recently.
+    """
+    from bs4 import BeautifulSoup
+
+    if is_cooling_down(url):
+        raise BlockedError(domain_of(url), "cooldown")
+    fetch_stats.requests += 1
+    db = next(get_local_db())
+    try:
+        validator = get_page_validator(db, url)
+        headers = {}
+        # Only revalidate when the previous fetch actually produced a price
+        if validator and validator.last_price is not None:
+            if validator.etag:
+                headers["If-None-Match"] = validator.etag
+            if validator.last_modified:
+                headers["If-Modified-Since"] = validator.last_modified
+
+        response = await page.request.get(url, headers=headers, timeout=30000)
+        if response.status == 304 and validator:
+            fetch_stats.not_modified += 1
+            save_page_validator(db, url, None, None, None, None, changed=False)
+            logger.info(f"Not modified since last fetch: {url}")
+            return {"status": "not_modified", "price": validator.last_price}
+
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        body = await response.text()
+        reason = check_response(url, response.status, body, response.headers)
+        if reason:
+            raise BlockedError(domain_of(url), reason)
+        price_tag = BeautifulSoup(body, "html.parser").select_one(selector)
+
+        rendered = price_tag is None
+        if rendered:
+            fetch_stats.rendered_fallbacks += 1
+            navigation = await page.goto(url)
+            reason = await check_navigation(page, navigation, url)
+            if reason:
+                raise BlockedError(domain_of(url), reason)
+            await page.wait_for_selector(selector, timeout=10000)
+            price_tag = BeautifulSoup(await page.content(), "html.parser").select_one(selector)
+            if price_tag is None:
+                raise ValueError(f"Price element '{selector}' not found on {url}")
+
+        fragment_hash = hash_fragment(price_tag.get_text(" ", strip=True))
+        if validator and validator.fragment_hash == fragment_hash and validator.last_price is not None:
+            fetch_stats.fragment_unchanged += 1
+            save_page_validator(db, url, etag, last_modified, None, None, changed=False, render_only=rendered)
+            logger.info(f"Price fragment unchanged since last fetch: {url}")
+            return {"status": "unchanged", "price": validator.last_price}
+
+        fetch_stats.changed += 1
+        price = parse(price_tag.get_text(strip=True))
+        save_page_validator(db, url, etag, last_modified, fragment_hash, price, changed=True, render_only=rendered)
+        return {"status": "changed", "price": price}
+    finally:
+        db.close()
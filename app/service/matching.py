@@ -0,0 +1,273 @@
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.crud.sku_index import normalize_sku
+from app.service.scraping import extract_brand_from_title, extract_model_from_title
+
+# Offline analysis: cluster_offers groups exported offers (e.g. read_offers().to_pylist())
+# into canonical products. The price jobs map offers to catalog SKUs with SkuAliasMap.
+
+# Offers scoring at least this much are the same canonical product
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.72"))
+# Blocks larger than this are compared with a sliding window instead of all pairs,
+# which keeps clustering near-linear when thousands of offers share a key
+MATCH_MAX_BLOCK_SIZE = int(os.getenv("MATCH_MAX_BLOCK_SIZE", "50"))
+MATCH_WINDOW = int(os.getenv("MATCH_WINDOW", "10"))
+
+# Product lines found by extract_brand_from_title, mapped to their maker
+PARENT_BRANDS = {
+    "Alienware": "Dell", "Inspiron": "Dell", "Latitude": "Dell", "Precision": "Dell", "Vostro": "Dell", "XPS": "Dell",
+    "ThinkPad": "Lenovo", "IdeaPad": "Lenovo", "Legion": "Lenovo", "Yoga": "Lenovo", "ThinkBook": "Lenovo",
+    "EliteBook": "HP", "ProBook": "HP", "Pavilion": "HP", "Envy": "HP", "Spectre": "HP", "Omen": "HP",
+    "ROG": "Asus", "Predator": "Acer", "MacBook": "Apple", "Mac": "Apple", "iMac": "Apple",
+}
+
+# Words that say what kind of listing it is rather than which product
+_NOISE_WORDS = {
+    "laptop", "máy", "trạm", "tính", "workstation", "pc", "may", "tram", "chính", "hãng", "new", "mới",
+    "ram", "ssd", "hdd", "win", "win11", "windows", "office", "fhd", "inch", "no", "os", "noos", "and", "with",
+}
+
+_CPU_PATTERNS = [
+    re.compile(r"\b(i[3579])\s*-?\s*(\d{4,5}[a-z]{0,2})\b"),
+    re.compile(r"\bultra\s*([579])\s*-?\s*(\d{3}[a-z]{0,2})\b"),
+    re.compile(r"\bryzen\s*([3579])\s*-?\s*(\d{4}[a-z]{0,2})\b"),
+    re.compile(r"\bxeon\s*(?:w|e|silver|gold|bronze|platinum)?\s*-?\s*(\d{4}[a-z]?)\b"),
+]
+_CAPACITY = re.compile(r"\b(\d{1,4})\s*(gb|tb)\b(\s*(?:ssd|hdd|nvme|pcie))?")
+# A size is a screen when followed by an inch mark or by a panel/resolution word ("15.6 FHD")
+_SCREEN = re.compile(
+    r"\b(1[0-9](?:[.,]\d)?)\s*(?:\"|''|”|inch\b|in\b"
+    r"|(?=(?:fhd|qhd|uhd|hd|oled|ips|wuxga|wqxga|[234](?:[.,]\d)?k)\b))"
+)
+_RAM_SIZES = {4, 8, 12, 16, 24, 32, 48, 64, 96, 128}
+_NON_ALNUM = re.compile(r"[^0-9A-Z]+")
+_CODE = re.compile(r"(?=[A-Z]*\d)(?=\d*[A-Z])[0-9A-Z]+")
+# Letter/digit tokens that name a spec shared by many products, not a model
+_SPEC_CODE = re.compile(
+    r"(WIN|WINDOWS|OFFICE|DDR|LPDDR|GDDR|PCIE|NVME|GEN|USB|WIFI|RTX|GTX|RX|MX|HDMI|FHD|QHD|UHD|OLED|IPS)\d.*"
+    r"|\d+(GB|TB|HZ|MHZ|GHZ|W|WH|MAH|MP|INCH|K)"
+)
+
+
+def spec_fingerprint(title: str) -> Dict[str, str]:
+    """
+    Extracts comparable specs from a product title: cpu ('i5-1334u'), ram
+    ('8gb'), storage ('512gb') and screen ('15.6'). Missing specs are omitted.
+    """
+    text = title.lower()
+    specs = {}
+    for pattern in _CPU_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            specs["cpu"] = "-".join(match.groups())
+            break
+    for amount, unit, storage_suffix in _CAPACITY.findall(text):
+        size_gb = int(amount) * (1024 if unit == "tb" else 1)
+        # The first small capacity is the RAM, the first large one the drive
+        if "ram" not in specs and not storage_suffix and size_gb in _RAM_SIZES:
+            specs["ram"] = f"{size_gb}gb"
+        elif "storage" not in specs and size_gb >= 128:
+            specs["storage"] = f"{amount}{unit}"
+    match = _SCREEN.search(text)
+    if match:
+        specs["screen"] = match.group(1).replace(",", ".")
+    return specs
+
+def model_codes(title: str, sku: Optional[str] = None) -> Set[str]:
+    """
+    Returns the normalized manufacturer codes in a title ('N5I5101W1', '30GS00G7VA'):
+    tokens mixing letters and digits, at least 5 characters long, that are not
+    capacities or CPU names. The offer's own 'sku' is included when it looks like one.
+    """
+    text = title.lower()
+    for pattern in _CPU_PATTERNS:
+        text = pattern.sub(" ", text)
+    candidates = set(_NON_ALNUM.split(text.upper()))
+    candidates.update((normalize_sku(extract_model_from_title(title)), normalize_sku(sku or "")))
+    return {
+        code for code in candidates
+        if len(code) >= 5 and _CODE.fullmatch(code) and not _SPEC_CODE.fullmatch(code)
+    }
+
+def title_tokens(title: str) -> Set[str]:
+    """Lower-cased words of a title, without listing noise words."""
+    return {t for t in re.split(r"[^\w.]+", title.lower()) if t and t not in _NOISE_WORDS}
+
+def canonical_brand(title: str) -> Optional[str]:
+    brand = extract_brand_from_title(title)
+    if brand == "Unknown":
+        return None
+    return PARENT_BRANDS.get(brand, brand)
+
+
+class OfferFeatures:
+    """The matching features of one offer, computed once."""
+
+    __slots__ = ("brand", "codes", "specs", "tokens", "sort_key")
+
+    def __init__(self, offer: Dict[str, Any]):
+        title = offer.get("productName") or ""
+        self.brand = canonical_brand(title)
+        self.codes = model_codes(title, offer.get("sku"))
+        self.specs = spec_fingerprint(title)
+        self.tokens = title_tokens(title)
+        self.sort_key = " ".join(sorted(self.tokens))
+
+    def blocking_keys(self) -> List[str]:
+        """Keys under which candidate matches are looked up."""
+        keys = [f"code:{code}" for code in self.codes]
+        if self.tokens:
+            # Catches listings without a code that carry the same name
+            keys.append(f"name:{self.brand}|{self.sort_key}")
+        if self.brand and "cpu" in self.specs:
+            keys.append("spec:" + "|".join([self.brand, self.specs["cpu"], self.specs.get("ram", ""),
+                                            self.specs.get("storage", "")]))
+        return keys
+
+
+def match_score(a: OfferFeatures, b: OfferFeatures) -> float:
+    """
+    Scores how likely two offers are the same product, between 0 and 1.
+
+    Different makers, CPUs or manufacturer codes never match. A shared code
+    is near-certain; otherwise the score blends title word overlap with the
+    share of specs that agree. Each RAM or storage mismatch costs 0.3.
+    """
+    if a.brand and b.brand and a.brand != b.brand:
+        return 0.0
+    if "cpu" in a.specs and "cpu" in b.specs and a.specs["cpu"] != b.specs["cpu"]:
+        return 0.0
+    if a.codes and b.codes and not a.codes & b.codes:
+        return 0.0
+
+    union = a.tokens | b.tokens
+    similarity = len(a.tokens & b.tokens) / len(union) if union else 0.0
+    shared_specs = [key for key in a.specs if key in b.specs]
+    agreeing = sum(1 for key in shared_specs if a.specs[key] == b.specs[key])
+    spec_agreement = agreeing / len(shared_specs) if shared_specs else 0.5
+    score = 0.6 * similarity + 0.4 * spec_agreement
+    if a.codes & b.codes:
+        score = max(score, 0.95)
+    for key in ("ram", "storage"):
+        if key in a.specs and key in b.specs and a.specs[key] != b.specs[key]:
+            score -= 0.3
+    return max(score, 0.0)
+
+
+class DisjointSet:
+    """Union-find over offer indices, with path halving and union by size."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+
+
+def _candidate_pairs(blocks: Dict[str, List[int]], features: List[OfferFeatures]) -> Iterable[Tuple[int, int]]:
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) <= MATCH_MAX_BLOCK_SIZE:
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    yield members[x], members[y]
+        else:
+            # Sorted neighbourhood: only offers with similar titles are compared
+            ordered = sorted(members, key=lambda i: features[i].sort_key)
+            for x in range(len(ordered)):
+                for y in range(x + 1, min(x + 1 + MATCH_WINDOW, len(ordered))):
+                    yield ordered[x], ordered[y]
+
+def match_offers(offers: List[Dict[str, Any]], threshold: float = MATCH_THRESHOLD) -> List[int]:
+    """
+    Assigns each offer the index of its cluster's representative.
+
+    Offers are only compared when they share a blocking key (a model code or
+    a brand+specs fingerprint), so the work grows with the number of offers,
+    not with its square.
+    """
+    return _cluster_labels([OfferFeatures(offer) for offer in offers], threshold)
+
+def _cluster_labels(features: List[OfferFeatures], threshold: float) -> List[int]:
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for i, feature in enumerate(features):
+        for key in feature.blocking_keys():
+            blocks[key].append(i)
+
+    clusters = DisjointSet(len(features))
+    compared = set()
+    for i, j in _candidate_pairs(blocks, features):
+        if (i, j) in compared or clusters.find(i) == clusters.find(j):
+            continue
+        compared.add((i, j))
+        if match_score(features[i], features[j]) >= threshold:
+            clusters.union(i, j)
+    return [clusters.find(i) for i in range(len(features))]
+
+def cluster_offers(offers: Iterable[Dict[str, Any]], threshold: float = MATCH_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Groups offers of the same product across retailers.
+
+    Returns:
+        One dict per canonical product, largest first, with 'canonicalId',
+        'brand', 'model', 'productName', 'specs', 'retailers', 'minPriceVND'
+        and its 'offers'.
+    """
+    offers = [offer for offer in offers if offer.get("productName")]
+    features = [OfferFeatures(offer) for offer in offers]
+    grouped: Dict[int, List[int]] = defaultdict(list)
+    for i, label in enumerate(_cluster_labels(features, threshold)):
+        grouped[label].append(i)
+
+    products = []
+    for indices in grouped.values():
+        members = [offers[i] for i in indices]
+        member_features = [features[i] for i in indices]
+        code_counts = Counter(code for feature in member_features for code in feature.codes)
+        brand_counts = Counter(feature.brand for feature in member_features if feature.brand)
+        model = code_counts.most_common(1)[0][0] if code_counts else ""
+        brand = brand_counts.most_common(1)[0][0] if brand_counts else None
+        specs = {}
+        for feature in member_features:
+            for key, value in feature.specs.items():
+                specs.setdefault(key, value)
+        prices = [o["finalPriceVND"] for o in members if isinstance(o.get("finalPriceVND"), (int, float))]
+        products.append({
+            "canonicalId": f"{(brand or 'unknown').lower()}:{model or normalize_sku(members[0]['productName'])[:40]}",
+            "brand": brand,
+            "model": model,
+            # The shortest title is usually the one without retailer decoration
+            "productName": min((o["productName"] for o in members), key=len),
+            "specs": specs,
+            "retailers": sorted({o.get("retailer") for o in members if o.get("retailer")}),
+            "minPriceVND": min(prices) if prices else None,
+            "offers": members,
+        })
+    products.sort(key=lambda p: len(p["offers"]), reverse=True)
+    return products
+
+if __name__ == "__main__":
+    import sys
+    from app.service.result_sink import RESULTS_DIR
+    from app.service.scraping import load_products_from_json
+
+    for product in cluster_offers(load_products_from_json(sys.argv[1] if len(sys.argv) > 1 else RESULTS_DIR)):
+        print(f"{product['canonicalId']}: {len(product['offers'])} offers from {len(product['retailers'])} retailers, "
+              f"min {product['minPriceVND']} - {product['productName']}")
@@ -0,0 +1,250 @@
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# In-process metrics in the Prometheus text format, served by GET /metrics.
+# Kept dependency-free: the counters are read by one scrape endpoint per process.
+# Shard worker processes (app/service/workers.py) hand their metrics back with
+# their results, see metrics_snapshot(). Queue workers running in other processes
+# or hosts are not included; the counters of other modules (block and conditional
+# fetch stats) always cover the serving process only.
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers a cache lookup up to a full agent run
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: Dict[LabelValues, float]):
+        """Adds the values of a snapshot taken in another process."""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Observation counts in cumulative buckets, with their sum, per label set."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}   # bucket counts..., +Inf count, sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[LabelValues, List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def merge(self, series_by_key: Dict[LabelValues, List[float]]):
+        """Adds the series of a snapshot taken in another process (with the same buckets)."""
+        with self._lock:
+            for key, other in series_by_key.items():
+                series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+                for i, value in enumerate(other):
+                    series[i] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+stage_seconds = Histogram("scraper_stage_seconds", "Duration of scrape stages.", ("stage",))
+action_seconds = Histogram("scraper_action_seconds", "Duration of agent controller actions.", ("action",))
+agent_step_seconds = Histogram("scraper_agent_step_seconds", "Duration of agent steps (LLM call plus actions).")
+errors_total = Counter("scraper_errors_total", "Errors by stage.", ("stage",))
+scrapes_total = Counter("scraper_scrapes_total", "scrape_product_data runs by outcome.", ("status",))
+offers_total = Counter("scraper_offers_total", "Offers returned by scrape_product_data.")
+llm_tokens_total = Counter("scraper_llm_tokens_total", "LLM tokens used by the agent.", ("kind",))
+cache_requests_total = Counter("scraper_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+
+_metrics = [stage_seconds, action_seconds, agent_step_seconds, errors_total, scrapes_total, offers_total,
+            llm_tokens_total, cache_requests_total]
+
+
+def metrics_snapshot() -> Dict[str, Dict]:
+    """The values of all metrics above, picklable, for a worker process to return to its parent."""
+    return {metric.name: metric.snapshot() for metric in _metrics}
+
+def merge_metrics(snapshot: Dict[str, Dict]):
+    """Adds the metrics of another process (see metrics_snapshot) to this process's."""
+    by_name = {metric.name: metric for metric in _metrics}
+    for name, values in snapshot.items():
+        if name in by_name:
+            by_name[name].merge(values)
+
+
+@contextmanager
+def span(stage: str, **fields) -> Iterator[None]:
+    """
+    Times a stage into scraper_stage_seconds and logs it as one JSON line.
+    An exception counts as an error of the stage and is re-raised.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        errors_total.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        logger.info(json.dumps({"span": stage, "seconds": round(elapsed, 4), "error": error, **fields},
+                               ensure_ascii=False, default=str))
+
+def timed_action(func: Callable) -> Callable:
+    """Wraps an async controller action so its calls land in scraper_action_seconds."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            errors_total.inc(stage=f"action:{func.__name__}")
+            raise
+        finally:
+            action_seconds.observe(time.perf_counter() - start, action=func.__name__)
+    return wrapper
+
+def record_agent_history(history) -> None:
+    """Records token usage and step durations from a browser_use AgentHistoryList."""
+    usage = getattr(history, "usage", None)
+    if usage is not None:
+        llm_tokens_total.inc(usage.total_prompt_tokens, kind="prompt")
+        llm_tokens_total.inc(usage.total_prompt_cached_tokens, kind="prompt_cached")
+        llm_tokens_total.inc(usage.total_completion_tokens, kind="completion")
+    for item in getattr(history, "history", []):
+        metadata = getattr(item, "metadata", None)
+        if metadata is not None:
+            agent_step_seconds.observe(metadata.duration_seconds)
+
+
+def _sample_lines(name: str, kind: str, documentation: str, samples: List[Tuple[str, float]]) -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{labels} {value}" for labels, value in samples]
+    return lines
+
+def _collect_domain_block_rates() -> List[str]:
+    """Per-domain navigations and blocks, persisted in the local state database."""
+    from app.crud.block_stats import get_block_rates
+    from app.db.local import get_local_db
+
+    db = next(get_local_db())
+    try:
+        rates = get_block_rates(db)
+    except Exception as e:
+        logger.warning(f"Could not read the domain block rates: {e}")
+        return []
+    finally:
+        db.close()
+    lines = []
+    for name, kind, documentation, key in (
+        ("scraper_domain_navigations_total", "counter", "Navigations per domain, since the state database was created.", "navigations"),
+        ("scraper_domain_blocks_total", "counter", "Blocked navigations per domain.", "blocks"),
+        ("scraper_domain_block_rate", "gauge", "Share of the navigations to a domain that were blocked.", "block_rate"),
+    ):
+        lines += _sample_lines(name, kind, documentation,
+                               [(f'{{domain="{_escape(domain)}"}}', stats[key]) for domain, stats in rates.items()])
+    return lines
+
+def _collect_component_stats() -> List[str]:
+    """Counters kept by other modules, read only if those modules are loaded."""
+    lines = []
+    conditional_fetch = sys.modules.get("app.service.conditional_fetch")
+    if conditional_fetch is not None:
+        stats = conditional_fetch.fetch_stats.as_dict()
+        lines += _sample_lines("scraper_conditional_fetches_total", "counter",
+                               "Conditional product page fetches by outcome.",
+                               [(f'{{outcome="{key}"}}', value) for key, value in stats.items()
+                                if key not in ("requests", "hit_rate")])
+    block_detector = sys.modules.get("app.service.block_detector")
+    if block_detector is not None:
+        stats = block_detector.block_stats.as_dict()
+        lines += _sample_lines("scraper_pages_total", "counter", "Pages navigated to (checked by the block detector).",
+                               [("", stats["navigations"])])
+        lines += _sample_lines("scraper_blocks_total", "counter", "Navigations that hit a CAPTCHA or block page.",
+                               [(f'{{reason="{_escape(reason)}"}}', count) for reason, count in stats["by_reason"].items()])
+        lines += _collect_domain_block_rates()
+    engine = sys.modules.get("app.db.engine")
+    if engine is not None:
+        samples = []
+        for name, state in engine.pool_metrics().items():
+            for key, value in state.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    samples.append((f'{{engine="{_escape(name)}",metric="{key}"}}', value))
+        lines += _sample_lines("scraper_db_pool", "gauge", "Database connection pool state and event counts.", samples)
+    return lines
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines += metric.collect()
+    lines += _collect_component_stats()
+    return "\n".join(lines) + "\n"
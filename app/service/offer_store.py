@@ -0,0 +1,288 @@
+import csv
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.schemas.products import parse_scraped_at
+
+# Append-only store of scraped offers: Parquet files partitioned by scrape date
+# (server time), e.g. output/offers/date=2025-08-21/part-20250821_112405-1a2b3c4d.parquet.
+# Requires the optional `pyarrow` package.
+OFFER_STORE_DIR = os.getenv("OFFER_STORE_DIR", os.path.join("output", "offers"))
+# Scrapes add their offers to a per-process buffer that is written once at the end
+# of a job (see flush_offer_buffer), or earlier once this many offers are waiting
+OFFER_STORE_FLUSH_ROWS = int(os.getenv("OFFER_STORE_FLUSH_ROWS", "10000"))
+
+OFFER_COLUMNS = ["sku", "productName", "brand", "retailer", "url", "category",
+                 "stockStatus", "finalPriceVND", "oldPriceVND", "scrapedAt", "searchQuery"]
+_LEGACY_TIMESTAMP = re.compile(r"_(\d{8}_\d{6})\.(json|csv)$")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The offer store requires the 'pyarrow' package: pip install pyarrow") from e
+    return pyarrow
+
+def offer_schema():
+    """Typed schema of the offer store."""
+    pa = _pyarrow()
+    return pa.schema([
+        ("sku", pa.string()),
+        ("productName", pa.string()),
+        ("brand", pa.string()),
+        ("retailer", pa.string()),
+        ("url", pa.string()),
+        ("category", pa.string()),
+        ("stockStatus", pa.string()),
+        ("finalPriceVND", pa.int64()),
+        ("oldPriceVND", pa.int64()),
+        ("scrapedAt", pa.timestamp("us", tz="UTC")),
+        ("searchQuery", pa.string()),
+    ])
+
+def _to_int(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        digits = re.sub(r"[^\d]", "", str(value))
+        return int(digits) if digits else None
+
+def normalize_offer(offer: Dict[str, Any], search_query: Optional[str] = None,
+                    scraped_at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    Coerces a scraped product dict to the store schema, or None if it has no name.
+    `scraped_at` is the server time of the scrape; the offer's own scrapedAt is
+    only used without it.
+    """
+    if not offer.get("productName"):
+        return None
+    row = {column: offer.get(column) or None for column in OFFER_COLUMNS}
+    row["finalPriceVND"] = _to_int(offer.get("finalPriceVND"))
+    row["oldPriceVND"] = _to_int(offer.get("oldPriceVND"))
+    row["scrapedAt"] = scraped_at or parse_scraped_at(offer.get("scrapedAt")) or datetime.now(timezone.utc)
+    row["searchQuery"] = search_query or offer.get("searchQuery")
+    for column in ("sku", "productName", "brand", "retailer", "url", "category", "stockStatus", "searchQuery"):
+        if row[column] is not None:
+            row[column] = str(row[column])
+    return row
+
+def _write_rows(rows: List[Dict[str, Any]], root: str) -> int:
+    """Writes normalized rows, one new Parquet file per date partition touched."""
+    pa = _pyarrow()
+    by_date: Dict[str, List[Dict]] = {}
+    for row in rows:
+        by_date.setdefault(row["scrapedAt"].date().isoformat(), []).append(row)
+
+    written = 0
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    for day, day_rows in by_date.items():
+        partition = os.path.join(root, f"date={day}")
+        os.makedirs(partition, exist_ok=True)
+        table = pa.Table.from_pylist(day_rows, schema=offer_schema())
+        pa.parquet.write_table(table, os.path.join(partition, f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet"))
+        written += len(day_rows)
+    if written:
+        print(f"OFFER STORE: Appended {written} offers to {root}.")
+    return written
+
+def append_offers(offers: Iterable[Dict[str, Any]], search_query: Optional[str] = None,
+                  root: str = OFFER_STORE_DIR, scraped_at: Optional[datetime] = None) -> int:
+    """
+    Appends offers to the store, one new Parquet file per date partition touched.
+
+    Returns:
+        The number of offers written.
+    """
+    rows = [row for row in (normalize_offer(offer, search_query, scraped_at) for offer in offers) if row]
+    return _write_rows(rows, root)
+
+
+class OfferBuffer:
+    """
+    Collects the offers of many scrapes in memory and writes them in one file
+    per date partition, instead of one small file per scraped SKU.
+    """
+
+    def __init__(self, root: str = OFFER_STORE_DIR, flush_rows: int = OFFER_STORE_FLUSH_ROWS):
+        self.root = root
+        self.flush_rows = flush_rows
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, offers: Iterable[Dict[str, Any]], search_query: Optional[str] = None) -> int:
+        """Buffers offers, partitioned by the current server time. Returns the number buffered."""
+        _pyarrow()
+        now = datetime.now(timezone.utc)
+        rows = [row for row in (normalize_offer(offer, search_query, now) for offer in offers) if row]
+        with self._lock:
+            self._rows.extend(rows)
+            full = len(self._rows) >= self.flush_rows
+        if full:
+            self.flush()
+        return len(rows)
+
+    def flush(self) -> int:
+        """Writes the buffered offers. On an error they stay buffered and the error is raised."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        try:
+            return _write_rows(rows, self.root)
+        except Exception:
+            with self._lock:
+                self._rows[:0] = rows
+            raise
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+_buffer: Optional[OfferBuffer] = None
+
+def get_offer_buffer() -> OfferBuffer:
+    """Returns the process-wide offer buffer, creating it on first use."""
+    global _buffer
+    if _buffer is None:
+        _buffer = OfferBuffer()
+    return _buffer
+
+def flush_offer_buffer() -> int:
+    """Writes the offers buffered in this process; called at the end of a job or worker."""
+    if _buffer is None or not len(_buffer):
+        return 0
+    try:
+        return _buffer.flush()
+    except Exception as e:
+        print(f"OFFER STORE ERROR: Could not write {len(_buffer)} buffered offers. Error: {e}")
+        return 0
+
+def compact_offer_store(root: str = OFFER_STORE_DIR, min_files: int = 2) -> Dict[str, int]:
+    """
+    Merges the files of each date partition into one, sorted by sku and
+    scrapedAt, so a month of history is a handful of files to scan.
+
+    Returns:
+        The number of files merged per partition.
+    """
+    pa = _pyarrow()
+    compacted = {}
+    for partition in sorted(glob.glob(os.path.join(root, "date=*"))):
+        files = sorted(glob.glob(os.path.join(partition, "*.parquet")))
+        if len(files) < min_files:
+            continue
+        table = pa.concat_tables([pa.parquet.read_table(f, schema=offer_schema()) for f in files])
+        table = table.sort_by([("sku", "ascending"), ("scrapedAt", "ascending")])
+        target = os.path.join(partition, f"compacted-{time.strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+        # Write under a temporary name first so readers never see a partial file
+        pa.parquet.write_table(table, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        for f in files:
+            os.remove(f)
+        compacted[os.path.basename(partition)] = len(files)
+        print(f"OFFER STORE: Compacted {len(files)} files in {partition} ({table.num_rows} offers).")
+    return compacted
+
+def read_offers(start: Optional[date] = None, end: Optional[date] = None, sku: Optional[str] = None,
+                retailer: Optional[str] = None, root: str = OFFER_STORE_DIR):
+    """
+    Reads offers between two scrape dates (inclusive). Only the matching date
+    partitions are opened.
+
+    Returns:
+        A pyarrow Table (use .to_pandas() for a DataFrame).
+    """
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    if not os.path.isdir(root):
+        return offer_schema().empty_table()
+    dataset = pa.dataset.dataset(root, format="parquet", schema=offer_schema().append(pa.field("date", pa.string())),
+                                 partitioning="hive")
+    condition = None
+    for expression in (
+        pc.field("date") >= start.isoformat() if start else None,
+        pc.field("date") <= end.isoformat() if end else None,
+        pc.field("sku") == sku if sku else None,
+        pc.field("retailer") == retailer if retailer else None,
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    return dataset.to_table(filter=condition)
+
+def _read_legacy_file(path: str) -> List[Dict[str, Any]]:
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("products")
+    return data if isinstance(data, list) else []
+
+def import_legacy_outputs(output_dir: str = "output", root: str = OFFER_STORE_DIR, delete: bool = False) -> int:
+    """
+    Imports the per-run agent_products_*.json / agent_output_*.json /
+    products_output_*.csv dumps into the store and compacts it. A run wrote the
+    same products to all three files, so only one file per run is read
+    (products JSON, else full JSON, else CSV). Offers are stored under the run
+    time from the file name (or the file's mtime), not the model's scrapedAt.
+
+    Args:
+        output_dir (str): Directory of the legacy dumps.
+        root (str): The offer store directory.
+        delete (bool): Remove the legacy files once imported.
+    """
+    runs: Dict[str, Dict[str, str]] = {}
+    untimed = []
+    for path in glob.glob(os.path.join(output_dir, "*.json")) + glob.glob(os.path.join(output_dir, "*.csv")):
+        match = _LEGACY_TIMESTAMP.search(os.path.basename(path))
+        name = os.path.basename(path)
+        kind = "products" if name.startswith("agent_products_") else "full" if name.startswith("agent_output_") else "csv"
+        if match and name.startswith(("agent_products_", "agent_output_", "products_output_")):
+            runs.setdefault(match.group(1), {})[kind] = path
+        else:
+            untimed.append(path)
+
+    imported = 0
+    consumed = []
+    for stamp, files in sorted(runs.items()):
+        run_time = datetime.strptime(stamp, "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+        path = files.get("products") or files.get("full") or files.get("csv")
+        try:
+            imported += append_offers(_read_legacy_file(path), root=root, scraped_at=run_time)
+            consumed.extend(files.values())
+        except (OSError, ValueError) as e:
+            print(f"OFFER STORE ERROR: Could not import {path}. Error: {e}")
+    for path in untimed:
+        try:
+            imported += append_offers(_read_legacy_file(path), root=root,
+                                      scraped_at=datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc))
+            consumed.append(path)
+        except (OSError, ValueError) as e:
+            print(f"OFFER STORE ERROR: Could not import {path}. Error: {e}")
+
+    compact_offer_store(root)
+    if delete:
+        for path in consumed:
+            os.remove(path)
+    print(f"OFFER STORE: Imported {imported} offers from {len(consumed)} legacy files.")
+    return imported
+
+if __name__ == "__main__":
+    import sys
+    command = sys.argv[1] if len(sys.argv) > 1 else "compact"
+    if command == "import-legacy":
+        import_legacy_outputs(delete="--delete" in sys.argv)
+    else:
+        compact_offer_store()
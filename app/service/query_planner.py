@@ -0,0 +1,155 @@
+import os
+import re
+import unicodedata
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.crud.query_stats import get_template_yields, record_template_result
+from app.crud.sku_index import get_known_urls
+from app.db.local import get_local_db
+from app.service.metrics import cache_requests_total
+from app.service.serp_cache import cached_serp
+
+# Searches per SKU are capped, and stop early after this many variants in a
+# row that returned no URL not already seen for the SKU
+QUERY_PLANNER_MAX_QUERIES = int(os.getenv("QUERY_PLANNER_MAX_QUERIES", "4"))
+QUERY_PLANNER_PATIENCE = int(os.getenv("QUERY_PLANNER_PATIENCE", "1"))
+
+# The targeted queries the agent prompt used to ask for, as templates of the search term
+SEARCH_TEMPLATES = ["{q}", "giá rẻ nhất {q}", "{q} khuyến mãi", "{q} giá tốt nhất", "{q} thanh lý"]
+
+REPLACEMENTS = {
+    "Laptop": ["Notebook", "Máy tính xách tay"],
+    "Gaming": ["Game", "Gamer", "Chơi game"],
+    "Server": ["Máy chủ"], "PC": ["Desktop", "Máy tính để bàn"],
+    "Workstation": ["Máy trạm"], "Dell": ["DELL", "Dell Inc."],
+    "Asus": ["ASUS", "Asustek"], "HP": ["Hewlett Packard"],
+    "Lenovo": ["ThinkPad", "IdeaPad"], "MacBook": ["MBP", "MBA"],
+    "i9": ["Core i9"], "i7": ["Core i7"], "i5": ["Core i5"], "i3": ["Core i3"],
+    "SSD": ["Solid State Drive"], "HDD": ["Hard Disk Drive"],
+    "RAM": ["Memory"], "Card đồ họa": ["GPU", "Graphics Card", "VGA"]
+}
+
+
+def remove_accents(text: str) -> str:
+    nfkd = unicodedata.normalize("NFKD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in nfkd if not unicodedata.combining(c))
+
+def normalize_query(query: str) -> str:
+    """
+    The form under which SERPs are reused: Google ignores case and Vietnamese
+    accents, so "Giá rẻ nhất X" and "gia re nhat x" return the same results.
+    """
+    return " ".join(remove_accents(query).lower().split())
+
+def generate_search_variations(term: str) -> List[str]:
+    """
+    Synonym, accent, case and model-number variants of a search term (ported
+    from ref/main.py). The term itself comes first; the order is stable.
+    """
+    term = term.strip()
+    variations = [term]
+    for word, subs in REPLACEMENTS.items():
+        if word.lower() in term.lower():
+            for sub in subs:
+                variations.extend([term.replace(word, sub), term.replace(word.lower(), sub), term.replace(word.upper(), sub)])
+    no_accents = remove_accents(term)
+    variations.extend([no_accents, no_accents.lower(), no_accents.upper()])
+    # Model number variants
+    for model in re.findall(r"[A-Za-z]*\d{3,5}[A-Za-z]*", term):
+        variations.append(term.replace(model, model.replace("-", " ")))
+        variations.append(term.replace(model, model.replace(" ", "")))
+    variations.extend([term.lower(), term.upper(), term.title()])
+    return list(dict.fromkeys(v.strip() for v in variations if v.strip()))
+
+def plan_queries(term: str, templates: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """
+    Returns (template, query) pairs for a search term, one per distinct
+    normalized query, ordered by the historical yield of their template.
+    Synonym, accent and case variants of the term share the template "variant".
+    """
+    templates = templates or SEARCH_TEMPLATES
+    candidates: List[Tuple[str, str]] = [(template, template.format(q=term.strip())) for template in templates]
+    candidates += [("variant", variant) for variant in generate_search_variations(term)]
+
+    planned, seen = [], set()
+    for template, query in candidates:
+        key = normalize_query(query)
+        if key and key not in seen:
+            seen.add(key)
+            planned.append((template, query))
+
+    db = next(get_local_db())
+    try:
+        yields = get_template_yields(db, {template for template, _ in planned})
+    finally:
+        db.close()
+    # Stable sort: on equal yield the base term goes first, then the prompt's order
+    return sorted(planned, key=lambda item: -yields[item[0]])
+
+async def run_query_plan(term: str, search: Callable[[str], Awaitable[Dict]], locale: str = "",
+                         revalidate: Optional[Callable[[str], Awaitable[Dict]]] = None,
+                         max_queries: int = QUERY_PLANNER_MAX_QUERIES,
+                         patience: int = QUERY_PLANNER_PATIENCE) -> Dict:
+    """
+    Runs the planned queries for a term through `search` (which returns
+    {"status": ..., "candidates": [...]}, like a Google SERP scan) until
+    `max_queries` searches were made or `patience` queries in a row found
+    no new URL. SERPs are served from the persistent SERP cache when possible
+    (see app/service/serp_cache.py); `locale` and `revalidate` are passed to it.
+
+    After a "blocked" search outcome (a CAPTCHA, or a cooldown after one) no
+    more searches are made: the remaining variants are served from cached
+    SERPs only, and skipped when they have none.
+
+    Each template is scored by its own results: the URLs it found that the SKU
+    index did not know for the term before the plan ran, whether or not an
+    earlier query of the plan found them too. Otherwise the first template
+    would take the credit for every URL the others find as well.
+
+    Returns:
+        {"status", "candidates" (merged, unique by URL), "blocked" (block reason or None),
+         "queries" (issued), "reused"}
+    """
+    candidates, seen_urls = [], set()
+    issued, reused, dry_runs = [], 0, 0
+    last_error = blocked = None
+    db = next(get_local_db())
+    try:
+        known_urls = {row.url for row in get_known_urls(db, term, min_confidence=0.0)}
+        for template, query in plan_queries(term):
+            if len(issued) >= max_queries or (patience and dry_runs >= patience):
+                break
+            outcome, source = await cached_serp(normalize_query(query), locale, query, search, revalidate,
+                                                cached_only=blocked is not None)
+            cache_requests_total.inc(cache="serp", result=source)
+            if source == "miss":
+                continue
+            from_cache = source != "search"
+            if from_cache:
+                reused += 1
+            else:
+                issued.append(query)
+            if outcome.get("status") == "blocked":
+                # Searching more variants would only hit the same CAPTCHA, but cached SERPs still help
+                blocked, last_error = outcome.get("reason"), outcome.get("error")
+                continue
+            if outcome.get("status") != "success":
+                last_error = outcome.get("error")
+                dry_runs += 1
+                continue
+            results = outcome.get("candidates", [])
+
+            new = [c for c in results if c.get("url") and c["url"] not in seen_urls]
+            seen_urls.update(c["url"] for c in new)
+            candidates.extend(new)
+            if not from_cache:
+                found = {c["url"] for c in results if c.get("url") and c["url"] not in known_urls}
+                record_template_result(db, template, len(results), len(found))
+            dry_runs = dry_runs + 1 if not new else 0
+    finally:
+        db.close()
+
+    print(f"QUERY PLANNER: {len(issued)} searches ({reused} reused) found {len(candidates)} URLs for '{term}'.")
+    if not candidates and last_error:
+        return {"status": "failure", "error": last_error, "blocked": blocked, "queries": issued, "reused": reused}
+    return {"status": "success", "candidates": candidates, "blocked": blocked, "queries": issued, "reused": reused}
@@ -0,0 +1,173 @@
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# Append-only JSON Lines log of scraped offers: one compact line per offer in
+# rolling files, e.g. output/results/results-20250821_112405-4242-0001.jsonl.
+RESULTS_DIR = os.getenv("RESULTS_DIR", os.path.join("output", "results"))
+# A new file is started once the current one reaches either limit
+RESULT_FILE_MAX_BYTES = int(os.getenv("RESULT_FILE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_FILE_MAX_AGE_SECONDS = float(os.getenv("RESULT_FILE_MAX_AGE_SECONDS", "3600"))
+# Lines are written to the OS on every append, but fsync'ed only every N lines
+# or T seconds: a process crash loses nothing, a power loss at most one batch.
+RESULT_FSYNC_EVERY = int(os.getenv("RESULT_FSYNC_EVERY", "100"))
+RESULT_FSYNC_INTERVAL = float(os.getenv("RESULT_FSYNC_INTERVAL", "5"))
+
+
+class JsonlResultSink:
+    """
+    Appends scraped offers to rolling JSON Lines files.
+
+    Each process writes its own files (the pid is part of the name), so the
+    sink is safe to use from the sharded workers. Within a process, appends
+    are serialized by a lock.
+    """
+
+    def __init__(self, directory: str = RESULTS_DIR, max_bytes: int = RESULT_FILE_MAX_BYTES,
+                 max_age_seconds: float = RESULT_FILE_MAX_AGE_SECONDS, fsync_every: int = RESULT_FSYNC_EVERY,
+                 fsync_interval: float = RESULT_FSYNC_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.path: Optional[str] = None
+        self._file = None
+        self._sequence = 0
+        self._opened_at = 0.0
+        self._unsynced = 0
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        # The sequence number keeps files rotated within the same second in order
+        self._sequence += 1
+        self.path = os.path.join(self.directory, f"results-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = self._last_sync = time.monotonic()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _should_rotate(self) -> bool:
+        return (self._file.tell() >= self.max_bytes
+                or time.monotonic() - self._opened_at >= self.max_age_seconds)
+
+    def append(self, offers: Iterable[Dict[str, Any]], search_query: Optional[str] = None) -> int:
+        """
+        Appends offers as one line each, stamped with the server time as
+        'loggedAt' (naive UTC, ISO 8601 with a Z), which readers age and order offers by.
+
+        Args:
+            offers (Iterable[Dict]): Scraped product dicts.
+            search_query (str): Stored as 'searchQuery' on offers that have none.
+
+        Returns:
+            The number of lines written.
+        """
+        lines = []
+        logged_at = datetime.utcnow().isoformat() + "Z"
+        for offer in offers:
+            record = dict(offer)
+            record["loggedAt"] = logged_at
+            if search_query and not record.get("searchQuery"):
+                record["searchQuery"] = search_query
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+        if not lines:
+            return 0
+
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self._close_file()
+                self._open()
+            # One write per call, so a crash leaves at most a torn last line
+            self._file.write("".join(lines))
+            self._file.flush()
+            self._unsynced += len(lines)
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+        return len(lines)
+
+    def flush(self):
+        """Forces buffered lines to disk."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_sink: Optional[JsonlResultSink] = None
+
+def get_result_sink() -> JsonlResultSink:
+    """Returns the process-wide result sink, creating it on first use."""
+    global _sink
+    if _sink is None:
+        _sink = JsonlResultSink()
+    return _sink
+
+def close_result_sink():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+
+def is_result_log(path: str) -> bool:
+    """True for a .jsonl file or a directory of them (as opposed to a legacy JSON dump)."""
+    return os.path.isdir(path) or path.endswith(".jsonl")
+
+def iter_results(path: str = RESULTS_DIR) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the offers of a result file, or of every result file in a directory
+    (oldest first). Lines that do not parse, such as a line torn by a crash,
+    are skipped, and so are missing files.
+    """
+    if not os.path.exists(path):
+        print(f"FILE ERROR: The result log '{path}' was not found.")
+        return
+    files = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+    for file_path in files:
+        try:
+            f = open(file_path, encoding="utf-8")
+        except FileNotFoundError:
+            # Removed (e.g. archived) after the directory was listed
+            print(f"FILE ERROR: The result file '{file_path}' was not found.")
+            continue
+        with f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"FILE: Skipping unreadable line {line_number} of '{file_path}'.")
+                    continue
+                if isinstance(record, dict):
+                    yield record
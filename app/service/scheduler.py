@@ -0,0 +1,254 @@
+import heapq
+import itertools
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy.orm import Session
+from app.db.local import SkuSchedule, SkuRetailerPrice, RetailerPriceStats
+
+# Volatile SKUs are re-checked every MIN hours, stable ones every MAX hours.
+MIN_RECRAWL_HOURS = float(os.getenv("MIN_RECRAWL_HOURS", "1"))
+MAX_RECRAWL_HOURS = float(os.getenv("MAX_RECRAWL_HOURS", "168"))
+# Maximum number of SKUs scraped per run, across the whole catalog.
+CRAWL_BUDGET_PER_RUN = int(os.getenv("CRAWL_BUDGET_PER_RUN", "500"))
+# Weight of the latest observation in the volatility EWMA.
+VOLATILITY_ALPHA = 0.3
+# Share of the SKU volatility taken from the retailers that sell it.
+RETAILER_VOLATILITY_WEIGHT = 0.25
+# A failed scrape is retried no later than this.
+FAILED_RETRY_HOURS = 6
+# Weights of the business-value signals in the SKU priority score.
+PRIORITY_WEIGHTS = {"sales_rank": 0.4, "margin": 0.3, "staleness": 0.3}
+
+
+class SkuPriorityQueue:
+    """
+    Heap-backed priority queue of SKUs. The highest priority is popped first;
+    ties keep insertion order.
+
+    With a capacity, only the `capacity` highest-priority SKUs pushed so far
+    are kept (a bounded top-k), so a whole catalog can be ranked in O(capacity)
+    memory.
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        # Min-heap of (priority, -insertion order, sku): the entry to evict first is on top
+        self._heap = []
+        self._counter = itertools.count()
+        self._sorted = True
+        self.capacity = capacity
+
+    def push(self, sku: str, priority: float):
+        entry = (priority, -next(self._counter), sku)
+        if self.capacity is None or len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, entry)
+        elif self._heap and entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+        else:
+            return
+        self._sorted = False
+
+    def pop(self) -> str:
+        if not self._sorted:
+            # An ascending list is still a valid min-heap, and pops from its end are the highest priority
+            self._heap.sort()
+            self._sorted = True
+        return self._heap.pop()[2]
+
+    def drain(self, limit: Optional[int] = None) -> Iterator[str]:
+        """Pops SKUs in priority order, up to `limit` of them."""
+        popped = 0
+        while self._heap and (limit is None or popped < limit):
+            popped += 1
+            yield self.pop()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def recrawl_interval(volatility: float) -> timedelta:
+    """
+    Maps a volatility in [0, 1] to a recrawl interval on a log scale:
+    1.0 gives MIN_RECRAWL_HOURS, 0.0 gives MAX_RECRAWL_HOURS.
+    """
+    volatility = min(1.0, max(0.0, volatility))
+    hours = MIN_RECRAWL_HOURS * (MAX_RECRAWL_HOURS / MIN_RECRAWL_HOURS) ** (1.0 - volatility)
+    return timedelta(hours=hours)
+
+def select_due_skus(db: Session, skus: List[str], budget: Optional[int] = CRAWL_BUDGET_PER_RUN,
+                    now: Optional[datetime] = None) -> List[str]:
+    """
+    Picks the SKUs that are due for a recrawl, within the crawl budget.
+    Never-checked SKUs come first, then the most overdue relative to their interval.
+
+    Args:
+        db (Session): A session on the local state database.
+        skus (List[str]): The candidate SKUs (e.g. from get_all_skus).
+        budget (int): Maximum number of SKUs to return, or None for no cap.
+
+    Returns:
+        The due SKUs, most urgent first.
+    """
+    now = now or datetime.utcnow()
+    schedules = {row.sku: row for row in db.query(SkuSchedule).filter(SkuSchedule.sku.in_(skus)).all()} if skus else {}
+
+    due = []
+    for sku in skus:
+        schedule = schedules.get(sku)
+        if schedule is None or schedule.next_due is None:
+            due.append((float("inf"), sku))
+            continue
+        if schedule.next_due <= now:
+            interval = recrawl_interval(schedule.volatility).total_seconds()
+            overdue = (now - schedule.next_due).total_seconds()
+            due.append((overdue / interval, sku))
+
+    due.sort(key=lambda item: item[0], reverse=True)
+    selected = [sku for _, sku in (due if budget is None else due[:budget])]
+    print(f"SCHEDULER: {len(due)} of {len(skus)} SKUs are due; {len(selected)} selected within a budget of {budget}.")
+    return selected
+
+def set_manual_boost(db: Session, sku: str, boost: float):
+    """Adds a manual priority boost to a SKU (0 removes it)."""
+    try:
+        schedule = db.get(SkuSchedule, sku)
+        if schedule is None:
+            schedule = SkuSchedule(sku=sku, checks=0, changes=0, volatility=0.5)
+            db.add(schedule)
+        schedule.manual_boost = boost
+        db.commit()
+    except Exception as e:
+        print(f"SCHEDULER ERROR: Could not set manual boost for SKU {sku}. Error: {e}")
+        db.rollback()
+
+def sku_priority(sales_rank: Optional[int] = None, margin: Optional[float] = None,
+                 hours_since_success: Optional[float] = None, manual_boost: float = 0.0) -> float:
+    """
+    Business-value priority of a SKU. Each signal is scaled to [0, 1] and
+    weighted by PRIORITY_WEIGHTS; missing signals count as 0, except that a
+    SKU that was never scraped successfully is treated as fully stale.
+    The manual boost is added on top.
+
+    Args:
+        sales_rank (int): 1 for the best seller.
+        margin (float): Gross margin as a fraction of the price.
+        hours_since_success (float): Hours since the last successful scrape, None if never.
+        manual_boost (float): Operator-assigned extra priority.
+    """
+    sales_score = 1.0 / math.log2(sales_rank + 1) if sales_rank and sales_rank > 0 else 0.0
+    margin_score = min(1.0, max(0.0, margin)) if margin is not None else 0.0
+    staleness_score = 1.0 if hours_since_success is None else min(1.0, hours_since_success / MAX_RECRAWL_HOURS)
+    return (
+        PRIORITY_WEIGHTS["sales_rank"] * sales_score
+        + PRIORITY_WEIGHTS["margin"] * margin_score
+        + PRIORITY_WEIGHTS["staleness"] * staleness_score
+        + manual_boost
+    )
+
+def build_sku_priority_queue(db: Session, skus: List[str], sales_ranks: Optional[Dict[str, int]] = None,
+                             margins: Optional[Dict[str, float]] = None, now: Optional[datetime] = None,
+                             queue: Optional[SkuPriorityQueue] = None) -> SkuPriorityQueue:
+    """
+    Builds a priority queue over the given SKUs from the business-value signals.
+
+    Args:
+        db (Session): A session on the local state database.
+        skus (List[str]): The SKUs to enqueue (e.g. from select_due_skus).
+        sales_ranks (Dict[str, int]): Optional sales rank per SKU.
+        margins (Dict[str, float]): Optional gross margin per SKU (see get_sku_margins).
+        queue (SkuPriorityQueue): Push into this queue (e.g. a bounded one shared by
+            all catalog pages) instead of a new one.
+    """
+    now = now or datetime.utcnow()
+    sales_ranks = sales_ranks or {}
+    margins = margins or {}
+    schedules = {row.sku: row for row in db.query(SkuSchedule).filter(SkuSchedule.sku.in_(skus)).all()} if skus else {}
+
+    queue = queue if queue is not None else SkuPriorityQueue()
+    for sku in skus:
+        schedule = schedules.get(sku)
+        last_success = schedule.last_checked if schedule else None
+        queue.push(sku, sku_priority(
+            sales_rank=sales_ranks.get(sku),
+            margin=margins.get(sku),
+            hours_since_success=(now - last_success).total_seconds() / 3600 if last_success else None,
+            manual_boost=(schedule.manual_boost or 0.0) if schedule else 0.0,
+        ))
+    return queue
+
+def _retailer_volatility(db: Session, retailers: List[str]) -> Optional[float]:
+    """Mean change rate of the given retailers, or None if nothing is known yet."""
+    stats = db.query(RetailerPriceStats).filter(RetailerPriceStats.retailer.in_(retailers)).all() if retailers else []
+    rates = [s.changes / s.observations for s in stats if s.observations]
+    return sum(rates) / len(rates) if rates else None
+
+def record_sku_observation(db: Session, sku: str, products: List[Dict], now: Optional[datetime] = None) -> Optional[SkuSchedule]:
+    """
+    Updates price-change statistics after scraping a SKU and assigns its next-due time.
+
+    Args:
+        db (Session): A session on the local state database.
+        sku (str): The catalog SKU that was scraped.
+        products (List[Dict]): The offers returned by scrape_product_data.
+    """
+    now = now or datetime.utcnow()
+    try:
+        schedule = db.get(SkuSchedule, sku)
+        if schedule is None:
+            schedule = SkuSchedule(sku=sku, checks=0, changes=0, volatility=0.5)
+            db.add(schedule)
+
+        offers = [p for p in products or [] if isinstance(p.get('finalPriceVND'), (int, float))]
+        if not offers:
+            # Nothing to learn from a failed scrape; retry reasonably soon
+            retry = min(recrawl_interval(schedule.volatility), timedelta(hours=FAILED_RETRY_HOURS))
+            schedule.next_due = now + retry
+            db.commit()
+            return schedule
+
+        # Per-retailer change tracking
+        retailers = []
+        for offer in offers:
+            retailer = offer.get('retailer')
+            if not retailer:
+                continue
+            retailers.append(retailer)
+            price = float(offer['finalPriceVND'])
+            previous = db.get(SkuRetailerPrice, (sku, retailer))
+            stats = db.get(RetailerPriceStats, retailer)
+            if stats is None:
+                stats = RetailerPriceStats(retailer=retailer, observations=0, changes=0)
+                db.add(stats)
+            if previous is None:
+                db.add(SkuRetailerPrice(sku=sku, retailer=retailer, last_price=price, last_seen=now))
+            else:
+                stats.observations += 1
+                if previous.last_price != price:
+                    stats.changes += 1
+                previous.last_price = price
+                previous.last_seen = now
+
+        # Per-SKU change tracking on the cheapest offer
+        cheapest = min(float(o['finalPriceVND']) for o in offers)
+        changed = schedule.last_price is not None and schedule.last_price != cheapest
+        if schedule.last_price is not None:
+            schedule.volatility = VOLATILITY_ALPHA * (1.0 if changed else 0.0) + (1 - VOLATILITY_ALPHA) * schedule.volatility
+        schedule.checks += 1
+        if changed:
+            schedule.changes += 1
+            schedule.last_changed = now
+        schedule.last_price = cheapest
+        schedule.last_checked = now
+
+        volatility = schedule.volatility
+        retailer_volatility = _retailer_volatility(db, retailers)
+        if retailer_volatility is not None:
+            volatility = (1 - RETAILER_VOLATILITY_WEIGHT) * volatility + RETAILER_VOLATILITY_WEIGHT * retailer_volatility
+        schedule.next_due = now + recrawl_interval(volatility)
+        db.commit()
+        return schedule
+    except Exception as e:
+        print(f"SCHEDULER ERROR: Could not record observation for SKU {sku}. Error: {e}")
+        db.rollback()
+        return None
@@ -2,47 +2,86 @@ import os
 import sys
 from dotenv import load_dotenv
 load_dotenv()
+from app.core.retailers import LAPTOP_SERVER_RETAILERS, extract_model_from_title
 from app.db.models import Product
-from app.schemas.products import ProductCreate, ProductUpdate
+from app.schemas.products import ProductCreate, ProductUpdate, ScrapedProduct, ScrapedProductList, parse_scraped_at
 from app.db.mydb import get_db
 from sqlalchemy.orm import Session
-from browser_use import Agent, BrowserConfig, Browser, Controller, ActionResult
 from urllib.parse import urlparse
-import pandas as pd
-from browser_use.llm import ChatOpenAI
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
 import json
-from typing import Any
-from bs4 import BeautifulSoup
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple
 import re
-import csv
-from app.crud.products import get_all_skus, update_price_for_sku
+from json_repair import loads as repair_json_loads
+from pydantic import ValidationError
+from app.crud.products import (
+    SkuIdMap, update_price_for_sku, iter_sku_pages_async, get_sku_margins_async, update_price_for_sku_async
+)
+from app.crud.price_history import insert_price_history_async
+from app.crud.sku_index import (
+    SERP_CANDIDATE_CONFIDENCE, normalize_sku, get_known_urls, record_sku_urls, demote_sku_urls
+)
+from app.crud.sku_alias import SkuAliasMap
+from app.crud.catalog import find_catalog_urls
+from app.db.local import get_local_db
+from app.db.async_db import run_db_sync
+from app.db.migrations import run_startup_checks
+from app.service.block_detector import check_navigation, is_cooling_down
+from app.service.conditional_fetch import fetch_price_fragment
+from app.service.metrics import (
+    cache_requests_total, offers_total, record_agent_history, scrapes_total, span, timed_action
+)
+from app.service.offer_store import flush_offer_buffer, get_offer_buffer
+from app.service.query_planner import run_query_plan
+from app.service.result_sink import close_result_sink, get_result_sink, is_result_log, iter_results
+from app.service.scheduler import (
+    CRAWL_BUDGET_PER_RUN, SkuPriorityQueue, select_due_skus, build_sku_priority_queue, record_sku_observation
+)
+from app.crud.run_ledger import (
+    start_or_resume_run, get_completed_skus, get_exhausted_skus,
+    mark_sku_started, mark_sku_done, mark_sku_failed, finish_run
+)
+from app.service.workers import WORKER_PROCESSES, run_sharded_price_update
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 import time
 
+# browser_use, playwright and the LLM client are imported on first use (see get_controller)
+if TYPE_CHECKING:
+    from browser_use import Browser, Controller
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+SKU_INDEX_MAX_AGE_HOURS = float(os.getenv("SKU_INDEX_MAX_AGE_HOURS", "72"))
+# SKUs completed within this window are not scraped again by a restarted job
+RUN_WINDOW_HOURS = float(os.getenv("RUN_WINDOW_HOURS", "24"))
+MAX_SKU_ATTEMPTS = int(os.getenv("MAX_SKU_ATTEMPTS", "3"))
+# SKUs read from the catalog per query by run_price_update_job
+SKU_PAGE_SIZE = int(os.getenv("SKU_PAGE_SIZE", "1000"))
+# Offers older than this in a result log are ignored by run_json_to_db_update_job
+RESULT_LOG_MAX_AGE_HOURS = float(os.getenv("RESULT_LOG_MAX_AGE_HOURS", "48"))
+# Google host and interface language of SERP scans; cached SERPs are keyed on both
+GOOGLE_SEARCH_HOST = os.getenv("GOOGLE_SEARCH_HOST", "www.google.com.vn")
+GOOGLE_SEARCH_LANGUAGE = os.getenv("GOOGLE_SEARCH_LANGUAGE", "en")
+GOOGLE_SEARCH_LOCALE = f"{GOOGLE_SEARCH_HOST}|{GOOGLE_SEARCH_LANGUAGE}"
+
+# Event callback of the scrape running in the current task (see scrape_product_data's on_event)
+_scrape_event_sink: ContextVar[Callable[[Dict[str, Any]], None] | None] = ContextVar("scrape_event_sink", default=None)
+# Offers returned by extract_final_price during the running scrape, by URL
+_extracted_offers: ContextVar[Dict[str, Dict[str, Any]] | None] = ContextVar("extracted_offers", default=None)
+
+def emit_scrape_event(event: str, **data):
+    """Sends a progress event to the on_event callback of the running scrape, if any."""
+    sink = _scrape_event_sink.get()
+    if sink is None:
+        return
+    try:
+        sink({"event": event, "timestamp": datetime.utcnow().isoformat() + "Z", **data})
+    except Exception as e:
+        logger.warning(f"Scrape event callback failed: {e}")
 
 
 
-LAPTOP_SERVER_RETAILERS = {
-    "fptshop.com.vn": "FPT Shop",
-    "thegioididong.com": "Thế Giới Di Động", 
-    "cellphones.com.vn": "CellphoneS",
-    "hoanghamobile.com": "Hoàng Hà Mobile",
-    "phongvu.vn": "Phong Vũ",
-    "gearvn.com": "GearVN",
-    "anphatpc.com.vn": "An Phát PC",
-    "phucanh.vn": "Phúc Anh",
-    "trananh.vn": "Trần Anh",
-    "nguyenkim.com": "Nguyễn Kim",
-    "mediamart.vn": "MediaMart",
-    "dienmayxanh.com": "Điện Máy Xanh",
-    "tgdđ.com": "Thế Giới Di Động",
-    "fpt.com.vn": "FPT",
-    "viettelstore.vn": "Viettel Store",
-    "vinaphone.com.vn": "Vinaphone"
-}
 RETAILER_SELECTORS = {
     "thegioididong": "div.bs_price strong",
     "fptshop": ".st-price-main",
@@ -81,25 +120,6 @@ def extract_brand_from_title(title: str) -> str:
             return brand
     return "Unknown"
 
-def extract_model_from_title(title: str) -> str:
-    """Extract model/SKU from product title."""
-    # Common laptop/server model patterns
-    patterns = [
-        r'\b[A-Z]{2,4}\d{3,4}[A-Z]?\b',  # HP 15, Dell XPS 13, etc.
-        r'\b[A-Z]{2,4}-\d{3,4}[A-Z]?\b',  # HP-15, Dell-XPS-13, etc.
-        r'\b[A-Z]{2,4}\s+\d{3,4}[A-Z]?\b',  # HP 15, Dell XPS 13, etc.
-        r'\b[A-Z]{2,4}\d{2,3}[A-Z]{1,2}\d{1,2}\b',  # ThinkPad T14, etc.
-        r'\b[A-Z]{2,4}\d{2,3}[A-Z]{1,2}\b',  # ThinkPad T14, etc.
-        r'\b[A-Z]{2,4}\d{2,3}\b',  # HP 15, etc.
-        r'\b[A-Z]{2,4}\d{2,3}[A-Z]{1,2}\d{1,2}[A-Z]{1,2}\b',  # ThinkPad T14s Gen 2, etc.
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, title.upper())
-        if matches:
-            return matches[0]
-    return ""
-
 def clean_price(price_text: str) -> float:
     """Clean and extract price from text."""
     if not price_text:
@@ -116,7 +136,55 @@ def clean_price(price_text: str) -> float:
         return price
     except ValueError:
         return 0.0
-controller = Controller()
+
+def retailer_from_url(url: str) -> str | None:
+    """Map a product URL to a known retailer name using LAPTOP_SERVER_RETAILERS."""
+    domain = urlparse(url).netloc.lower()
+    if domain.startswith("www."):
+        domain = domain[4:]
+    for retailer_domain, retailer_name in LAPTOP_SERVER_RETAILERS.items():
+        if domain == retailer_domain or domain.endswith("." + retailer_domain):
+            return retailer_name
+    return None
+
+def _index_google_candidates(query: str, candidates: List[Dict]):
+    """
+    Records Google candidates in the SKU-to-URL index. A candidate is only
+    indexed under a SKU-like token of the query that appears in its title or URL,
+    and below the trusted confidence: it is not verified until the agent extracts
+    an offer from it.
+    """
+    sku_tokens = {normalize_sku(t) for t in query.split() if len(t) >= 5 and re.search(r"\d", t)}
+    if not sku_tokens or not candidates:
+        return
+    db = next(get_local_db())
+    try:
+        for token in sku_tokens:
+            matching = [
+                {"url": c["url"], "retailer": retailer_from_url(c["url"])}
+                for c in candidates
+                if token in normalize_sku(c.get("productName", "") + c["url"]) and retailer_from_url(c["url"])
+            ]
+            if matching:
+                record_sku_urls(db, token, matching, source="google", confidence=SERP_CANDIDATE_CONFIDENCE)
+    finally:
+        db.close()
+
+_controller = None
+
+def get_controller() -> "Controller":
+    """Builds the agent controller with the custom actions on first use."""
+    global _controller
+    if _controller is None:
+        from browser_use import Controller
+        controller = Controller()
+        # Each action call is timed into scraper_action_seconds (see app/service/metrics.py)
+        controller.action("extract_final_price")(timed_action(extract_final_price))
+        controller.action("scan_google_for_products")(timed_action(scan_google_for_products))
+        controller.action("find_product_urls_directly_from_retailers")(timed_action(find_product_urls_directly_from_retailers))
+        _controller = controller
+    return _controller
+
 # --- Custom Action ---
 # @controller.action("search_google_laptop_server")
 # async def search_google_laptop_server(page, query: str):
@@ -129,7 +197,6 @@ controller = Controller()
 #         await page.wait_for_selector("div[data-sokoban-container], div.sh-dgr__content", timeout=15000)
 #         return {"status": "success", "query": search_query}
 
-@controller.action("extract_final_price")
 async def extract_final_price(page, url: str, retailer: str):
     """Extract the final product price from a retailer product page."""
 
@@ -137,38 +204,46 @@ async def extract_final_price(page, url: str, retailer: str):
     if not selector:
         raise ValueError(f"No selector defined for retailer: {retailer}")
 
-    # Go to product page
-    await page.goto(url)
-
-    # Wait for the price element
-    await page.wait_for_selector(selector, timeout=10000)
-
-    # Extract the HTML
-    html = await page.content()
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Get price text
-    price_tag = soup.select_one(selector)
-    if not price_tag:
-        raise ValueError(f"Price not found for {retailer}")
-
-    price_str = price_tag.get_text(strip=True)
-    price_value = clean_price(price_str)
-
-    return {"url": url, "retailer": retailer, "finalPriceVND": price_value}
+    # Conditional fetch: skips parsing when the page or its price fragment is unchanged.
+    # A CAPTCHA or 403/429 raises BlockedError, so the agent moves on to the next retailer.
+    result = await fetch_price_fragment(page, url, selector, parse=clean_price)
+
+    offer = {
+        "url": url,
+        "retailer": retailer,
+        "finalPriceVND": result["price"],
+        "unchanged": result["status"] != "changed",
+    }
+    extracted = _extracted_offers.get()
+    if extracted is not None:
+        extracted[url] = offer
+    emit_scrape_event("offer", **offer)
+    return offer
+
+def mark_unchanged_offers(products: List[Dict[str, Any]], extracted: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Sets 'unchanged' on each product: True when extract_final_price found its
+    page (or price fragment) unchanged since the last fetch and the agent
+    reported that same price.
+    """
+    for product in products:
+        offer = extracted.get(product.get('url') or "")
+        product['unchanged'] = bool(
+            offer and offer["unchanged"] and offer["finalPriceVND"] == product.get('finalPriceVND')
+        )
+    return products
 
 import logging
-from typing import Dict, List
-from playwright.async_api import Page, TimeoutError
 
 logger = logging.getLogger(__name__)
 
-@controller.action("scan_google_for_products")
 async def scan_google_for_products(page, query: str) -> Dict:
     """
-    Scans the Google SERP for a given query to find all product candidates.
-    This includes organic results, Shopping results, and Google Ads.
-    
+    Scans Google for all product candidates of a query. The query planner runs
+    the useful variants ("giá rẻ nhất ...", "... khuyến mãi", ...) in order of
+    past yield, stops once they stop finding new URLs and serves SERPs from the
+    persistent SERP cache, so repeat queries do not hit Google. This includes organic results, Shopping results, and Google Ads.
+
     Args:
         page: The Playwright page object.
         query (str): The product search query.
@@ -176,15 +251,57 @@ async def scan_google_for_products(page, query: str) -> Dict:
     Returns:
         A dictionary with a list of candidate products.
     """
+    async def search(variant: str) -> Dict:
+        if is_cooling_down(GOOGLE_SEARCH_HOST):
+            # Google blocked us recently: only cached SERPs are used
+            return {"status": "blocked", "reason": "cooldown", "error": "Google is cooling down after a block"}
+        return await _scan_google_serp(page, variant)
+
+    async def revalidate(variant: str) -> Dict:
+        # Stale SERPs are refetched in a separate tab while the agent keeps using its page
+        if is_cooling_down(GOOGLE_SEARCH_HOST):
+            return {"status": "blocked", "reason": "cooldown"}
+        tab = await page.context.new_page()
+        try:
+            return await _scan_google_serp(tab, variant)
+        finally:
+            await tab.close()
+
+    result = await run_query_plan(query, search, locale=GOOGLE_SEARCH_LOCALE, revalidate=revalidate)
+    if result["status"] == "success" and result["candidates"]:
+        _index_google_candidates(query, result["candidates"])
+        return result
+    if result.get("blocked"):
+        # Fail over at once instead of letting the agent retry Google
+        logger.warning(f"Google blocked ({result['blocked']}); searching retailers directly for '{query}'.")
+        fallback = await find_product_urls_directly_from_retailers(page, query, list(RETAILER_DIRECT_SEARCH_CONFIG))
+        return {
+            "status": "success",
+            "source": "retailers",
+            "blocked": result["blocked"],
+            "candidates": [{"url": url, "productName": "", "priceText": ""} for url in fallback["urls"]],
+        }
+    return result
+
+async def _scan_google_serp(page, query: str) -> Dict:
+    """Scans one Google SERP for product candidates."""
+    from playwright.async_api import TimeoutError
+
     logger.info(f"Scanning Google for all product candidates for: '{query}'")
     candidates = []
     seen_urls = set()
     
     try:
-        # Use Vietnamese Google for local results, can be changed to google.com
+        # Vietnamese Google by default for local results (see GOOGLE_SEARCH_HOST)
         search_query_encoded = query.replace(' ', '+')
-        await page.goto(f"https://www.google.com.vn/search?q={search_query_encoded}&hl=en", timeout=30000)
-        await page.wait_for_load_state('networkidle', timeout=15000)
+        search_url = f"https://{GOOGLE_SEARCH_HOST}/search?q={search_query_encoded}&hl={GOOGLE_SEARCH_LANGUAGE}"
+        with span("google_navigation", query=query):
+            response = await page.goto(search_url, timeout=30000)
+            # Checked before waiting for the page to settle: a CAPTCHA page may never go idle
+            reason = await check_navigation(page, response, search_url)
+            if reason:
+                return {"status": "blocked", "reason": reason, "error": f"Google SERP blocked ({reason})"}
+            await page.wait_for_load_state('networkidle', timeout=15000)
 
         # A robust composite selector for all types of product/ad containers on Google
         # This is the key to finding organic, shopping, and ad results together.
@@ -243,7 +360,6 @@ RETAILER_DIRECT_SEARCH_CONFIG = {
     # Add ALL other target retailers from your master list here...
 }
 
-@controller.action("find_product_urls_directly_from_retailers")
 async def find_product_urls_directly_from_retailers(page, query: str, retailer_list: List[str]) -> Dict:
     """
     Bypasses Google and finds product URLs by searching directly on each retailer's website.
@@ -257,6 +373,8 @@ async def find_product_urls_directly_from_retailers(page, query: str, retailer_l
     Returns:
         A dictionary with a list of product URLs found.
     """
+    from playwright.async_api import TimeoutError
+
     logger.info(f"Executing FALLBACK PLAN: Searching directly on {len(retailer_list)} retailer sites.")
     found_urls = []
     
@@ -264,11 +382,19 @@ async def find_product_urls_directly_from_retailers(page, query: str, retailer_l
         if retailer_name not in RETAILER_DIRECT_SEARCH_CONFIG:
             logger.warning(f"No direct search config for '{retailer_name}'. Skipping.")
             continue
+        if is_cooling_down(RETAILER_DIRECT_SEARCH_CONFIG[retailer_name]):
+            logger.warning(f"{retailer_name} blocked us recently. Skipping.")
+            continue
         
         try:
             search_url = RETAILER_DIRECT_SEARCH_CONFIG[retailer_name].format(query=query.replace(' ', '+'))
             logger.info(f"--> Searching directly on {retailer_name} via: {search_url}")
-            await page.goto(search_url, timeout=30000, wait_until="domcontentloaded")
+            with span("retailer_navigation", retailer=retailer_name):
+                response = await page.goto(search_url, timeout=30000, wait_until="domcontentloaded")
+                reason = await check_navigation(page, response, search_url)
+            if reason:
+                logger.warning(f"{retailer_name} blocked the search ({reason}). Skipping.")
+                continue
 
             # --- CRITICAL: CUSTOM PARSING LOGIC REQUIRED ---
             # Every website is different. You MUST develop a robust parser for each one.
@@ -298,556 +424,671 @@ async def find_product_urls_directly_from_retailers(page, query: str, retailer_l
 
     return {"status": "success", "urls": found_urls}
 
-async def scrape_product_data(searchQuery: list, limit: int) -> list[ProductCreate]:
+def _validate_products(data: Any) -> ScrapedProductList:
+    """
+    Validates a decoded agent result item by item, dropping only the
+    products that do not fit the schema instead of the whole result.
+    """
+    if isinstance(data, list):
+        data = {"products": data}
+    if not isinstance(data, dict) or not isinstance(data.get("products"), list):
+        raise TypeError("Agent result has no 'products' list.")
+
+    products = []
+    for item in data["products"]:
+        try:
+            products.append(ScrapedProduct.model_validate(item))
+        except ValidationError as e:
+            print(f"Skipping malformed product from agent result: {item}. Error: {e}")
+    return ScrapedProductList(products=products)
+
+def parse_agent_products(raw_result: Any) -> ScrapedProductList:
+    """
+    Parses the agent's final result into a ScrapedProductList.
+
+    Strict validation against the output model is tried first. If the agent
+    returned slightly broken JSON (markdown fences, trailing commas, truncated
+    output), `json_repair` is used as a salvage stage so the run is not lost.
+
+    Args:
+        raw_result: The value of `agent_result.final_result()` (str or dict).
+
+    Returns:
+        The validated list of products (possibly empty).
+    """
+    if isinstance(raw_result, dict):
+        return _validate_products(raw_result)
+    if not isinstance(raw_result, str) or not raw_result.strip():
+        raise TypeError("Agent result is not a processable type.")
+
+    try:
+        return ScrapedProductList.model_validate_json(raw_result)
+    except ValidationError as e:
+        print(f"Agent result failed strict validation, attempting JSON repair. Error: {e}")
+
+    repaired = repair_json_loads(raw_result)
+    if not repaired:
+        raise ValueError("Agent result could not be repaired into JSON.")
+    return _validate_products(repaired)
+
+def create_browser(keep_alive: bool = False) -> "Browser":
+    """
+    Creates the headless browser used by the scraping agent.
+
+    Args:
+        keep_alive (bool): Keep the browser running after an agent finishes,
+                           so it can be reused (e.g. from a worker's browser pool).
+    """
+    from browser_use import Browser, BrowserConfig
+
     browser_config = BrowserConfig(
         headless=True,
         slow_mo=1000,
         disable_security=False,
+        keep_alive=keep_alive or None,
         user_agent=(
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
             "AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/120.0.0.0 Safari/537.36"
         )
     )
-    browser = Browser(config=browser_config)
-    await browser.start()
+    return Browser(config=browser_config)
 
-    llm = ChatOpenAI(
-        model="gpt-4.1-mini",
-        temperature=0,
-        api_key=OPENAI_API_KEY
-    )
+class ScrapeError(Exception):
+    """A scrape failed (agent, parsing or browser error), as opposed to finding no offers."""
 
 
-        # Define the task instruction for the agent
+async def scrape_product_data(searchQuery: list, limit: int, browser: "Browser | None" = None,
+                              on_event: Callable[[Dict[str, Any]], None] | None = None,
+                              raise_errors: bool = False) -> list[dict]:
+    """
+    Runs the scraping agent for a SKU and returns the verified offers.
+
+    Args:
+        searchQuery: The catalog SKU (or search term).
+        limit (int): Number of offers wanted.
+        browser: A running browser to reuse (left running); a new one is started otherwise.
+        on_event: Receives progress events (see emit_scrape_event).
+        raise_errors (bool): Raise ScrapeError when the scrape fails instead of
+            returning [] (the error is in the "summary" event either way).
+    """
+    from browser_use import Agent
+    from browser_use.llm import ChatOpenAI
+
+    # on_event receives "step", "offer" and "summary" events while the agent runs (used for streaming)
+    sink_token = _scrape_event_sink.set(on_event) if on_event else None
+    extracted_token = _extracted_offers.set({})
+    # A browser passed in (e.g. from a worker pool) is reused and left running
+    owns_browser = browser is None
+    index_db = None
+    known_urls = []
+    products = []
+    error = None
+
+    # Setup runs inside the try as well: a browser that fails to start or an
+    # index lookup that raises still releases what was acquired and ends the
+    # scrape with a "summary" event
+    try:
+        if owns_browser:
+            browser = create_browser()
+            with span("browser_start"):
+                await browser.start()
+
+        llm = ChatOpenAI(
+            model="gpt-4.1-mini",
+            temperature=0,
+            api_key=OPENAI_API_KEY
+        )
+
+
+        # Known URLs from previous runs let the agent skip discovery entirely
+        index_db = next(get_local_db())
+        known_urls = [row.url for row in get_known_urls(index_db, searchQuery, max_age_hours=SKU_INDEX_MAX_AGE_HOURS)]
+        # URLs from the sitemap/category catalog are a local lookup as well
+        known_urls += [row.url for row in find_catalog_urls(index_db, searchQuery) if row.url not in known_urls]
+        cache_requests_total.inc(cache="sku_index", result="hit" if known_urls else "miss")
+        if known_urls:
+            print(f"SKU INDEX: {len(known_urls)} known product URLs for {searchQuery}. Skipping discovery unless they fail.")
+            known_urls_list = "\n".join(f"        - {url}" for url in known_urls)
+            known_urls_instruction = f"""
+            ---
+            ## STEP 0: KNOWN PRODUCT URLS (from previous runs)
+            ---
+
+            The following product pages were verified for `{searchQuery}` recently:
+    {known_urls_list}
+
+            1. Go **directly** to these URLs and run the Detailed Extraction of Step 2 on them.
+            2. Only if **none** of them yields a valid offer, fall back to Step 1 (Discovery).
+            """
+        else:
+            known_urls_instruction = ""
+
+            # Define the task instruction for the agent
    
     
 
-# #     task_instruction = f"""
-# #     You are a specialized and highly efficient scraper for Vietnamese retailers, optimized to find the single cheapest available product based on its SKU.
-
-# #     **TASK:** Identify and return the CHEAPEST **in-stock** offerings for `{searchQuery}` using the search on Google or google.com  from a curated list of Vietnamese retailers, up to the specified `limit`.
-# #             Given a specific {searchQuery} (which is an SKU), identify and return only the single CHEAPEST in-stock offering from a curated list of Vietnamese retailers.
-
-# #     **INSTRUCTIONS:**
-
-# #    1. CRITICAL - SKU Discovery and Categorization: Since the {searchQuery} is an SKU and its category is unknown, you must first perform a Discovery Search to determine the product type.
-# #     * A. Perform a Broad Search: Conduct a general Google search or using search on Google or google.com for the {searchQuery} SKU.
-# #     * B. Analyze Search Results: Look for keywords in the page titles and descriptions of the top results.
-# #     * If you see terms like "Laptop," "Máy tính xách tay," "MacBook," etc. -> Categorize as 'Laptop'.
-# #     * If you see terms like "Server," "Máy chủ," "Workstation," "Máy trạm," etc. -> Categorize as 'Server'.
-# #     * C. Select Retailer List based on Discovery:
-# #     * If categorized as 'Laptop', use this list: FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
-# #     * If categorized as 'Server', use this list: An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA.
-# #     * D. FALLBACK - If Ambiguous: If the Discovery Search is inconclusive or returns mixed results, combine both lists into one master list and search all of them. This ensures you do not miss the product.
-
-# #     2.  **Select Retailer List:** Based on the category determined in Step 1, use one of the following specialized lists:
-# #         *   **If 'Laptop':**
-# #             *   FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
-# #         *   **If 'Server':**
-# #             *   An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA.
-
-# #     3.  **Targeted Google Search:** Use the search on Google or google.com with queries designed to find the lowest prices. Use a variety of terms, such as:
-# #         *   "giá rẻ nhất {searchQuery}" (cheapest price)
-# #         *   "khuyến mãi {searchQuery}" (promotion)
-# #         *   "thanh lý {searchQuery}" (clearance)
-# #         *   "{searchQuery} giá tốt nhất" (best price)
-
-# #     4.  **Wider Data Extraction:** Use the `extract_laptop_server_results_DIRECT` function with an expanded number of results to create a large pool of products for analysis.
-
-# #     5.  **Extract Key Fields:**
-# #         *   ProductName
-# #         *   Brand
-# #         *   SKU
-# #         *   **FinalPriceVND** (Critical)
-# #         *   Retailer
-# #         *   Url
-# #         *   **StockStatus** (Critical)
-# #         *   Category ('Laptop' or 'Server')
-# #         *   ScrapedAt
-
-# #     6.  **Normalize Price Data:** Ensure `FinalPriceVND` is a normalized numerical value (integer or float). This price must be the final, payable amount after any instant discounts are applied.
-
-# #     7.  **Deduplicate:** Remove duplicate entries to ensure there is only one result per unique product model from each distinct retailer.
-
-# #     8.  **CRITICAL - Prioritize and Sort:**
-# #         *   **A. Prioritize In-Stock:** First, filter your collected data to create a primary list containing ONLY products where the `StockStatus` is 'In Stock', 'Available', or a similar positive confirmation.
-# #         *   **B. Sort by Price:** Sort this primary **in-stock** list by `FinalPriceVND` in ascending order.
-# #         *   **C. Fallback for Out-of-Stock:** If, and ONLY if, no in-stock products are found, create a secondary list of out-of-stock items and sort it by `FinalPriceVND` in ascending order.
-
-# #     9.  **Final Output Logic:**
-# #         *   **Return the cheapest available products:** From the sorted list (prioritizing the in-stock list), return the top products up to the specified `{limit}`.
-# #         *   **Handle No Results:** If the search yields zero products from any retailer after extraction, return an empty `products` array.
-
-# #     10. **Format:** The final output MUST be a valid JSON object with a `products` array. This array will contain the cheapest product(s) up to the `{limit}` or be empty.
-# #     """
-#     # task_instruction = f"""
-#     #     You are a specialized and highly efficient scraper for Vietnamese retailers, optimized to find the single cheapest available product.
-
-#     #     **TASK:** Identify and return the CHEAPEST **in-stock** offering for `{searchQuery}` from a curated list of Vietnamese retailers, up to the specified `limit`.
-
-#     #     **CORE STRATEGY: ADAPTIVE SEARCH**
-#     #     Your primary goal is to get product data. Google is a tool for discovery, not a mandatory gate. You must adapt if it fails. Follow this logic:
-
-#     #     **1. Primary Path - Google Discovery (Attempt First):**
-#     #     *   A. **Attempt Discovery:** Perform a quick Google search for the `{searchQuery}` to determine if it's a 'Laptop' or 'Server'.
-#     #     *   B. **CRITICAL - HANDLE FAILURES:** If you are blocked by a **reCAPTCHA**, the search is inconclusive, or Google is otherwise unavailable, **IMMEDIATELY ABANDON THE PRIMARY PATH** and proceed directly to the **Fallback Path (Step 2)**. Do not waste time retrying Google.
-#     #     *   C. **If Successful:**
-#     #         *   **If 'Laptop': Search the following retailers:**
-#     #         *       FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
-#     #         *   **If 'Server': Search the following retailers:**
-#     #         *       An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA
-#     #         *   Proceed to Step 3.
-
-#     #     **2. Fallback Path - Direct Wide Extraction (Use if Step 1 Fails or is Ambiguous):**
-#     #     *   This is your most reliable method and ensures the task completes.
-#     #     *   A. **Combine Lists:** Use the **master combined list** of all retailers (both Laptop and Server).
-#     #     *   B. **Execute Extraction:** 
-#     #         - Directly extract product information for `{searchQuery}` from the combined retailer list.
-#     #         - Collect detailed attributes for each candidate product, including:
-#     #             - `productName`
-#     #             - `sku`
-#     #             - `brand`
-#     #             - `finalPriceVND`
-#     #             - `oldPriceVND` (if available)
-#     #             - `stockStatus` (e.g., "in stock" / "out of stock")
-#     #             - `retailer`
-#     #             - `url`
-#     #         - Normalize all numeric prices to integers in VND.
-#     #         - If multiple results from the same retailer exist, keep the cheapest one.
-#     #     *   C. Proceed to Step 3.
-
-#     #     **Retailer Lists:**
-#     #     *   **Laptop List:** FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
-#     #     *   **Server List:** An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA.
-
-#     #     ---
-#     #     **SHARED INSTRUCTIONS (Follow After Step 1 or 2 is Complete)**
-#     #     ---
-
-#     #     **3. Extract Key Fields:** From the data you collected, extract the following:
-#     #     *   ProductName
-#     #     *   Brand
-#     #     *   SKU
-#     #     *   **FinalPriceVND** (Critical: the final, payable price)
-#     #     *   Retailer
-#     #     *   Url
-#     #     *   **StockStatus** (Critical)
-#     #     *   Category ('Laptop', 'Server', or 'Fallback/Ambiguous')
-#     #     *   ScrapedAt
-
-#     #     **4. Normalize and Deduplicate:**
-#     #     *   Ensure `FinalPriceVND` is a clean numerical value.
-#     #     *   Remove duplicate entries (one result per unique product/SKU from each retailer).
-
-#     #     **5. CRITICAL - Prioritize and Sort:**
-#     #     *   **A. Prioritize In-Stock:** First, filter your data to create a list of ONLY products with a positive `StockStatus` (e.g., 'In Stock', 'Available').
-#     #     *   **B. Sort by Price:** Sort this **in-stock** list by `FinalPriceVND` in ascending order.
-#     #     *   **C. Fallback for Out-of-Stock:** If, AND ONLY IF, no in-stock products are found, use the out-of-stock items and sort them by price as a fallback.
-
-#     #     **6. Final Output Logic:**
-#     #     *   From your sorted list (prioritizing in-stock), return the top products up to the specified `{limit}`.
-#     #     *   If no products are found at all, return an empty `products` array.
-#     #     *   The final output MUST be a valid JSON object with a `products` array.
-#     # """
-#     task_instruction = f"""
-#         You are a meticulous and highly accurate scraping expert for Vietnamese retailers. Your mission is to find the single CHEAPEST **in-stock** offering for `{searchQuery}`, extract its detailed information, and return the top results up to the specified `{limit}`.
-
-#         **CORE MISSION: VISION-FIRST PRICE HUNTING WORKFLOW**
-#         You MUST follow this two-phase process: Phase 1 (Google Reconnaissance) and Phase 2 (Retailer Verification).
-
-#         ---
-#         **PHASE 1: GOOGLE VISION RECONNAISSANCE**
-#         ---
-#         Your first goal is to use Google to build a prioritized list of the cheapest candidate products.
-
-#         *   **A. Execute Vision Tool:** You MUST execute the `vision_google_search_and_extract` tool with the search query `{searchQuery}`. This tool will "look" at the entire Google results page to find products.
-#         *   **B. Collect Preliminary Results:** The tool will return a list of products, each containing `productName`, `priceText`, `url`, and `retailer`.
-#         *   **C. Process and Sort:**
-#             1.  **Clean Prices:** Normalize the `priceText` from each product into a numerical integer value.
-#             2.  **SORT BY PRICE:** Sort this list of products by the cleaned price in **ascending order** (cheapest first).
-#         *   **D. CRITICAL - HANDLE FAILURES:** If the `vision_google_search_and_extract` tool fails (e.g., is blocked by a reCAPTCHA), you must **IMMEDIATELY** switch to the **FALLBACK PLAN** below.
-
-#         ---
-#         **PHASE 2: RETAILER VERIFICATION & DETAILED EXTRACTION**
-#         ---
-#         You now have a sorted list of the most promising candidates. Your goal is to visit each page to get accurate, detailed information.
-
-#         *   **A. Iterate and Extract:** Take the URLs from the sorted list you created in Phase 1 (starting with the cheapest). For **each URL**, you MUST execute the `extract_product_details_from_url` tool.
-#         *   **B. Collect Detailed Information:** For each product, you MUST extract the following specific fields from the retailer's page:
-#             *   `productName` (the full and accurate name)
-#             *   `sku` (the product's SKU or model code)
-#             *   `finalPriceVND` (CRITICAL: the final, payable price)
-#             *   `oldPriceVND` (the original/list price before discounts, if available)
-#             *   `stockStatus` (CRITICAL: must be accurately determined, e.g., "In Stock" / "Out of Stock")
-#             *   `retailer`
-#             *   `url`
-#         *   **C. Collect Until Limit Reached:** Continue this process until you have gathered detailed information for up to `{limit}` products.
-
-#         ---
-#         **FINAL ANALYSIS AND OUTPUT**
-#         ---
-#         Once you have collected enough detailed data, perform the final analysis.
-
-#         *   **1. Prioritize In-Stock:** Filter your final list to keep ONLY the products where `stockStatus` is 'In Stock'.
-#         *   **2. Final Sort:** Sort this 'In Stock' list one last time by `finalPriceVND` in ascending order.
-#         *   **3. Format Output:** Return the top products from the final sorted list, up to the `{limit}`. If no in-stock products are found, return an empty `products` array.
-#         *   **4. CRITICAL - Prioritize and Sort:**
-#             *   **A. Prioritize In-Stock:** First, filter your data to create a list of ONLY products with a positive `StockStatus` (e.g., 'In Stock', 'Available').
-#             *   **B. Sort by Price:** Sort this **in-stock** list by `FinalPriceVND` in ascending order.
-#             *   **C. Fallback for Out-of-Stock:** If, AND ONLY IF, no in-stock products are found, use the out-of-stock items and sort them by price as a fallback.
-#         **5. Final Output Logic:**
-#         *   From your sorted list (prioritizing in-stock), return the top products up to the specified `{limit}`.
-#         *   If no products are found at all, return an empty `products` array.
-#         *   The final output MUST be a valid JSON object with a `products` array.
-
-#         ---
-#         **FALLBACK PLAN (If Phase 1 Fails)**
-#         ---
-#         If Google is blocked, ignore Phase 1 and 2 and proceed directly with this plan:
-#         *   **A. Select Retailer List:** Use the master combined list of both Laptop and Server retailers.
-#         *   **B. Execute `find_product_urls`:** Run this tool to get a list of URLs directly from the retailers.
-#         *   **C. Continue with Phase 2:** Use the list of URLs you just gathered and proceed with the detailed extraction process as described in Phase 2 above.
-#     """
-    # task_instruction = f"""
-    #     You are a master scraping agent, expert in finding the lowest prices at Vietnamese retailers. Your mission is to find the single CHEAPEST **in-stock** offering for `{searchQuery}`, including offers from Google Ads.
-
-    #     **CORE MISSION: TWO-PHASE PRICE HUNTING (Reconnaissance & Verification)**
-    #     You MUST follow this strategic two-phase process. Do not attempt to complete the task in a single step.
-
-    #     ---
-    #     **PHASE 1: GOOGLE RECONNAISSANCE (FIND CANDIDATES)**
-    #     ---
-    #     Your first goal is to build a comprehensive list of all potential product candidates by scanning the entire Google search results page.
-
-    #     *   **A. Execute Google Scan:** You MUST execute the `scan_google_for_products` tool with the search query `{searchQuery}`. This powerful tool is designed to find all product links, including regular results, shopping results, and **Google Ads** ("Quảng cáo" / "Sponsored").
-    #     *   **B. Collect Preliminary Results:** The tool will return a list of candidates. Each candidate will have a preliminary `productName`, `priceText`, and, most importantly, the `url` to the retailer's product page.
-    #     *   **C. Process and Prioritize:**
-    #         1.  **Clean Preliminary Prices:** Normalize the `priceText` from each candidate into a numerical integer.
-    #         2.  **SORT BY CHEAPEST PRICE:** Sort the entire list of candidates by their cleaned price in **ascending order** (cheapest first). This sorted list is your priority queue for the next phase.
-    #     *   **D. CRITICAL - HANDLE FAILURES:** If the `scan_google_for_products` tool fails (e.g., is blocked by a reCAPTCHA, or returns no results), you must **IMMEDIATELY ABANDON GOOGLE** and switch to the **FALLBACK PLAN** below.
-
-    #     ---
-    #     **PHASE 2: RETAILER VERIFICATION (GET ACCURATE DETAILS)**
-    #     ---
-    #     You now have a prioritized list of URLs. Your goal is to visit them to get verified, up-to-date, and detailed information.
-
-    #     *   **A. Iterate and Extract:** Start from the top of your sorted list (the cheapest candidates). For **each URL**, you MUST execute the `extract_product_details_from_url` tool.
-    #     *   **B. Collect Detailed Information:** From each retailer's page, you MUST extract the following specific fields. This data is the "ground truth."
-    #         *   `productName` (the full and accurate name from the retailer)
-    #         *   `sku` (the product's SKU, model, or part number)
-    #         *   `finalPriceVND` (CRITICAL: the final, payable price)
-    #         *   `oldPriceVND` (the original/list price before discounts, if available)
-    #         *   `stockStatus` (CRITICAL: must be accurately determined as "In Stock" or "Out of Stock")
-    #         *   `retailer` (the store name)
-    #         *   `url` (the page you are on)
-    #     *   **C. Collect Strategically:** Continue this process down your list until you have found at least `{limit}` products that are confirmed to be **in stock**.
-
-    #     ---
-    #     **FINAL ANALYSIS AND OUTPUT**
-    #     ---
-    #     After you have collected a sufficient number of detailed, in-stock products, perform the final analysis.
-
-    #     *   **1. Final Filter:** Ensure your collected list contains ONLY products where `stockStatus` is 'In Stock'.
-    #     *   **2. Final Sort:** Sort this final 'in-stock' list one last time by the verified `finalPriceVND` in ascending order.
-    #     *   **3. Format Output:** Return the top products from the final sorted list, up to the specified `{limit}`. If no in-stock products are found after checking all candidates, return an empty `products` array. The output must be a valid JSON object.
-
-    #     ---
-    #     **FALLBACK PLAN (If Google Reconnaissance Fails)**
-    #     ---
-    #     If the `scan_google_for_products` tool is blocked, abandon Phase 1 entirely and execute this robust backup plan:
-    #     *   **A. Select Retailers:** Decide to use the master combined list of all Laptop and Server retailers.
-    #     *   **B. Find URLs Directly:** Use the `find_product_urls_directly_from_retailers` tool. This tool bypasses Google and gets product URLs from each retailer's own search function.
-    #     *   **C. Proceed to Phase 2:** Use the list of URLs you just gathered from the fallback tool and begin the verification and detailed extraction process exactly as described in Phase 2.
-    # """
-    # task_instruction = f"""
-    #     You are a master scraping agent, expert in finding the lowest prices at Vietnamese retailers. Your mission is to find the single CHEAPEST  offering for `{searchQuery}`(which is an SKU). , including offers from Google Ads.
-    #     You are a specialized scraper for Vietnamese e-commerce, optimized to find the single CHEAPEST **in-stock** product for `{searchQuery}` (which is an SKU).  
-    #     You must return the cheapest verified product(s), up to `{limit}`, in valid JSON.
-
-    #     ---
-    #     ## STEP 1: DISCOVERY (Google + Category Classification)
-    #     ---
-
-    #     1. **Primary Path – Google Search (with Ads included):**
-    #     * Run a Google search for `{searchQuery}`.  
-    #     * Inspect page titles, descriptions, and Google Ads results.  
-    #     * Detect category:
-    #         - If keywords include "Laptop", "Máy tính xách tay", "MacBook" → **Laptop**.  
-    #         - If keywords include "Server", "Máy chủ", "Workstation", "Máy trạm" → **Server**.  
-
-    #     2. **Select Retailer List based on Category:**
-    #     * If Laptop → Retailers = FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.  
-    #     * If Server → Retailers = An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA. , Thành Nhân Computer, An Khang Computer, Hitech Pro, Đỉnh Vàng Computer 
-
-    #     3. **Fallback – If Google blocked/inconclusive:**  
-    #     * Use the **Master Combined Retailer List** (Laptop + Server).  
-    #     * Do NOT retry Google if it fails; move forward immediately.
-
-    #     ---
-    #     ## STEP 2: RETRIEVAL & EXTRACTION
-    #     ---
-
-    #     1. **Candidate Collection:**  
-    #     * Run targeted Google queries (include ads):  
-    #         - "giá rẻ nhất {searchQuery}"  
-    #         - "{searchQuery} khuyến mãi"  
-    #         - "{searchQuery} thanh lý"  
-    #         - "{searchQuery} giá tốt nhất"  
-    #     * Use these to collect retailer URLs.  
-
-    #     2. **Detailed Extraction:**  
-    #     * For each candidate URL, extract:  
-    #         - `productName`  
-    #         - `sku`  
-    #         - `brand`  
-    #         - `finalPriceVND` (clean integer, after discounts)  
-    #         - `oldPriceVND` (if available)  
-    #         - `stockStatus` ("In Stock" / "Out of Stock")  
-    #         - `retailer`  
-    #         - `url`  
-    #         - `category` ("Laptop" / "Server")  
-    #         - `scrapedAt`  
-
-    #     ---
-    #     ## STEP 3: CLEANING & DEDUPLICATION
-    #     ---
-
-    #     1. Normalize all `finalPriceVND` → integers in VND.  
-    #     2. Deduplicate: keep only one cheapest entry per SKU per retailer.  
-
-    #     ---
-    #     ## STEP 4: PRIORITIZATION & OUTPUT
-    #     ---
-
-    #     1. Filter to only **In-Stock** items.  
-    #     2. Sort by `finalPriceVND` ascending.  
-    #     3. If no in-stock items → fallback to cheapest out-of-stock.  
-    #     4. Return up to `{limit}` items.  
-
-    #     ---
-    #     ## OUTPUT FORMAT
-    #     ---
-
-    #     Final output MUST be valid JSON:
-
-    #     ```json
-    #     {{
-    #     "products": [
-    #         {{
-    #         "productName": "...",
-    #         "sku": "...",
-    #         "brand": "...",
-    #         "finalPriceVND": 12345678,
-    #         "oldPriceVND": 13500000,
-    #         "stockStatus": "In Stock",
-    #         "retailer": "Phong Vũ",
-    #         "url": "https://...",
-    #         "category": "Laptop",
-    #         "scrapedAt": "2025-08-21T12:34:56Z"
-    #         }}
-    #     ]
-    #     }}
-    #     ```
-    # """
-
-    task_instruction = f"""
-        You are a master scraping agent, expert in finding the **lowest possible prices** at Vietnamese retailers.  
-        Your mission is to find the single **CHEAPEST in-stock offering** for `{searchQuery}` (which is an SKU), including offers from Google Ads and Vietnamese price comparison websites.  
-        You must return the cheapest verified product(s), up to `{limit}`, in valid JSON.
-
-        ---
-        ## STEP 1: DISCOVERY (Google + Category Classification)
-        ---
-
-        1. **Primary Path – Google Search (with Ads included):**
-        * Run a Google search for `{searchQuery}`.  
-        * Inspect page titles, descriptions, Google Ads, and price comparison sites.  
-        * Detect category:
-        - If keywords include "Laptop", "Máy tính xách tay", "MacBook" → **Laptop**.  
-        - If keywords include "Server", "Máy chủ", "Workstation", "Máy trạm" → **Server**.  
-
-        2. **Select Retailer List based on Category:**
-        * **Laptop (Cheap-focused):** FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.  
-        * **Server (Workstation/Enterprise-focused):** An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA, Thành Nhân Computer, An Khang Computer, Hitech Pro, Đỉnh Vàng Computer.  
-
-        3. **Fallback – If Google blocked/inconclusive:**  
-        * Use the **Master Combined Retailer List** (Laptop + Server).  
-        * Do NOT retry Google if it fails; move forward immediately.  
-        4. **CRITICAL - HANDLE FAILURES:** If you are blocked by a **reCAPTCHA**, the search is inconclusive, or Google is otherwise unavailable, **IMMEDIATELY ABANDON THE PRIMARY PATH** and proceed directly to the **Fallback Path (Step 2)**. Do not waste time retrying Google.
-
-        ---
-        ## STEP 2: RETRIEVAL & EXTRACTION
-        ---
-
-        1. **Candidate Collection:**  
-        * Run targeted Google queries (include ads):  
-        - "giá rẻ nhất {searchQuery}"  
-        - "{searchQuery} khuyến mãi"  
-        - "{searchQuery} thanh lý"  
-        - "{searchQuery} giá tốt nhất"  
-        * Collect from:
-        - Retailer websites (based on category list).  
-        - Price comparison platforms (e.g., websosanh.vn, sosanhgia.com, vnsale.vn).  
-
-        2. **Detailed Extraction:**  
-        * For each candidate URL, extract:  
-        - `productName`  
-        - `sku`  
-        - `brand`  
-        - `finalPriceVND` (clean integer, after discounts & coupons applied)  
-        - `oldPriceVND` (if available)  
-        - `stockStatus` ("In Stock" / "Out of Stock")  
-        - `retailer`  
-        - `url`  
-        - `category` ("Laptop" / "Server")  
-        - `scrapedAt`  
-
-        ---
-        ## STEP 3: CLEANING & DEDUPLICATION
-        ---
-
-        1. Normalize all `finalPriceVND` → integers in VND.  
-        2. Deduplicate: keep only one cheapest entry per SKU per retailer.  
-        3. If coupons/discount codes are available, apply them to compute the **lowest final price**.  
-
-        ---
-        ## STEP 4: PRIORITIZATION & OUTPUT
-        ---
-
-        1. Filter to only **In-Stock** items.  
-        2. Sort by `finalPriceVND` **ascending** (lowest price first).  
-        3. If no in-stock items → fallback to cheapest out-of-stock.  
-        4. Return up to `{limit}` items.  
-
-        ---
-        ## OUTPUT FORMAT
-        ---
-
-        Final output MUST be valid JSON, the struceture is as follows:
-
-        {{
-        "products": [
+    # #     task_instruction = f"""
+    # #     You are a specialized and highly efficient scraper for Vietnamese retailers, optimized to find the single cheapest available product based on its SKU.
+
+    # #     **TASK:** Identify and return the CHEAPEST **in-stock** offerings for `{searchQuery}` using the search on Google or google.com  from a curated list of Vietnamese retailers, up to the specified `limit`.
+    # #             Given a specific {searchQuery} (which is an SKU), identify and return only the single CHEAPEST in-stock offering from a curated list of Vietnamese retailers.
+
+    # #     **INSTRUCTIONS:**
+
+    # #    1. CRITICAL - SKU Discovery and Categorization: Since the {searchQuery} is an SKU and its category is unknown, you must first perform a Discovery Search to determine the product type.
+    # #     * A. Perform a Broad Search: Conduct a general Google search or using search on Google or google.com for the {searchQuery} SKU.
+    # #     * B. Analyze Search Results: Look for keywords in the page titles and descriptions of the top results.
+    # #     * If you see terms like "Laptop," "Máy tính xách tay," "MacBook," etc. -> Categorize as 'Laptop'.
+    # #     * If you see terms like "Server," "Máy chủ," "Workstation," "Máy trạm," etc. -> Categorize as 'Server'.
+    # #     * C. Select Retailer List based on Discovery:
+    # #     * If categorized as 'Laptop', use this list: FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
+    # #     * If categorized as 'Server', use this list: An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA.
+    # #     * D. FALLBACK - If Ambiguous: If the Discovery Search is inconclusive or returns mixed results, combine both lists into one master list and search all of them. This ensures you do not miss the product.
+
+    # #     2.  **Select Retailer List:** Based on the category determined in Step 1, use one of the following specialized lists:
+    # #         *   **If 'Laptop':**
+    # #             *   FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
+    # #         *   **If 'Server':**
+    # #             *   An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA.
+
+    # #     3.  **Targeted Google Search:** Use the search on Google or google.com with queries designed to find the lowest prices. Use a variety of terms, such as:
+    # #         *   "giá rẻ nhất {searchQuery}" (cheapest price)
+    # #         *   "khuyến mãi {searchQuery}" (promotion)
+    # #         *   "thanh lý {searchQuery}" (clearance)
+    # #         *   "{searchQuery} giá tốt nhất" (best price)
+
+    # #     4.  **Wider Data Extraction:** Use the `extract_laptop_server_results_DIRECT` function with an expanded number of results to create a large pool of products for analysis.
+
+    # #     5.  **Extract Key Fields:**
+    # #         *   ProductName
+    # #         *   Brand
+    # #         *   SKU
+    # #         *   **FinalPriceVND** (Critical)
+    # #         *   Retailer
+    # #         *   Url
+    # #         *   **StockStatus** (Critical)
+    # #         *   Category ('Laptop' or 'Server')
+    # #         *   ScrapedAt
+
+    # #     6.  **Normalize Price Data:** Ensure `FinalPriceVND` is a normalized numerical value (integer or float). This price must be the final, payable amount after any instant discounts are applied.
+
+    # #     7.  **Deduplicate:** Remove duplicate entries to ensure there is only one result per unique product model from each distinct retailer.
+
+    # #     8.  **CRITICAL - Prioritize and Sort:**
+    # #         *   **A. Prioritize In-Stock:** First, filter your collected data to create a primary list containing ONLY products where the `StockStatus` is 'In Stock', 'Available', or a similar positive confirmation.
+    # #         *   **B. Sort by Price:** Sort this primary **in-stock** list by `FinalPriceVND` in ascending order.
+    # #         *   **C. Fallback for Out-of-Stock:** If, and ONLY if, no in-stock products are found, create a secondary list of out-of-stock items and sort it by `FinalPriceVND` in ascending order.
+
+    # #     9.  **Final Output Logic:**
+    # #         *   **Return the cheapest available products:** From the sorted list (prioritizing the in-stock list), return the top products up to the specified `{limit}`.
+    # #         *   **Handle No Results:** If the search yields zero products from any retailer after extraction, return an empty `products` array.
+
+    # #     10. **Format:** The final output MUST be a valid JSON object with a `products` array. This array will contain the cheapest product(s) up to the `{limit}` or be empty.
+    # #     """
+    #     # task_instruction = f"""
+    #     #     You are a specialized and highly efficient scraper for Vietnamese retailers, optimized to find the single cheapest available product.
+
+    #     #     **TASK:** Identify and return the CHEAPEST **in-stock** offering for `{searchQuery}` from a curated list of Vietnamese retailers, up to the specified `limit`.
+
+    #     #     **CORE STRATEGY: ADAPTIVE SEARCH**
+    #     #     Your primary goal is to get product data. Google is a tool for discovery, not a mandatory gate. You must adapt if it fails. Follow this logic:
+
+    #     #     **1. Primary Path - Google Discovery (Attempt First):**
+    #     #     *   A. **Attempt Discovery:** Perform a quick Google search for the `{searchQuery}` to determine if it's a 'Laptop' or 'Server'.
+    #     #     *   B. **CRITICAL - HANDLE FAILURES:** If you are blocked by a **reCAPTCHA**, the search is inconclusive, or Google is otherwise unavailable, **IMMEDIATELY ABANDON THE PRIMARY PATH** and proceed directly to the **Fallback Path (Step 2)**. Do not waste time retrying Google.
+    #     #     *   C. **If Successful:**
+    #     #         *   **If 'Laptop': Search the following retailers:**
+    #     #         *       FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
+    #     #         *   **If 'Server': Search the following retailers:**
+    #     #         *       An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA
+    #     #         *   Proceed to Step 3.
+
+    #     #     **2. Fallback Path - Direct Wide Extraction (Use if Step 1 Fails or is Ambiguous):**
+    #     #     *   This is your most reliable method and ensures the task completes.
+    #     #     *   A. **Combine Lists:** Use the **master combined list** of all retailers (both Laptop and Server).
+    #     #     *   B. **Execute Extraction:** 
+    #     #         - Directly extract product information for `{searchQuery}` from the combined retailer list.
+    #     #         - Collect detailed attributes for each candidate product, including:
+    #     #             - `productName`
+    #     #             - `sku`
+    #     #             - `brand`
+    #     #             - `finalPriceVND`
+    #     #             - `oldPriceVND` (if available)
+    #     #             - `stockStatus` (e.g., "in stock" / "out of stock")
+    #     #             - `retailer`
+    #     #             - `url`
+    #     #         - Normalize all numeric prices to integers in VND.
+    #     #         - If multiple results from the same retailer exist, keep the cheapest one.
+    #     #     *   C. Proceed to Step 3.
+
+    #     #     **Retailer Lists:**
+    #     #     *   **Laptop List:** FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.
+    #     #     *   **Server List:** An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA.
+
+    #     #     ---
+    #     #     **SHARED INSTRUCTIONS (Follow After Step 1 or 2 is Complete)**
+    #     #     ---
+
+    #     #     **3. Extract Key Fields:** From the data you collected, extract the following:
+    #     #     *   ProductName
+    #     #     *   Brand
+    #     #     *   SKU
+    #     #     *   **FinalPriceVND** (Critical: the final, payable price)
+    #     #     *   Retailer
+    #     #     *   Url
+    #     #     *   **StockStatus** (Critical)
+    #     #     *   Category ('Laptop', 'Server', or 'Fallback/Ambiguous')
+    #     #     *   ScrapedAt
+
+    #     #     **4. Normalize and Deduplicate:**
+    #     #     *   Ensure `FinalPriceVND` is a clean numerical value.
+    #     #     *   Remove duplicate entries (one result per unique product/SKU from each retailer).
+
+    #     #     **5. CRITICAL - Prioritize and Sort:**
+    #     #     *   **A. Prioritize In-Stock:** First, filter your data to create a list of ONLY products with a positive `StockStatus` (e.g., 'In Stock', 'Available').
+    #     #     *   **B. Sort by Price:** Sort this **in-stock** list by `FinalPriceVND` in ascending order.
+    #     #     *   **C. Fallback for Out-of-Stock:** If, AND ONLY IF, no in-stock products are found, use the out-of-stock items and sort them by price as a fallback.
+
+    #     #     **6. Final Output Logic:**
+    #     #     *   From your sorted list (prioritizing in-stock), return the top products up to the specified `{limit}`.
+    #     #     *   If no products are found at all, return an empty `products` array.
+    #     #     *   The final output MUST be a valid JSON object with a `products` array.
+    #     # """
+    #     task_instruction = f"""
+    #         You are a meticulous and highly accurate scraping expert for Vietnamese retailers. Your mission is to find the single CHEAPEST **in-stock** offering for `{searchQuery}`, extract its detailed information, and return the top results up to the specified `{limit}`.
+
+    #         **CORE MISSION: VISION-FIRST PRICE HUNTING WORKFLOW**
+    #         You MUST follow this two-phase process: Phase 1 (Google Reconnaissance) and Phase 2 (Retailer Verification).
+
+    #         ---
+    #         **PHASE 1: GOOGLE VISION RECONNAISSANCE**
+    #         ---
+    #         Your first goal is to use Google to build a prioritized list of the cheapest candidate products.
+
+    #         *   **A. Execute Vision Tool:** You MUST execute the `vision_google_search_and_extract` tool with the search query `{searchQuery}`. This tool will "look" at the entire Google results page to find products.
+    #         *   **B. Collect Preliminary Results:** The tool will return a list of products, each containing `productName`, `priceText`, `url`, and `retailer`.
+    #         *   **C. Process and Sort:**
+    #             1.  **Clean Prices:** Normalize the `priceText` from each product into a numerical integer value.
+    #             2.  **SORT BY PRICE:** Sort this list of products by the cleaned price in **ascending order** (cheapest first).
+    #         *   **D. CRITICAL - HANDLE FAILURES:** If the `vision_google_search_and_extract` tool fails (e.g., is blocked by a reCAPTCHA), you must **IMMEDIATELY** switch to the **FALLBACK PLAN** below.
+
+    #         ---
+    #         **PHASE 2: RETAILER VERIFICATION & DETAILED EXTRACTION**
+    #         ---
+    #         You now have a sorted list of the most promising candidates. Your goal is to visit each page to get accurate, detailed information.
+
+    #         *   **A. Iterate and Extract:** Take the URLs from the sorted list you created in Phase 1 (starting with the cheapest). For **each URL**, you MUST execute the `extract_product_details_from_url` tool.
+    #         *   **B. Collect Detailed Information:** For each product, you MUST extract the following specific fields from the retailer's page:
+    #             *   `productName` (the full and accurate name)
+    #             *   `sku` (the product's SKU or model code)
+    #             *   `finalPriceVND` (CRITICAL: the final, payable price)
+    #             *   `oldPriceVND` (the original/list price before discounts, if available)
+    #             *   `stockStatus` (CRITICAL: must be accurately determined, e.g., "In Stock" / "Out of Stock")
+    #             *   `retailer`
+    #             *   `url`
+    #         *   **C. Collect Until Limit Reached:** Continue this process until you have gathered detailed information for up to `{limit}` products.
+
+    #         ---
+    #         **FINAL ANALYSIS AND OUTPUT**
+    #         ---
+    #         Once you have collected enough detailed data, perform the final analysis.
+
+    #         *   **1. Prioritize In-Stock:** Filter your final list to keep ONLY the products where `stockStatus` is 'In Stock'.
+    #         *   **2. Final Sort:** Sort this 'In Stock' list one last time by `finalPriceVND` in ascending order.
+    #         *   **3. Format Output:** Return the top products from the final sorted list, up to the `{limit}`. If no in-stock products are found, return an empty `products` array.
+    #         *   **4. CRITICAL - Prioritize and Sort:**
+    #             *   **A. Prioritize In-Stock:** First, filter your data to create a list of ONLY products with a positive `StockStatus` (e.g., 'In Stock', 'Available').
+    #             *   **B. Sort by Price:** Sort this **in-stock** list by `FinalPriceVND` in ascending order.
+    #             *   **C. Fallback for Out-of-Stock:** If, AND ONLY IF, no in-stock products are found, use the out-of-stock items and sort them by price as a fallback.
+    #         **5. Final Output Logic:**
+    #         *   From your sorted list (prioritizing in-stock), return the top products up to the specified `{limit}`.
+    #         *   If no products are found at all, return an empty `products` array.
+    #         *   The final output MUST be a valid JSON object with a `products` array.
+
+    #         ---
+    #         **FALLBACK PLAN (If Phase 1 Fails)**
+    #         ---
+    #         If Google is blocked, ignore Phase 1 and 2 and proceed directly with this plan:
+    #         *   **A. Select Retailer List:** Use the master combined list of both Laptop and Server retailers.
+    #         *   **B. Execute `find_product_urls`:** Run this tool to get a list of URLs directly from the retailers.
+    #         *   **C. Continue with Phase 2:** Use the list of URLs you just gathered and proceed with the detailed extraction process as described in Phase 2 above.
+    #     """
+        # task_instruction = f"""
+        #     You are a master scraping agent, expert in finding the lowest prices at Vietnamese retailers. Your mission is to find the single CHEAPEST **in-stock** offering for `{searchQuery}`, including offers from Google Ads.
+
+        #     **CORE MISSION: TWO-PHASE PRICE HUNTING (Reconnaissance & Verification)**
+        #     You MUST follow this strategic two-phase process. Do not attempt to complete the task in a single step.
+
+        #     ---
+        #     **PHASE 1: GOOGLE RECONNAISSANCE (FIND CANDIDATES)**
+        #     ---
+        #     Your first goal is to build a comprehensive list of all potential product candidates by scanning the entire Google search results page.
+
+        #     *   **A. Execute Google Scan:** You MUST execute the `scan_google_for_products` tool with the search query `{searchQuery}`. This powerful tool is designed to find all product links, including regular results, shopping results, and **Google Ads** ("Quảng cáo" / "Sponsored").
+        #     *   **B. Collect Preliminary Results:** The tool will return a list of candidates. Each candidate will have a preliminary `productName`, `priceText`, and, most importantly, the `url` to the retailer's product page.
+        #     *   **C. Process and Prioritize:**
+        #         1.  **Clean Preliminary Prices:** Normalize the `priceText` from each candidate into a numerical integer.
+        #         2.  **SORT BY CHEAPEST PRICE:** Sort the entire list of candidates by their cleaned price in **ascending order** (cheapest first). This sorted list is your priority queue for the next phase.
+        #     *   **D. CRITICAL - HANDLE FAILURES:** If the `scan_google_for_products` tool fails (e.g., is blocked by a reCAPTCHA, or returns no results), you must **IMMEDIATELY ABANDON GOOGLE** and switch to the **FALLBACK PLAN** below.
+
+        #     ---
+        #     **PHASE 2: RETAILER VERIFICATION (GET ACCURATE DETAILS)**
+        #     ---
+        #     You now have a prioritized list of URLs. Your goal is to visit them to get verified, up-to-date, and detailed information.
+
+        #     *   **A. Iterate and Extract:** Start from the top of your sorted list (the cheapest candidates). For **each URL**, you MUST execute the `extract_product_details_from_url` tool.
+        #     *   **B. Collect Detailed Information:** From each retailer's page, you MUST extract the following specific fields. This data is the "ground truth."
+        #         *   `productName` (the full and accurate name from the retailer)
+        #         *   `sku` (the product's SKU, model, or part number)
+        #         *   `finalPriceVND` (CRITICAL: the final, payable price)
+        #         *   `oldPriceVND` (the original/list price before discounts, if available)
+        #         *   `stockStatus` (CRITICAL: must be accurately determined as "In Stock" or "Out of Stock")
+        #         *   `retailer` (the store name)
+        #         *   `url` (the page you are on)
+        #     *   **C. Collect Strategically:** Continue this process down your list until you have found at least `{limit}` products that are confirmed to be **in stock**.
+
+        #     ---
+        #     **FINAL ANALYSIS AND OUTPUT**
+        #     ---
+        #     After you have collected a sufficient number of detailed, in-stock products, perform the final analysis.
+
+        #     *   **1. Final Filter:** Ensure your collected list contains ONLY products where `stockStatus` is 'In Stock'.
+        #     *   **2. Final Sort:** Sort this final 'in-stock' list one last time by the verified `finalPriceVND` in ascending order.
+        #     *   **3. Format Output:** Return the top products from the final sorted list, up to the specified `{limit}`. If no in-stock products are found after checking all candidates, return an empty `products` array. The output must be a valid JSON object.
+
+        #     ---
+        #     **FALLBACK PLAN (If Google Reconnaissance Fails)**
+        #     ---
+        #     If the `scan_google_for_products` tool is blocked, abandon Phase 1 entirely and execute this robust backup plan:
+        #     *   **A. Select Retailers:** Decide to use the master combined list of all Laptop and Server retailers.
+        #     *   **B. Find URLs Directly:** Use the `find_product_urls_directly_from_retailers` tool. This tool bypasses Google and gets product URLs from each retailer's own search function.
+        #     *   **C. Proceed to Phase 2:** Use the list of URLs you just gathered from the fallback tool and begin the verification and detailed extraction process exactly as described in Phase 2.
+        # """
+        # task_instruction = f"""
+        #     You are a master scraping agent, expert in finding the lowest prices at Vietnamese retailers. Your mission is to find the single CHEAPEST  offering for `{searchQuery}`(which is an SKU). , including offers from Google Ads.
+        #     You are a specialized scraper for Vietnamese e-commerce, optimized to find the single CHEAPEST **in-stock** product for `{searchQuery}` (which is an SKU).  
+        #     You must return the cheapest verified product(s), up to `{limit}`, in valid JSON.
+
+        #     ---
+        #     ## STEP 1: DISCOVERY (Google + Category Classification)
+        #     ---
+
+        #     1. **Primary Path – Google Search (with Ads included):**
+        #     * Run a Google search for `{searchQuery}`.  
+        #     * Inspect page titles, descriptions, and Google Ads results.  
+        #     * Detect category:
+        #         - If keywords include "Laptop", "Máy tính xách tay", "MacBook" → **Laptop**.  
+        #         - If keywords include "Server", "Máy chủ", "Workstation", "Máy trạm" → **Server**.  
+
+        #     2. **Select Retailer List based on Category:**
+        #     * If Laptop → Retailers = FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.  
+        #     * If Server → Retailers = An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA. , Thành Nhân Computer, An Khang Computer, Hitech Pro, Đỉnh Vàng Computer 
+
+        #     3. **Fallback – If Google blocked/inconclusive:**  
+        #     * Use the **Master Combined Retailer List** (Laptop + Server).  
+        #     * Do NOT retry Google if it fails; move forward immediately.
+
+        #     ---
+        #     ## STEP 2: RETRIEVAL & EXTRACTION
+        #     ---
+
+        #     1. **Candidate Collection:**  
+        #     * Run targeted Google queries (include ads):  
+        #         - "giá rẻ nhất {searchQuery}"  
+        #         - "{searchQuery} khuyến mãi"  
+        #         - "{searchQuery} thanh lý"  
+        #         - "{searchQuery} giá tốt nhất"  
+        #     * Use these to collect retailer URLs.  
+
+        #     2. **Detailed Extraction:**  
+        #     * For each candidate URL, extract:  
+        #         - `productName`  
+        #         - `sku`  
+        #         - `brand`  
+        #         - `finalPriceVND` (clean integer, after discounts)  
+        #         - `oldPriceVND` (if available)  
+        #         - `stockStatus` ("In Stock" / "Out of Stock")  
+        #         - `retailer`  
+        #         - `url`  
+        #         - `category` ("Laptop" / "Server")  
+        #         - `scrapedAt`  
+
+        #     ---
+        #     ## STEP 3: CLEANING & DEDUPLICATION
+        #     ---
+
+        #     1. Normalize all `finalPriceVND` → integers in VND.  
+        #     2. Deduplicate: keep only one cheapest entry per SKU per retailer.  
+
+        #     ---
+        #     ## STEP 4: PRIORITIZATION & OUTPUT
+        #     ---
+
+        #     1. Filter to only **In-Stock** items.  
+        #     2. Sort by `finalPriceVND` ascending.  
+        #     3. If no in-stock items → fallback to cheapest out-of-stock.  
+        #     4. Return up to `{limit}` items.  
+
+        #     ---
+        #     ## OUTPUT FORMAT
+        #     ---
+
+        #     Final output MUST be valid JSON:
+
+        #     ```json
+        #     {{
+        #     "products": [
+        #         {{
+        #         "productName": "...",
+        #         "sku": "...",
+        #         "brand": "...",
+        #         "finalPriceVND": 12345678,
+        #         "oldPriceVND": 13500000,
+        #         "stockStatus": "In Stock",
+        #         "retailer": "Phong Vũ",
+        #         "url": "https://...",
+        #         "category": "Laptop",
+        #         "scrapedAt": "2025-08-21T12:34:56Z"
+        #         }}
+        #     ]
+        #     }}
+        #     ```
+        # """
+
+        task_instruction = f"""
+            You are a master scraping agent, expert in finding the **lowest possible prices** at Vietnamese retailers.  
+            Your mission is to find the single **CHEAPEST in-stock offering** for `{searchQuery}` (which is an SKU), including offers from Google Ads and Vietnamese price comparison websites.  
+            You must return the cheapest verified product(s), up to `{limit}`, in valid JSON.
+            {known_urls_instruction}
+            ---
+            ## STEP 1: DISCOVERY (Google + Category Classification)
+            ---
+
+            1. **Primary Path – Google Search (with Ads included):**
+            * Run a Google search for `{searchQuery}`.  
+            * Inspect page titles, descriptions, Google Ads, and price comparison sites.  
+            * Detect category:
+            - If keywords include "Laptop", "Máy tính xách tay", "MacBook" → **Laptop**.  
+            - If keywords include "Server", "Máy chủ", "Workstation", "Máy trạm" → **Server**.  
+
+            2. **Select Retailer List based on Category:**
+            * **Laptop (Cheap-focused):** FPT Shop, Thế Giới Di Động, CellphoneS, Hoàng Hà Mobile, Phong Vũ, GearVN, An Phát PC, Phúc Anh, Nguyễn Kim, MediaMart, Điện Máy Xanh, Viettel Store.  
+            * **Server (Workstation/Enterprise-focused):** An Phát PC, Phúc Anh, Phong Vũ, Máy Chủ Việt, Thế Giới Máy Chủ, Việt Nam Server, KDATA, Thành Nhân Computer, An Khang Computer, Hitech Pro, Đỉnh Vàng Computer.  
+
+            3. **Fallback – If Google blocked/inconclusive:**  
+            * Use the **Master Combined Retailer List** (Laptop + Server).  
+            * Do NOT retry Google if it fails; move forward immediately.  
+            4. **CRITICAL - HANDLE FAILURES:** If you are blocked by a **reCAPTCHA**, the search is inconclusive, or Google is otherwise unavailable, **IMMEDIATELY ABANDON THE PRIMARY PATH** and proceed directly to the **Fallback Path (Step 2)**. Do not waste time retrying Google.
+
+            ---
+            ## STEP 2: RETRIEVAL & EXTRACTION
+            ---
+
+            1. **Candidate Collection:**  
+            * Call `scan_google_for_products` once with `{searchQuery}`. It already runs the targeted
+            queries ("giá rẻ nhất", "khuyến mãi", "thanh lý", "giá tốt nhất", including ads) and
+            returns their merged candidates; do not repeat these searches by hand. If Google is
+            blocked it searches the retailers directly and says so in `source`; use those URLs.  
+            * If an action reports that a site is blocked, do not retry it; continue with the next retailer.  
+            * Collect from:
+            - Retailer websites (based on category list).  
+            - Price comparison platforms (e.g., websosanh.vn, sosanhgia.com, vnsale.vn).  
+
+            2. **Detailed Extraction:**  
+            * For each candidate URL, extract:  
+            - `productName`  
+            - `sku`  
+            - `brand`  
+            - `finalPriceVND` (clean integer, after discounts & coupons applied)  
+            - `oldPriceVND` (if available)  
+            - `stockStatus` ("In Stock" / "Out of Stock")  
+            - `retailer`  
+            - `url`  
+            - `category` ("Laptop" / "Server")  
+
+            ---
+            ## STEP 3: CLEANING & DEDUPLICATION
+            ---
+
+            1. Normalize all `finalPriceVND` → integers in VND.  
+            2. Deduplicate: keep only one cheapest entry per SKU per retailer.  
+            3. If coupons/discount codes are available, apply them to compute the **lowest final price**.  
+
+            ---
+            ## STEP 4: PRIORITIZATION & OUTPUT
+            ---
+
+            1. Filter to only **In-Stock** items.  
+            2. Sort by `finalPriceVND` **ascending** (lowest price first).  
+            3. If no in-stock items → fallback to cheapest out-of-stock.  
+            4. Return up to `{limit}` items.  
+
+            ---
+            ## OUTPUT FORMAT
+            ---
+
+            Return the final result through the `done` action using the structured `products` schema:
+
             {{
-            "productName": "...",
-            "sku": "...",
-            "brand": "...",
-            "finalPriceVND": 12345678,
-            "oldPriceVND": 13500000,
-            "stockStatus": "In Stock",
-            "retailer": "Phong Vũ",
-            "url": "https://...",
-            "category": "Laptop",
-            "scrapedAt": "2025-08-21T12:34:56Z"
+            "products": [
+                {{
+                "productName": "...",
+                "sku": "...",
+                "brand": "...",
+                "finalPriceVND": 12345678,
+                "oldPriceVND": 13500000,
+                "stockStatus": "In Stock",
+                "retailer": "Phong Vũ",
+                "url": "https://...",
+                "category": "Laptop"
+                }}
+            ]
             }}
-        ]
-        }}
-    
-    -  Do NOT wrap the JSON in ```json or any markdown.  
-     - Do NOT output comments, explanations, or empty values.  
-     - Output must be **clean JSON string only**.
-     Create the agent with the browser, LLM, task instruction, and controller
 
-    """
+         - `finalPriceVND` and `oldPriceVND` must be plain integers.
+         - Do NOT output comments, explanations, or empty values.
+
+        """
     
    
 
-    agent = Agent(
-        browser=browser,
-        llm=llm,
-        task=task_instruction,
-        controller=controller,
-        use_vision= True
-    )
+        def report_step(browser_state, agent_output, step_number):
+            current_state = getattr(agent_output, "current_state", None)
+            emit_scrape_event(
+                "step",
+                step=step_number,
+                url=getattr(browser_state, "url", None),
+                title=getattr(browser_state, "title", None),
+                goal=getattr(current_state, "next_goal", None),
+            )
+
+        agent = Agent(
+            browser=browser,
+            llm=llm,
+            task=task_instruction,
+            controller=get_controller(),
+            output_model_schema=ScrapedProductList,
+            use_vision= True,
+            register_new_step_callback=report_step if on_event else None
+        )
 
-    try:
         # 1. Run the agent to get the result
         print("Running the agent...")
-        agent_result = await agent.run()
+        with span("agent_run", searchQuery=searchQuery):
+            agent_result = await agent.run()
+        # LLM token usage and per-step durations
+        record_agent_history(agent_result)
         raw_result = agent_result.final_result() # Get the raw output
 
         print("\nRAW AGENT RESULT:")
         print(f"Agent Result: {raw_result}")
         print("-" * 30)
 
-        # --- JSON Parsing Block ---
-        # This block ensures 'data' is always a dictionary, regardless of raw_result type.
-        data = {}
-        if isinstance(raw_result, str) and raw_result:
-            try:
-                print("Result is a string. Parsing from JSON...")
-                data = json.loads(raw_result)
-            except json.JSONDecodeError as e:
-                print(f"Critical Error: Agent result is not a valid JSON string. Cannot process. Error: {e}")
-                raise  # Stop execution if JSON is invalid
-        elif isinstance(raw_result, dict):
-            # If it's already a dictionary, we can use it directly
-            print("Result is already a dictionary/object.")
-            data = raw_result
-        else:
-            print("Result is not a valid format (string or dictionary). Cannot save.")
-            # We can raise an error or just let it finish without saving
-            raise TypeError("Agent result is not a processable type.")
-        
-        # --- CORRECTLY INDENTED FILE SAVING LOGIC STARTS HERE ---
-        # This code is now OUTSIDE the 'else' block and will run after 'data' is prepared.
+        # --- Structured Output Parsing Block ---
+        # The agent is constrained to ScrapedProductList; json_repair salvages anything malformed.
+        with span("parse"):
+            parsed = parse_agent_products(raw_result)
+        data = parsed.model_dump()
+        products = mark_unchanged_offers(data['products'], _extracted_offers.get())
+        # The scrape time is the server's, stamped once for all offers of the call: the
+        # model's scrapedAt is not trusted (it copies the example date from prompts)
+        scraped_at = datetime.utcnow().isoformat() + "Z"
+        for product in products:
+            product["scrapedAt"] = scraped_at
+        print(f"Parsed {len(products)} products from the agent result.")
+
+        # Feed the SKU-to-URL index so the next run can go straight to extraction
+        verified = [
+            {"url": p['url'], "retailer": p.get('retailer') or retailer_from_url(p['url'])}
+            for p in products if p.get('url')
+        ]
+        with span("sku_index_write"):
+            record_sku_urls(index_db, searchQuery, verified, source="agent", confidence=0.9)
+            demote_sku_urls(index_db, searchQuery, set(known_urls) - {v['url'] for v in verified})
         
-        # 2. Define and create the output directory
-        output_dir = "output"
-        os.makedirs(output_dir, exist_ok=True)
-        print(f"Output directory '{output_dir}' is ready.")
-
-        # Generate a timestamp for unique filenames
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-
-        # 3. Save the parsed data to a JSON file (full result)
-        json_filepath = os.path.join(output_dir, f"agent_output_{timestamp}.json")
-        try:
-            with open(json_filepath, 'w', encoding='utf-8') as json_file:
-                json.dump(data, json_file, ensure_ascii=False, indent=4)
-            print(f"Successfully saved full result to JSON: {json_filepath}")
-        except Exception as e:
-            print(f"Error saving to JSON: {e}")
-
-        # Save only the extracted products list to JSON
-        json_products_filepath = os.path.join(output_dir, f"agent_products_{timestamp}.json")
+        # 2. Append the offers to the result log (one JSON line per offer) and buffer
+        # them for the columnar offer store (Parquet, written at the end of the job)
         try:
-            if 'products' in data and isinstance(data['products'], list):
-                products_to_save = data['products']
-                with open(json_products_filepath, 'w', encoding='utf-8') as json_file:
-                    json.dump(products_to_save, json_file, ensure_ascii=False, indent=4)
-                print(f"Successfully saved EXTRACTED product list to JSON: {json_products_filepath}")
-            else:
-                print("ℹNo 'products' key found in the result. JSON file will not be created.")
-        except Exception as e:
-            print(f"Error saving extracted data to JSON: {e}")
-
-        # 4. Extract product data and save it to a CSV file
-        csv_filepath = os.path.join(output_dir, f"products_output_{timestamp}.csv")
+            with span("result_log_write"):
+                get_result_sink().append(products, search_query=searchQuery)
+        except OSError as e:
+            print(f"Error appending to the result log: {e}")
         try:
-            if 'products' in data and isinstance(data['products'], list) and data['products']:
-                products_data = data['products']
-                headers = products_data[0].keys()
-                with open(csv_filepath, 'w', newline='', encoding='utf-8') as csv_file:
-                    writer = csv.DictWriter(csv_file, fieldnames=headers)
-                    writer.writeheader()
-                    writer.writerows(products_data)
-                print(f"Successfully saved product data to CSV: {csv_filepath}")
-            else:
-                print("ℹNo product data found in the parsed result to write to CSV.")
+            with span("offer_store_write"):
+                get_offer_buffer().add(products, search_query=searchQuery)
+        except ImportError as e:
+            print(f"{e}. Offers are kept in the result log only.")
         except Exception as e:
-            print(f"Error saving to CSV: {e}")
+            print(f"Error saving to the offer store: {e}")
 
     except Exception as e:
         # This will catch any errors, including from parsing or file saving
         print(f"\nAn error occurred during the process: {e}")
+        error = str(e)
+        # Jobs must tell a failed scrape from one that found nothing
+        if raise_errors:
+            raise ScrapeError(error) from e
 
     finally:
         # 5. This block ensures the browser is always closed safely
         print("-" * 30)
-        print("Stopping browser...")
-        await browser.stop()
-        print("Browser stopped. Process finished.")
+        if owns_browser and browser is not None:
+            print("Stopping browser...")
+            await browser.stop()
+            print("Browser stopped. Process finished.")
+        if index_db is not None:
+            index_db.close()
+        status = "error" if error else ("success" if products else "empty")
+        scrapes_total.inc(status=status)
+        offers_total.inc(len(products))
+        emit_scrape_event("summary", searchQuery=searchQuery, status=status, count=len(products),
+                          products=products, error=error)
+        if sink_token is not None:
+            _scrape_event_sink.reset(sink_token)
+        _extracted_offers.reset(extracted_token)
+
+    return products
 
 # --- FIX ENDS HERE ---
         
@@ -894,26 +1135,157 @@ async def scrape_product_data(searchQuery: list, limit: int) -> list[ProductCrea
 #         db.close()
 #         print("\n--- Price Update Job Scraped ---")
 
-async def run_price_update_job():
+def aggregate_cheapest_prices(products: Iterable[Dict[str, Any]],
+                              resolve: Callable[[Dict[str, Any]], str | None] | None = None) -> Dict[str, float]:
+    """
+    Finds the cheapest valid 'finalPriceVND' for each 'sku' in a list of offers.
+    Offers with a missing SKU or a non-numeric price are skipped.
+
+    Args:
+        products: The offers.
+        resolve: Maps an offer to its catalog SKU (e.g. SkuAliasMap.resolve_offer);
+            offers it cannot map keep their own 'sku'.
+    """
+    cheapest_prices_per_sku = {}
+    for product in products:
+        sku = (resolve(product) if resolve else None) or product.get('sku')
+        price = product.get('finalPriceVND')
+
+        # Basic data validation
+        if sku and price is not None and isinstance(price, (int, float)):
+            if sku not in cheapest_prices_per_sku or price < cheapest_prices_per_sku[sku]:
+                cheapest_prices_per_sku[sku] = price
+        else:
+            print(f" FILE: Skipping product due to missing/invalid 'sku' or 'finalPriceVND': {product}")
+    return cheapest_prices_per_sku
+
+def latest_offers_per_retailer(products: Iterable[Dict[str, Any]],
+                               resolve: Callable[[Dict[str, Any]], str | None] | None = None,
+                               since: datetime | None = None) -> List[Dict[str, Any]]:
+    """
+    Keeps the most recent offer of each (catalog SKU, retailer) pair, so that
+    prices a retailer has since raised are not picked up again. Offers are
+    ordered by 'loggedAt', the server time stamped by the result sink, and by
+    position (later wins) when it is missing, as in an append-only result log.
+
+    Args:
+        products: The offers, oldest first.
+        resolve: Maps an offer to its catalog SKU (see aggregate_cheapest_prices).
+        since (datetime): Offers logged before this (naive UTC) are dropped, and
+            so are offers without a 'loggedAt', whose age is unknown.
+    """
+    latest: Dict[Tuple[str, str], Tuple[datetime | None, Dict[str, Any]]] = {}
+    for product in products:
+        sku = (resolve(product) if resolve else None) or product.get('sku')
+        if not sku:
+            continue
+        logged_at = parse_scraped_at(product.get('loggedAt'))
+        logged_at = logged_at.replace(tzinfo=None) if logged_at else None
+        if since is not None and (logged_at is None or logged_at < since):
+            continue
+        key = (sku, product.get('retailer') or product.get('url') or '')
+        previous = latest.get(key)
+        if previous is None or previous[0] is None or logged_at is None or logged_at >= previous[0]:
+            latest[key] = (logged_at, product)
+    return [product for _, product in latest.values()]
+
+def offers_for_sku(sku: str, products: List[Dict[str, Any]] | None, sku_aliases: SkuAliasMap) -> List[Dict[str, Any]]:
+    """
+    Keeps the offers of a scrape that are the searched catalog SKU, resolved
+    through the alias map: a known spelling of the SKU, or the SKU's code in
+    the title or URL, in which case the offer's spelling is learned as an
+    alias (persist it with sku_aliases.save). Offers of other products the
+    agent picked up are dropped. The kept offers carry the SKU as 'searchQuery'.
+    """
+    target = SkuIdMap.normalize(sku)
+    kept = []
+    for product in products or []:
+        offer = {**product, "searchQuery": product.get("searchQuery") or sku}
+        if SkuIdMap.normalize(sku_aliases.resolve_offer(offer) or "") == target:
+            kept.append(offer)
+    if len(kept) < len(products or []):
+        print(f"SKU ALIAS: Dropped {len(products) - len(kept)} offers for SKU {sku} that are another product.")
+    return kept
+
+def select_offers_to_write(products: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Splits the offers of one scraped SKU into those to append to the price
+    history (the changed ones) and those to take the cheapest price from (all
+    of them, unless none changed since the last fetch, in which case the
+    stored price is already current and nothing is written).
+
+    Returns:
+        (history_offers, price_offers)
+    """
+    changed = [product for product in products or [] if not product.get('unchanged')]
+    return changed, (list(products) if changed else [])
+
+async def run_price_update_job(sales_ranks: Dict[str, int] | None = None, workers: int = WORKER_PROCESSES,
+                               updated_before: datetime | None = None):
     """
     Orchestrates fetching active SKUs, scraping prices for each one,
     and updating the database sequentially.
+
+    SKUs are read from the catalog page by page (SKU_PAGE_SIZE, keyset
+    pagination), so the catalog is never loaded at once. The due SKUs of every
+    page are ranked by business value (sales rank, margin, time since the last
+    successful scrape, manual boost) into one bounded queue that keeps the
+    CRAWL_BUDGET_PER_RUN most valuable SKUs of the whole catalog; those are
+    then processed, most valuable first. Progress is checkpointed per SKU in
+    the run ledger; a restarted job resumes the unfinished run and skips SKUs
+    completed within RUN_WINDOW_HOURS.
+
+    With workers > 1 the selected SKUs are processed in batches of
+    SKU_PAGE_SIZE, sharded by hash across that many processes, each with its
+    own browser pool, and prices are written in one bulk update per batch.
+
+    Args:
+        sales_ranks (Dict[str, int]): Optional sales rank per SKU (1 = best seller).
+        workers (int): Number of worker processes; 1 scrapes sequentially in-process.
+        updated_before (datetime): Only products whose UpdatedOnUtc is older than this.
     """
     print("\n--- Starting Price Update Job ---")
     db: Session = next(get_db()) # Get a database session
+    schedule_db: Session = next(get_local_db())
 
     try:
-        # 1. Get all active SKUs from your database
-        # The function `get_all_skus` is already correctly filtered for Published=1, Deleted=0.
-        skus_to_update = get_all_skus(db)
-        if not skus_to_update:
-            print("No active SKUs to process. Exiting job.")
+        # Sku index and price history table; then updates are keyed by primary key via the SKU map
+        await run_db_sync(run_startup_checks, db)
+        sku_map = SkuIdMap()
+        await run_db_sync(sku_map.refresh, db)
+        # Scraped SKUs are mapped to catalog SKUs ("N5I5101W1-Black" -> "N5I5101W1")
+        sku_aliases = SkuAliasMap().load(schedule_db, sku_map.skus())
+
+        # Resume an interrupted run: skip completed SKUs and those out of attempts
+        run = start_or_resume_run(schedule_db, window_hours=RUN_WINDOW_HOURS)
+        skip_skus = get_completed_skus(schedule_db, window_hours=RUN_WINDOW_HOURS) | get_exhausted_skus(schedule_db, run.id, max_attempts=MAX_SKU_ATTEMPTS)
+        if skip_skus:
+            print(f"LEDGER: Skipping {len(skip_skus)} SKUs already completed or out of attempts.")
+
+        # 1. Stream the active SKUs (Published=1, Deleted=0) from the database, one page at a time,
+        #    keeping the most valuable due SKUs of the whole catalog within the crawl budget
+        sku_queue = SkuPriorityQueue(capacity=CRAWL_BUDGET_PER_RUN)
+        async for page in iter_sku_pages_async(db, page_size=SKU_PAGE_SIZE, updated_before=updated_before):
+            page = [sku for sku in page if sku not in skip_skus]
+            # Only SKUs whose volatility-based recrawl time has come
+            due_skus = select_due_skus(schedule_db, page, budget=None)
+            if due_skus:
+                build_sku_priority_queue(schedule_db, due_skus, sales_ranks=sales_ranks,
+                                         margins=await get_sku_margins_async(db, due_skus), queue=sku_queue)
+        selected_skus = list(sku_queue.drain())
+        print(f"\nFound {len(selected_skus)} SKUs to process within a budget of {CRAWL_BUDGET_PER_RUN}.")
+
+        if workers > 1:
+            for start in range(0, len(selected_skus), SKU_PAGE_SIZE):
+                batch = selected_skus[start:start + SKU_PAGE_SIZE]
+                with span("sharded_batch", skus=len(batch), workers=workers):
+                    await run_sharded_price_update(db, schedule_db, run.id, batch, workers=workers, sku_map=sku_map,
+                                                   sku_aliases=sku_aliases)
+            finish_run(schedule_db, run.id)
             return
 
-        print(f"\nFound {len(skus_to_update)} SKUs to process. Starting loop...")
-
         # 2. Loop through each SKU, scrape its data, and update the DB one by one
-        for sku in skus_to_update:
+        for sku in selected_skus:
             print(f"\n--- Processing SKU: {sku} ---")
             
             # try:
@@ -966,42 +1338,62 @@ async def run_price_update_job():
             # ... (your existing code)
             try:
                 # Scrape function returns a list of products
-                cheapest_prices_per_sku = {}
-                scraped_products = await scrape_product_data(searchQuery=sku, limit=4)
+                mark_sku_started(schedule_db, run.id, sku)
+                scraped_products = await scrape_product_data(searchQuery=sku, limit=4, raise_errors=True)
+                # Only offers of the searched product count
+                scraped_products = offers_for_sku(sku, scraped_products, sku_aliases)
+                sku_aliases.save(schedule_db)
+                record_sku_observation(schedule_db, sku, scraped_products)
+                # Pages whose price did not change since the last fetch need no writes
+                history_offers, price_offers = select_offers_to_write(scraped_products)
+                # Every changed offer goes to the price history, not just the cheapest one
+                if history_offers:
+                    try:
+                        with span("price_history_write", sku=sku):
+                            await insert_price_history_async(db, sku, history_offers, raise_errors=True)
+                    except Exception as e:
+                        # The span counted it in scraper_errors_total; the current price is still updated
+                        logger.error(f"Price history write failed for SKU {sku}; updating the current price only. Error: {e}")
                 
                 # ---- FIX: Add a check for None before iterating ----
-                if scraped_products:
-                    for product in scraped_products:
-                        sku_from_product = product.get('sku')
-                        price = product.get('finalPriceVND')
-
-                        # Basic data validation
-                        if sku_from_product and price is not None and isinstance(price, (int, float)):
-                            if sku_from_product not in cheapest_prices_per_sku or price < cheapest_prices_per_sku[sku_from_product]:
-                                cheapest_prices_per_sku[sku_from_product] = price
-                        else:
-                            print(f" FILE: Skipping product due to missing/invalid 'sku' or 'finalPriceVND': {product}")
+                if price_offers:
+                    cheapest_prices_per_sku = aggregate_cheapest_prices(price_offers, resolve=sku_aliases.resolve_offer)
+                elif scraped_products:
+                    cheapest_prices_per_sku = {}
+                    print(f"All offers for SKU {sku} are unchanged since the last fetch. Skipping update.")
                 else:
+                    cheapest_prices_per_sku = {}
                     print(f"Scraping returned no results for SKU: {sku}. Skipping update.")
                 # ---------------------------------------------------
 
                 if not cheapest_prices_per_sku:
                     print(f"No valid SKUs with prices found after aggregation for {sku}. Moving to next SKU.")
+                    mark_sku_done(schedule_db, run.id, sku, scraped_products)
                     continue # Use continue to proceed with the next SKU in the main loop
 
                 print(f"\nFound {len(cheapest_prices_per_sku)} unique SKUs to update in the database.")
                 
                 # --- DATABASE UPDATE STEP ---
-                for sku_to_update, new_price in cheapest_prices_per_sku.items():
-                    update_price_for_sku(db=db, sku=sku_to_update, new_price=new_price)
+                # A failed write raises, so the span counts it and the SKU is marked failed below
+                with span("db_update", sku=sku):
+                    for sku_to_update, new_price in cheapest_prices_per_sku.items():
+                        await update_price_for_sku_async(db=db, sku=sku_to_update, new_price=new_price, sku_map=sku_map,
+                                                         raise_errors=True)
+                mark_sku_done(schedule_db, run.id, sku, scraped_products)
             except Exception as e:
                 print(f"An error occurred while processing SKU {sku}: {e}")
+                mark_sku_failed(schedule_db, run.id, sku, str(e))
                 # Continue to the next SKU even if one fails
                 continue
+
+        finish_run(schedule_db, run.id)
                 
     finally:
-        # Ensure the database session is closed
+        # Ensure the database sessions are closed
         db.close()
+        schedule_db.close()
+        close_result_sink()
+        flush_offer_buffer()
         print("\n--- Price Update Job Completed ---")
 
 def load_products_from_json(filepath: str) -> List[Dict[str, Any]]:
@@ -1009,12 +1401,21 @@ def load_products_from_json(filepath: str) -> List[Dict[str, Any]]:
     Reads a product JSON file and returns the list of product dictionaries.
 
     Args:
-        filepath (str): The path to the input JSON file.
+        filepath (str): The path to the input JSON file, or to a result log
+            (a .jsonl file or a directory of them, see app/service/result_sink.py).
 
     Returns:
         A list of product dictionaries, or an empty list if an error occurs.
     """
     print(f"FILE: Loading product data from '{filepath}'...")
+    if is_result_log(filepath):
+        try:
+            products = list(iter_results(filepath))
+        except FileNotFoundError:
+            print(f"FILE ERROR: The file '{filepath}' was not found.")
+            return []
+        print(f"FILE: Successfully loaded {len(products)} products from the result log.")
+        return products
     try:
         with open(filepath, 'r', encoding='utf-8') as file:
             data = json.load(file)
@@ -1037,42 +1438,50 @@ def load_products_from_json(filepath: str) -> List[Dict[str, Any]]:
     
 
 
-def run_json_to_db_update_job(json_filepath: str):
+def run_json_to_db_update_job(json_filepath: str, max_age_hours: float | None = RESULT_LOG_MAX_AGE_HOURS):
     """
     Reads a JSON file, finds the single cheapest price for each unique SKU,
     and then updates the database.
 
     Args:
-        json_filepath (str): Path to the source JSON file with product data.
+        json_filepath (str): Path to the source JSON file with product data, or
+            to a result log, which is streamed line by line instead of loaded whole.
+            From a result log only the latest offer of each SKU and retailer,
+            logged within max_age_hours, is considered.
+        max_age_hours (float): Window of a result log; None reads all of it.
     """
     print("\n--- Starting JSON to Database Price Update Job ---")
     db: Session = next(get_db())
+    local_db = next(get_local_db())
 
     try:
-        # 1. Load all product data from the JSON file
-        products_from_json = load_products_from_json(json_filepath)
-        
-        if not products_from_json:
-            print("No products loaded from JSON. Exiting job.")
-            return
+        # 1. Load all product data from the JSON file (result logs are streamed)
+        if is_result_log(json_filepath):
+            if not os.path.exists(json_filepath):
+                print(f"FILE ERROR: The result log '{json_filepath}' was not found. Exiting job.")
+                return
+            print(f"FILE: Streaming product data from '{json_filepath}'...")
+            products_from_json = iter_results(json_filepath)
+        else:
+            products_from_json = load_products_from_json(json_filepath)
+            if not products_from_json:
+                print("No products loaded from JSON. Exiting job.")
+                return
+
+        # Scraped SKUs are mapped to catalog SKUs ("N5I5101W1-Black" -> "N5I5101W1")
+        sku_map = SkuIdMap()
+        sku_map.refresh(db)
+        sku_aliases = SkuAliasMap().load(local_db, sku_map.skus())
+        if is_result_log(json_filepath):
+            # The log holds every run; older offers of a retailer are superseded by its latest one
+            since = datetime.utcnow() - timedelta(hours=max_age_hours) if max_age_hours is not None else None
+            products_from_json = latest_offers_per_retailer(products_from_json, resolve=sku_aliases.resolve_offer, since=since)
 
         # --- NEW LOGIC: AGGREGATION STEP ---
-        # 2. Find the cheapest price for each unique SKU in the file
-        cheapest_prices_per_sku = {}
-        print(f"\nProcessing {len(products_from_json)} products to find the cheapest price for each SKU...")
-
-        for product in products_from_json:
-            sku = product.get('sku')
-            price = product.get('finalPriceVND')
-
-            # Basic data validation: ensure SKU and price exist and price is a number
-            if sku and price is not None and isinstance(price, (int, float)):
-                # If we've never seen this SKU, or if the new price is lower than the stored price...
-                if sku not in cheapest_prices_per_sku or price < cheapest_prices_per_sku[sku]:
-                    # ...update the dictionary with the new lowest price.
-                    cheapest_prices_per_sku[sku] = price
-            else:
-                print(f" FILE: Skipping product due to missing/invalid 'sku' or 'finalPriceVND': {product}")
+        # 2. Find the cheapest price for each unique catalog SKU in the file
+        print("\nProcessing products to find the cheapest price for each SKU...")
+        cheapest_prices_per_sku = aggregate_cheapest_prices(products_from_json, resolve=sku_aliases.resolve_offer)
+        sku_aliases.save(local_db)
 
         if not cheapest_prices_per_sku:
             print("No valid SKUs with prices found after aggregation. Exiting.")
@@ -1084,11 +1493,12 @@ def run_json_to_db_update_job(json_filepath: str):
         # 3. Loop through the aggregated cheapest prices and update the database
         for sku, new_price in cheapest_prices_per_sku.items():
             # Call the update function for each unique SKU with its cheapest price
-            update_price_for_sku(db=db, sku=sku, new_price=new_price)
+            update_price_for_sku(db=db, sku=sku, new_price=new_price, sku_map=sku_map)
 
     finally:
         # 4. Ensure the database session is always closed
         db.close()
+        local_db.close()
         print("\n--- Job Finished. Database session closed. ---")
 
         
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.crud.serp_cache import (
+    claim_serp_refresh, get_serp_candidates, get_serp_entry, purge_serp_cache, release_serp_refresh, save_serp_entry
+)
+from app.db.local import get_local_db
+
+# A SERP younger than the TTL is served as is. Up to SERP_CACHE_STALE_SECONDS
+# past the TTL it is still served, while one worker refetches it in the background.
+SERP_CACHE_TTL_SECONDS = float(os.getenv("SERP_CACHE_TTL_SECONDS", str(12 * 3600)))
+SERP_CACHE_STALE_SECONDS = float(os.getenv("SERP_CACHE_STALE_SECONDS", str(3 * 24 * 3600)))
+# How long a worker may hold a refresh claim, and how long others wait for it on a miss
+SERP_REFRESH_LEASE_SECONDS = float(os.getenv("SERP_REFRESH_LEASE_SECONDS", "120"))
+SERP_CACHE_WAIT_SECONDS = float(os.getenv("SERP_CACHE_WAIT_SECONDS", "30"))
+
+SerpSearch = Callable[[str], Awaitable[Dict]]
+
+# Background refreshes, referenced so they are not garbage collected mid-flight
+_refreshes: Set[asyncio.Task] = set()
+
+
+async def _fetch_and_store(query_key: str, locale: str, query: str, search: SerpSearch) -> Dict:
+    """Fetches a SERP, caches it if the fetch succeeded and releases the refresh claim."""
+    outcome = None
+    try:
+        outcome = await search(query)
+    finally:
+        db = next(get_local_db())
+        try:
+            if outcome is not None and outcome.get("status") == "success":
+                save_serp_entry(db, query_key, locale, query, outcome.get("candidates", []))
+            else:
+                release_serp_refresh(db, query_key, locale)
+        finally:
+            db.close()
+    return outcome
+
+async def _refresh_in_background(query_key: str, locale: str, query: str, search: SerpSearch):
+    try:
+        await _fetch_and_store(query_key, locale, query, search)
+    except Exception as e:
+        print(f"SERP CACHE: Background refresh of '{query}' failed: {e}")
+
+async def cached_serp(query_key: str, locale: str, query: str, search: SerpSearch,
+                      revalidate: Optional[SerpSearch] = None, cached_only: bool = False) -> Tuple[Dict, str]:
+    """
+    Returns the SERP of a query from the cache when possible.
+
+    Args:
+        query_key (str): The normalized query (see query_planner.normalize_query).
+        locale (str): The Google host and language the SERP was fetched with.
+        query (str): The query as it is searched.
+        search: Fetches the SERP now; returns {"status", "candidates"}.
+        revalidate: Fetches the SERP in the background when a stale entry is
+            served (defaults to `search`). It must not share state with the caller,
+            e.g. it should use its own browser tab.
+        cached_only (bool): Serve fresh or stale entries without searching or
+            refreshing them, e.g. while Google is blocking us.
+
+    Returns:
+        The outcome and where it came from: "fresh", "stale" or "search"
+        ("miss", with status "miss", if `cached_only` found nothing to serve).
+    """
+    db = next(get_local_db())
+    try:
+        entry = get_serp_entry(db, query_key, locale)
+        if entry is not None:
+            age = (datetime.utcnow() - entry.fetched_at).total_seconds()
+            outcome = {"status": "success", "candidates": get_serp_candidates(entry)}
+            if age < SERP_CACHE_TTL_SECONDS:
+                return outcome, "fresh"
+            if age < SERP_CACHE_TTL_SECONDS + SERP_CACHE_STALE_SECONDS:
+                if cached_only:
+                    return outcome, "stale"
+                if claim_serp_refresh(db, query_key, locale, query, SERP_REFRESH_LEASE_SECONDS):
+                    task = asyncio.create_task(_refresh_in_background(query_key, locale, query, revalidate or search))
+                    _refreshes.add(task)
+                    task.add_done_callback(_refreshes.discard)
+                return outcome, "stale"
+
+        if cached_only:
+            return {"status": "miss"}, "miss"
+        # Miss (or too old to serve): fetch unless another worker is already on it
+        if not claim_serp_refresh(db, query_key, locale, query, SERP_REFRESH_LEASE_SECONDS):
+            waited = 0.0
+            while waited < SERP_CACHE_WAIT_SECONDS:
+                await asyncio.sleep(1)
+                waited += 1
+                db.expire_all()
+                entry = get_serp_entry(db, query_key, locale)
+                if entry is not None and (datetime.utcnow() - entry.fetched_at).total_seconds() < SERP_CACHE_TTL_SECONDS:
+                    return {"status": "success", "candidates": get_serp_candidates(entry)}, "fresh"
+    finally:
+        db.close()
+    return await _fetch_and_store(query_key, locale, query, search), "search"
+
+def purge_expired_serps() -> int:
+    """Deletes SERPs too old to be served even as stale entries."""
+    db = next(get_local_db())
+    try:
+        return purge_serp_cache(db, SERP_CACHE_TTL_SECONDS + SERP_CACHE_STALE_SECONDS)
+    finally:
+        db.close()
@@ -0,0 +1,62 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict
+
+# Sent on idle streams so proxies do not close the connection while the agent works
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+async def stream_scrape_events(search_query: str, limit: int = 4, **scrape_kwargs) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs scrape_product_data in the background and yields its events as they
+    happen: "step" (agent step and URL visited), "offer" (a price extracted
+    from a product page) and a final "summary" with the validated products.
+    A "keepalive" event is yielded when nothing happened for a while. The
+    stream always ends with a "summary", with status "error" if the scrape
+    crashed.
+    """
+    from app.service.scraping import scrape_product_data
+
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(
+        scrape_product_data(searchQuery=search_query, limit=limit, on_event=events.put_nowait, **scrape_kwargs)
+    )
+    next_event = None
+    summarized = False
+    try:
+        while not summarized:
+            # Wake up on the next event or on the scrape ending, whichever is first
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait({next_event, task}, timeout=STREAM_KEEPALIVE_SECONDS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                if not task.done():
+                    yield {"event": "keepalive"}
+                elif events.empty():
+                    break
+                continue
+            event = next_event.result()
+            summarized = event["event"] == "summary"
+            yield event
+        try:
+            await task
+        except Exception as e:
+            # The scrape crashed without its own summary: end the stream with one
+            if not summarized:
+                yield {"event": "summary", "status": "error", "searchQuery": search_query,
+                       "count": 0, "products": [], "error": str(e)}
+    finally:
+        # Client went away: stop the agent instead of scraping for nobody
+        if not task.done():
+            task.cancel()
+        if next_event is not None and not next_event.done():
+            next_event.cancel()
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Formats an event as a Server-Sent Events message."""
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+def format_ndjson(event: Dict[str, Any]) -> str:
+    """Formats an event as one line of newline-delimited JSON."""
+    return json.dumps(event, ensure_ascii=False, default=str) + "\n"
@@ -0,0 +1,625 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import create_engine, select, update, or_, and_
+from sqlalchemy.orm import sessionmaker
+
+from app.db.local import LOCAL_DATABASE_URL, WorkQueueJob
+
+# Backend of the SKU work queue: memory://, sqlite:///..., postgresql://... or redis://...
+WORK_QUEUE_URL = os.getenv("WORK_QUEUE_URL", LOCAL_DATABASE_URL)
+WORK_QUEUE_NAME = os.getenv("WORK_QUEUE_NAME", "price-update")
+# A leased job becomes visible to other workers again if not acked within this time.
+VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("WORK_QUEUE_VISIBILITY_TIMEOUT", "900"))
+# Jobs failing this many times are moved to the dead-letter state.
+MAX_JOB_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+# Catalog SKUs read per query by publish_catalog_skus (same setting as the sequential job)
+SKU_PAGE_SIZE = int(os.getenv("SKU_PAGE_SIZE", "1000"))
+
+# SKU -> Product.Id map of the coordinator, refreshed incrementally on each collect
+_sku_id_map = None
+
+
+class Lease:
+    """A job handed to one worker until it is acked, nacked or its lease expires."""
+
+    def __init__(self, job_id: str, sku: str, token: str, attempts: int):
+        self.job_id = job_id
+        self.sku = sku
+        self.token = token
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"<Lease(job_id={self.job_id}, sku='{self.sku}', attempts={self.attempts})>"
+
+
+class WorkQueue(ABC):
+    """
+    Interface of the SKU work queue. Producers publish SKUs, any number of
+    workers lease, process and ack them, and a coordinator collects results.
+    """
+
+    @abstractmethod
+    def publish(self, skus: List[str], priorities: Optional[Dict[str, float]] = None) -> int:
+        """Enqueues SKUs, skipping those already queued or leased. Returns the number enqueued."""
+
+    @abstractmethod
+    def lease(self, worker_id: str, visibility_timeout: int = VISIBILITY_TIMEOUT_SECONDS) -> Optional[Lease]:
+        """Hands the highest-priority visible job to a worker, or None."""
+
+    @abstractmethod
+    def extend(self, lease: Lease, visibility_timeout: int = VISIBILITY_TIMEOUT_SECONDS) -> bool:
+        """Pushes back the lease expiry while the worker is still busy."""
+
+    @abstractmethod
+    def ack(self, lease: Lease, result: List[dict]) -> bool:
+        """Completes a job with its offers."""
+
+    @abstractmethod
+    def nack(self, lease: Lease, error: str) -> bool:
+        """Fails an attempt; the job is requeued at its priority or dead-lettered."""
+
+    @abstractmethod
+    def collect_results(self, limit: int = 1000) -> Dict[str, List[dict]]:
+        """Takes the results of completed jobs, once each."""
+
+    @abstractmethod
+    def pending_count(self) -> int:
+        """Number of queued and leased jobs."""
+
+    @abstractmethod
+    def active_skus(self) -> Set[str]:
+        """SKUs of the queued and leased jobs."""
+
+
+class InMemoryWorkQueue(WorkQueue):
+    """In-process backend for tests and single-process runs."""
+
+    def __init__(self, max_attempts: int = MAX_JOB_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self._ids = itertools.count(1)
+        self._ready = []        # heap of (-priority, job_id)
+        self._jobs = {}         # job_id -> dict
+        self._results = {}
+
+    def _requeue_expired(self):
+        now = time.monotonic()
+        for job_id, job in self._jobs.items():
+            if job["status"] == "leased" and job["expires"] < now:
+                # An expired lease used up an attempt, like a nack
+                if job["attempts"] >= self.max_attempts:
+                    job.update(status="dead", error="Lease expired")
+                    continue
+                job["status"] = "queued"
+                heapq.heappush(self._ready, (-job["priority"], job_id))
+
+    def publish(self, skus, priorities=None):
+        priorities = priorities or {}
+        active = self.active_skus()
+        published = 0
+        for sku in skus:
+            if sku in active:
+                continue
+            active.add(sku)
+            job_id = next(self._ids)
+            self._jobs[job_id] = {"sku": sku, "priority": priorities.get(sku, 0.0), "status": "queued", "attempts": 0, "token": None}
+            heapq.heappush(self._ready, (-self._jobs[job_id]["priority"], job_id))
+            published += 1
+        return published
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS):
+        self._requeue_expired()
+        while self._ready:
+            _, job_id = heapq.heappop(self._ready)
+            job = self._jobs[job_id]
+            if job["status"] != "queued":
+                continue
+            job.update(status="leased", token=uuid.uuid4().hex, expires=time.monotonic() + visibility_timeout)
+            job["attempts"] += 1
+            return Lease(str(job_id), job["sku"], job["token"], job["attempts"])
+        return None
+
+    def _owned(self, lease):
+        job = self._jobs.get(int(lease.job_id))
+        return job if job and job["status"] == "leased" and job["token"] == lease.token else None
+
+    def extend(self, lease, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS):
+        job = self._owned(lease)
+        if job:
+            job["expires"] = time.monotonic() + visibility_timeout
+        return job is not None
+
+    def ack(self, lease, result):
+        job = self._owned(lease)
+        if job:
+            job["status"] = "done"
+            self._results[lease.job_id] = (job["sku"], result)
+        return job is not None
+
+    def nack(self, lease, error):
+        job = self._owned(lease)
+        if job:
+            job["status"] = "dead" if job["attempts"] >= self.max_attempts else "queued"
+            job["error"] = error
+            if job["status"] == "queued":
+                heapq.heappush(self._ready, (-job["priority"], int(lease.job_id)))
+        return job is not None
+
+    def collect_results(self, limit=1000):
+        collected = {}
+        for job_id in list(self._results)[:limit]:
+            sku, result = self._results.pop(job_id)
+            collected[sku] = result
+        return collected
+
+    def pending_count(self):
+        return sum(1 for job in self._jobs.values() if job["status"] in ("queued", "leased"))
+
+    def active_skus(self):
+        return {job["sku"] for job in self._jobs.values() if job["status"] in ("queued", "leased")}
+
+
+class SqlWorkQueue(WorkQueue):
+    """
+    SQL backend: SQLite for local testing, Postgres in production. On Postgres
+    the lease query uses FOR UPDATE SKIP LOCKED so concurrent workers never
+    lease the same job.
+    """
+
+    def __init__(self, database_url: str = WORK_QUEUE_URL, queue: str = WORK_QUEUE_NAME, max_attempts: int = MAX_JOB_ATTEMPTS):
+        self.queue = queue
+        self.max_attempts = max_attempts
+        if database_url == LOCAL_DATABASE_URL:
+            from app.db.local import local_engine
+            self.engine = local_engine
+        else:
+            connect_args = {"check_same_thread": False, "timeout": 30} if database_url.startswith("sqlite") else {}
+            self.engine = create_engine(database_url, connect_args=connect_args)
+        WorkQueueJob.__table__.create(self.engine, checkfirst=True)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    def publish(self, skus, priorities=None):
+        priorities = priorities or {}
+        now = datetime.utcnow()
+        active = self.active_skus()
+        with self.Session() as db:
+            new_skus = [sku for sku in dict.fromkeys(skus) if sku not in active]
+            db.add_all([
+                WorkQueueJob(queue=self.queue, sku=sku, priority=priorities.get(sku, 0.0), status="queued",
+                             attempts=0, enqueued_at=now, updated_at=now)
+                for sku in new_skus
+            ])
+            db.commit()
+        print(f"QUEUE: Published {len(new_skus)} SKU jobs to '{self.queue}' ({len(skus) - len(new_skus)} already queued).")
+        return len(new_skus)
+
+    def _dead_letter_expired(self, now: datetime):
+        """Expired leases that used up the last attempt are dead, not leased again."""
+        with self.Session() as db:
+            db.execute(
+                update(WorkQueueJob)
+                .where(WorkQueueJob.queue == self.queue, WorkQueueJob.status == "leased",
+                       WorkQueueJob.lease_expires_at < now, WorkQueueJob.attempts >= self.max_attempts)
+                .values(status="dead", error="Lease expired", lease_token=None, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        self._dead_letter_expired(now)
+        visible = and_(
+            WorkQueueJob.queue == self.queue,
+            or_(
+                WorkQueueJob.status == "queued",
+                and_(WorkQueueJob.status == "leased", WorkQueueJob.lease_expires_at < now,
+                     WorkQueueJob.attempts < self.max_attempts),
+            ),
+        )
+        candidate = (
+            select(WorkQueueJob.id)
+            .where(visible)
+            .order_by(WorkQueueJob.priority.desc(), WorkQueueJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        with self.Session() as db:
+            # Single UPDATE statement: atomic on SQLite, row-locked on Postgres
+            claimed = db.execute(
+                update(WorkQueueJob)
+                .where(WorkQueueJob.id == candidate, visible)
+                .values(
+                    status="leased",
+                    lease_token=token,
+                    leased_by=worker_id,
+                    lease_expires_at=now + timedelta(seconds=visibility_timeout),
+                    attempts=WorkQueueJob.attempts + 1,
+                    updated_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return None
+            job = db.query(WorkQueueJob).filter(WorkQueueJob.lease_token == token).first()
+            return Lease(str(job.id), job.sku, token, job.attempts)
+
+    def _update_owned(self, lease, **values):
+        with self.Session() as db:
+            changed = db.execute(
+                update(WorkQueueJob)
+                .where(WorkQueueJob.id == int(lease.job_id), WorkQueueJob.lease_token == lease.token,
+                       WorkQueueJob.status == "leased")
+                .values(updated_at=datetime.utcnow(), **values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return bool(changed)
+
+    def extend(self, lease, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS):
+        return self._update_owned(lease, lease_expires_at=datetime.utcnow() + timedelta(seconds=visibility_timeout))
+
+    def ack(self, lease, result):
+        return self._update_owned(lease, status="done", result=json.dumps(result, ensure_ascii=False), lease_token=None)
+
+    def nack(self, lease, error):
+        status = "dead" if lease.attempts >= self.max_attempts else "queued"
+        return self._update_owned(lease, status=status, error=error, lease_token=None)
+
+    def collect_results(self, limit=1000):
+        with self.Session() as db:
+            jobs = (
+                db.query(WorkQueueJob)
+                .filter(WorkQueueJob.queue == self.queue, WorkQueueJob.status == "done")
+                .order_by(WorkQueueJob.id)
+                .limit(limit)
+                .all()
+            )
+            collected = {}
+            for job in jobs:
+                collected[job.sku] = json.loads(job.result or "[]")
+                job.status = "collected"
+            db.commit()
+            return collected
+
+    def pending_count(self):
+        with self.Session() as db:
+            return db.query(WorkQueueJob).filter(
+                WorkQueueJob.queue == self.queue,
+                WorkQueueJob.status.in_(["queued", "leased"])
+            ).count()
+
+    def active_skus(self):
+        with self.Session() as db:
+            return {sku for (sku,) in db.query(WorkQueueJob.sku).filter(
+                WorkQueueJob.queue == self.queue,
+                WorkQueueJob.status.in_(["queued", "leased"])
+            )}
+
+
+# Every multi-key step of the Redis backend runs as one Lua script, so a worker
+# or publisher crashing half-way can neither lose a job nor leave its SKU in the
+# active set forever. Job hashes are addressed as ARGV[1] .. job id.
+_PUBLISH_LUA = """
+local published = 0
+for i = 2, #ARGV, 2 do
+    local sku, priority = ARGV[i], ARGV[i + 1]
+    if redis.call('SADD', KEYS[1], sku) == 1 then
+        local job_id = tostring(redis.call('INCR', KEYS[2]))
+        redis.call('HSET', ARGV[1] .. job_id, 'sku', sku, 'attempts', 0, 'token', '', 'priority', priority)
+        redis.call('ZADD', KEYS[3], priority, job_id)
+        published = published + 1
+    end
+end
+return published
+"""
+
+_LEASE_LUA = """
+local prefix, now, expires, token, worker_id, max_attempts = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5], tonumber(ARGV[6])
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], job_id)
+    local job = prefix .. job_id
+    -- An expired lease used up an attempt, like a nack
+    if tonumber(redis.call('HGET', job, 'attempts') or '0') >= max_attempts then
+        redis.call('HSET', job, 'token', '', 'error', 'Lease expired')
+        redis.call('SREM', KEYS[3], redis.call('HGET', job, 'sku'))
+    else
+        redis.call('ZADD', KEYS[1], redis.call('HGET', job, 'priority') or 0, job_id)
+    end
+end
+local popped = redis.call('ZPOPMAX', KEYS[1])
+if #popped == 0 then
+    return false
+end
+local job_id = popped[1]
+local job = prefix .. job_id
+local attempts = redis.call('HINCRBY', job, 'attempts', 1)
+redis.call('HSET', job, 'token', token, 'leased_by', worker_id)
+redis.call('ZADD', KEYS[2], expires, job_id)
+return {job_id, redis.call('HGET', job, 'sku'), attempts}
+"""
+
+_EXTEND_LUA = """
+if redis.call('HGET', KEYS[1], 'token') ~= ARGV[2] or not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return 1
+"""
+
+_ACK_LUA = """
+if redis.call('HGET', KEYS[1], 'token') ~= ARGV[2] or redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+redis.call('SREM', KEYS[4], redis.call('HGET', KEYS[1], 'sku'))
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+_NACK_LUA = """
+if redis.call('HGET', KEYS[1], 'token') ~= ARGV[2] or redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'token', '', 'error', ARGV[3])
+if tonumber(redis.call('HGET', KEYS[1], 'attempts') or '0') < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[3], redis.call('HGET', KEYS[1], 'priority') or 0, ARGV[1])
+else
+    redis.call('SREM', KEYS[4], redis.call('HGET', KEYS[1], 'sku'))
+end
+return 1
+"""
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    Redis backend. Ready jobs live in a sorted set by priority, leased jobs in a
+    sorted set by lease expiry; expired leases are moved back (or dead-lettered)
+    on every lease call. The SKUs of queued and leased jobs are kept in a set,
+    so a SKU is not published twice. Each operation is one atomic Lua script.
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, redis_url: str, queue: str = WORK_QUEUE_NAME, max_attempts: int = MAX_JOB_ATTEMPTS,
+                 client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("RedisWorkQueue requires the 'redis' package: pip install redis") from e
+            client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.redis = client
+        self.max_attempts = max_attempts
+        self.ready_key = f"workqueue:{queue}:ready"
+        self.leased_key = f"workqueue:{queue}:leased"
+        self.active_key = f"workqueue:{queue}:active"
+        self.results_key = f"workqueue:{queue}:results"
+        self.job_prefix = f"workqueue:{queue}:job:"
+        self.ids_key = f"workqueue:{queue}:ids"
+        self._publish = client.register_script(_PUBLISH_LUA)
+        self._lease = client.register_script(_LEASE_LUA)
+        self._extend = client.register_script(_EXTEND_LUA)
+        self._ack = client.register_script(_ACK_LUA)
+        self._nack = client.register_script(_NACK_LUA)
+
+    def publish(self, skus, priorities=None):
+        priorities = priorities or {}
+        args = [self.job_prefix]
+        for sku in dict.fromkeys(skus):
+            args += [sku, priorities.get(sku, 0.0)]
+        return int(self._publish(keys=[self.active_key, self.ids_key, self.ready_key], args=args))
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS):
+        now = time.time()
+        token = uuid.uuid4().hex
+        leased = self._lease(keys=[self.ready_key, self.leased_key, self.active_key],
+                             args=[self.job_prefix, now, now + visibility_timeout, token, worker_id, self.max_attempts])
+        if not leased:
+            return None
+        job_id, sku, attempts = leased
+        return Lease(str(job_id), sku, token, int(attempts))
+
+    def extend(self, lease, visibility_timeout=VISIBILITY_TIMEOUT_SECONDS):
+        return bool(self._extend(keys=[self.job_prefix + lease.job_id, self.leased_key],
+                                 args=[lease.job_id, lease.token, time.time() + visibility_timeout]))
+
+    def ack(self, lease, result):
+        payload = json.dumps({"sku": lease.sku, "result": result}, ensure_ascii=False)
+        return bool(self._ack(keys=[self.job_prefix + lease.job_id, self.leased_key, self.results_key, self.active_key],
+                              args=[lease.job_id, lease.token, payload]))
+
+    def nack(self, lease, error):
+        return bool(self._nack(keys=[self.job_prefix + lease.job_id, self.leased_key, self.ready_key, self.active_key],
+                               args=[lease.job_id, lease.token, error, self.max_attempts]))
+
+    def collect_results(self, limit=1000):
+        collected = {}
+        for job_id, payload in list(self.redis.hscan_iter(self.results_key, count=limit))[:limit]:
+            if self.redis.hdel(self.results_key, job_id):
+                item = json.loads(payload)
+                collected[item["sku"]] = item["result"]
+        return collected
+
+    def pending_count(self):
+        return self.redis.zcard(self.ready_key) + self.redis.zcard(self.leased_key)
+
+    def active_skus(self):
+        return set(self.redis.smembers(self.active_key))
+
+
+def get_work_queue(url: str = WORK_QUEUE_URL, queue: str = WORK_QUEUE_NAME) -> WorkQueue:
+    """Creates the work queue backend for a URL (memory://, sqlite://, postgresql://, redis://)."""
+    if url.startswith("memory://"):
+        return InMemoryWorkQueue()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisWorkQueue(url, queue=queue)
+    return SqlWorkQueue(url, queue=queue)
+
+
+def publish_catalog_skus(queue: WorkQueue, page_size: int = SKU_PAGE_SIZE) -> int:
+    """
+    Publishes the due SKUs of the catalog to the work queue, most valuable
+    first. The catalog is streamed page by page into a priority queue bounded
+    by the crawl budget, as in run_price_update_job. SKUs still queued or
+    leased from an earlier publish are skipped and do not use up the budget.
+    """
+    from app.crud.products import get_sku_margins, iter_sku_pages
+    from app.db.local import get_local_db
+    from app.db.mydb import get_db
+    from app.service.scheduler import CRAWL_BUDGET_PER_RUN, SkuPriorityQueue, select_due_skus, build_sku_priority_queue
+
+    db = next(get_db())
+    schedule_db = next(get_local_db())
+    try:
+        active = queue.active_skus()
+        sku_queue = SkuPriorityQueue(capacity=CRAWL_BUDGET_PER_RUN)
+        for page in iter_sku_pages(db, page_size=page_size):
+            due_skus = [sku for sku in select_due_skus(schedule_db, page, budget=None) if sku not in active]
+            if due_skus:
+                build_sku_priority_queue(schedule_db, due_skus, margins=get_sku_margins(db, due_skus), queue=sku_queue)
+        skus = list(sku_queue.drain())
+        # Later position = lower priority; keep the queue order on the broker
+        priorities = {sku: float(len(skus) - index) for index, sku in enumerate(skus)}
+        return queue.publish(skus, priorities)
+    finally:
+        db.close()
+        schedule_db.close()
+
+async def run_queue_worker(queue: WorkQueue, worker_id: Optional[str] = None, pool_size: int = 1,
+                           idle_exit_seconds: Optional[float] = 60, poll_seconds: float = 5):
+    """
+    Worker node loop: leases SKU jobs, scrapes them on a browser pool and
+    pushes the offers back with an ack. The lease is extended while a scrape is
+    running, so slow scrapes are not handed to another worker.
+
+    Args:
+        queue (WorkQueue): The queue backend.
+        worker_id (str): Identifies this worker in leases. Defaults to host:pid.
+        pool_size (int): Browsers (concurrent scrapes) on this node.
+        idle_exit_seconds (float): Stop after the queue has been empty this long; None runs forever.
+        poll_seconds (float): Wait between polls of an empty queue.
+    """
+    from app.service.offer_store import flush_offer_buffer
+    from app.service.scraping import scrape_product_data
+    from app.service.workers import BrowserPool
+
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    pool = BrowserPool(pool_size)
+    await pool.start()
+
+    async def keep_lease(lease: Lease):
+        while True:
+            await asyncio.sleep(VISIBILITY_TIMEOUT_SECONDS / 3)
+            await asyncio.to_thread(queue.extend, lease)
+
+    async def process(lease: Lease):
+        heartbeat = asyncio.create_task(keep_lease(lease))
+        try:
+            async with pool.acquire() as browser:
+                products = await scrape_product_data(searchQuery=lease.sku, limit=4, browser=browser,
+                                                      raise_errors=True)
+            await asyncio.to_thread(queue.ack, lease, products or [])
+        except Exception as e:
+            print(f"QUEUE WORKER {worker_id}: SKU {lease.sku} failed (attempt {lease.attempts}): {e}")
+            await asyncio.to_thread(queue.nack, lease, str(e))
+        finally:
+            heartbeat.cancel()
+
+    in_flight = set()
+    idle_since = time.monotonic()
+    try:
+        while True:
+            if len(in_flight) < pool_size:
+                lease = await asyncio.to_thread(queue.lease, worker_id)
+                if lease:
+                    idle_since = time.monotonic()
+                    task = asyncio.create_task(process(lease))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                    continue
+                if not in_flight and idle_exit_seconds is not None and time.monotonic() - idle_since > idle_exit_seconds:
+                    print(f"QUEUE WORKER {worker_id}: queue empty, exiting.")
+                    break
+            await asyncio.sleep(poll_seconds)
+    finally:
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        await pool.close()
+        flush_offer_buffer()
+
+def apply_queue_results(queue: WorkQueue) -> int:
+    """
+    Coordinator step: collects pushed results, records scheduler observations
+    and writes the cheapest price per SKU in one bulk update.
+
+    Returns:
+        The number of SKU results applied.
+    """
+    global _sku_id_map
+    from app.crud.products import SkuIdMap, bulk_update_prices
+    from app.crud.sku_alias import SkuAliasMap
+    from app.db.local import get_local_db
+    from app.db.mydb import get_db
+    from app.service.metrics import span
+    from app.service.scheduler import record_sku_observation
+    from app.service.scraping import aggregate_cheapest_prices, offers_for_sku, select_offers_to_write
+
+    results = queue.collect_results()
+    if not results:
+        return 0
+    db = next(get_db())
+    schedule_db = next(get_local_db())
+    try:
+        if _sku_id_map is None:
+            _sku_id_map = SkuIdMap()
+        _sku_id_map.refresh(db)
+        # Scraped SKUs are mapped to catalog SKUs; offers of other products are dropped
+        sku_aliases = SkuAliasMap().load(schedule_db, _sku_id_map.skus())
+        results = {sku: offers_for_sku(sku, products, sku_aliases) for sku, products in results.items()}
+        sku_aliases.save(schedule_db)
+
+        cheapest_prices_per_sku, history = {}, {}
+        for sku, products in results.items():
+            history_offers, price_offers = select_offers_to_write(products)
+            if history_offers:
+                history[sku] = history_offers
+            for sku_to_update, price in aggregate_cheapest_prices(price_offers, resolve=sku_aliases.resolve_offer).items():
+                if sku_to_update not in cheapest_prices_per_sku or price < cheapest_prices_per_sku[sku_to_update]:
+                    cheapest_prices_per_sku[sku_to_update] = price
+        if cheapest_prices_per_sku or history:
+            try:
+                # Prices and price history in one transaction
+                with span("db_update", skus=len(results)):
+                    bulk_update_prices(db, cheapest_prices_per_sku, sku_map=_sku_id_map, history=history)
+            except Exception:
+                # Nothing was written: scrape these SKUs again rather than lose them
+                queue.publish(list(results))
+                return 0
+        for sku, products in results.items():
+            record_sku_observation(schedule_db, sku, products)
+        return len(results)
+    finally:
+        db.close()
+        schedule_db.close()
+
+if __name__ == "__main__":
+    import sys
+    command = sys.argv[1] if len(sys.argv) > 1 else "work"
+    work_queue = get_work_queue()
+    if command == "publish":
+        publish_catalog_skus(work_queue)
+    elif command == "collect":
+        print(f"QUEUE: Applied {apply_queue_results(work_queue)} SKU results.")
+    else:
+        asyncio.run(run_queue_worker(work_queue, pool_size=int(os.getenv("WORKER_BROWSER_POOL_SIZE", "2"))))
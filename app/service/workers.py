@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.crud.products import SkuIdMap, bulk_update_prices_async
+from app.crud.sku_alias import SkuAliasMap
+from app.crud.run_ledger import mark_sku_started, mark_sku_done, mark_sku_failed
+from app.service.metrics import merge_metrics, metrics_snapshot, span
+from app.service.scheduler import record_sku_observation
+
+# Number of worker processes for run_price_update_job (1 = sequential, in-process).
+# Set it to the number of cores of the scraping box to use all of them.
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+# Browsers kept running per worker process, i.e. SKUs scraped concurrently per worker.
+WORKER_BROWSER_POOL_SIZE = int(os.getenv("WORKER_BROWSER_POOL_SIZE", "2"))
+
+
+def shard_for_sku(sku: str, num_shards: int) -> int:
+    """Stable shard index for a SKU (independent of PYTHONHASHSEED)."""
+    return int(hashlib.md5(sku.encode("utf-8")).hexdigest(), 16) % num_shards
+
+def shard_skus(skus: List[str], num_shards: int) -> List[List[str]]:
+    """Splits SKUs into shards by hash, preserving their relative (priority) order."""
+    shards = [[] for _ in range(num_shards)]
+    for sku in skus:
+        shards[shard_for_sku(sku, num_shards)].append(sku)
+    return shards
+
+
+class BrowserPool:
+    """A fixed set of long-lived browsers shared by the scrapes of one worker process."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._browsers = asyncio.Queue()
+        self._all = []
+
+    async def start(self):
+        from app.service.scraping import create_browser
+        for _ in range(self.size):
+            browser = create_browser(keep_alive=True)
+            await browser.start()
+            self._all.append(browser)
+            self._browsers.put_nowait(browser)
+
+    @asynccontextmanager
+    async def acquire(self):
+        browser = await self._browsers.get()
+        try:
+            yield browser
+        finally:
+            self._browsers.put_nowait(browser)
+
+    async def close(self):
+        for browser in self._all:
+            try:
+                await browser.kill()
+            except Exception as e:
+                print(f"WORKER: Error closing browser: {e}")
+
+
+async def scrape_shard(skus: List[str], pool_size: int) -> Dict[str, Dict]:
+    """
+    Scrapes a shard of SKUs concurrently on a pool of browsers.
+
+    Returns:
+        Per SKU, {"products": [...]} on success or {"error": "..."} on failure.
+    """
+    from app.service.scraping import scrape_product_data
+
+    pool = BrowserPool(min(pool_size, len(skus)))
+    results = {}
+    await pool.start()
+
+    async def scrape_one(sku: str):
+        async with pool.acquire() as browser:
+            try:
+                products = await scrape_product_data(searchQuery=sku, limit=4, browser=browser, raise_errors=True)
+                results[sku] = {"products": products or []}
+            except Exception as e:
+                print(f"WORKER: An error occurred while processing SKU {sku}: {e}")
+                results[sku] = {"error": str(e)}
+
+    try:
+        await asyncio.gather(*(scrape_one(sku) for sku in skus))
+    finally:
+        await pool.close()
+    return results
+
+def _shard_worker_main(shard_index: int, skus: List[str], pool_size: int) -> Tuple[Dict[str, Dict], Dict]:
+    """
+    Entry point of a worker process: scrape one shard on its own event loop.
+    Returns the results and the worker's metrics, which only the parent serves on /metrics.
+    """
+    from app.service.offer_store import flush_offer_buffer
+
+    print(f"WORKER {shard_index} (pid {os.getpid()}): scraping {len(skus)} SKUs with {pool_size} browsers.")
+    try:
+        results = asyncio.run(scrape_shard(skus, pool_size))
+    finally:
+        # The shard's offers go to the offer store in one file per partition
+        flush_offer_buffer()
+    return results, metrics_snapshot()
+
+async def run_sharded_scrape(skus: List[str], workers: int = WORKER_PROCESSES,
+                             pool_size: int = WORKER_BROWSER_POOL_SIZE) -> Dict[str, Dict]:
+    """
+    Shards SKUs by hash across worker processes and merges their results.
+
+    Args:
+        skus (List[str]): The SKUs to scrape.
+        workers (int): Number of worker processes.
+        pool_size (int): Browsers per worker process.
+    """
+    shards = [shard for shard in shard_skus(skus, workers) if shard]
+    if not shards:
+        return {}
+    loop = asyncio.get_running_loop()
+    # "spawn" gives every worker a clean interpreter, with no inherited event loop or browser handles
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            loop.run_in_executor(executor, _shard_worker_main, index, shard, pool_size)
+            for index, shard in enumerate(shards)
+        ]
+        merged = {}
+        for index, outcome in enumerate(await asyncio.gather(*futures, return_exceptions=True)):
+            if isinstance(outcome, Exception):
+                print(f"WORKER {index}: shard failed entirely. Error: {outcome}")
+                merged.update({sku: {"error": str(outcome)} for sku in shards[index]})
+            else:
+                results, metrics = outcome
+                merge_metrics(metrics)
+                merged.update(results)
+    return merged
+
+async def run_sharded_price_update(db: Session, schedule_db: Session, run_id: int, skus: List[str],
+                                   workers: int = WORKER_PROCESSES, pool_size: int = WORKER_BROWSER_POOL_SIZE,
+                                   sku_map: SkuIdMap | None = None, sku_aliases: SkuAliasMap | None = None):
+    """
+    Coordinator for the worker mode of run_price_update_job: scrapes the SKUs
+    across worker processes, records schedule and ledger state, then performs
+    one bulk database write with the cheapest price per SKU. Offers that do not
+    resolve to the searched SKU through sku_aliases (loaded from the catalog
+    SKUs if not given) are dropped.
+    """
+    from app.service.scraping import aggregate_cheapest_prices, offers_for_sku, select_offers_to_write
+
+    if sku_aliases is None:
+        sku_aliases = SkuAliasMap().load(schedule_db, sku_map.skus() if sku_map is not None else skus)
+
+    print(f"\n--- Sharding {len(skus)} SKUs across {workers} worker processes ---")
+    for sku in skus:
+        mark_sku_started(schedule_db, run_id, sku)
+
+    results = await run_sharded_scrape(skus, workers=workers, pool_size=pool_size)
+
+    cheapest_prices_per_sku, history, scraped = {}, {}, {}
+    for sku in skus:
+        outcome = results.get(sku, {"error": "No result returned by worker"})
+        if "error" in outcome:
+            mark_sku_failed(schedule_db, run_id, sku, outcome["error"])
+            continue
+        scraped[sku] = offers_for_sku(sku, outcome["products"], sku_aliases)
+        history_offers, price_offers = select_offers_to_write(scraped[sku])
+        if history_offers:
+            history[sku] = history_offers
+        for sku_to_update, price in aggregate_cheapest_prices(price_offers, resolve=sku_aliases.resolve_offer).items():
+            if sku_to_update not in cheapest_prices_per_sku or price < cheapest_prices_per_sku[sku_to_update]:
+                cheapest_prices_per_sku[sku_to_update] = price
+
+    sku_aliases.save(schedule_db)
+
+    if cheapest_prices_per_sku or history:
+        try:
+            # Prices and price history of the whole batch in one transaction
+            with span("db_update", skus=len(scraped)):
+                await bulk_update_prices_async(db, cheapest_prices_per_sku, sku_map=sku_map, history=history)
+        except Exception as e:
+            for sku in scraped:
+                mark_sku_failed(schedule_db, run_id, sku, f"Database write failed: {e}")
+            return
+    else:
+        print("No valid SKUs with prices found after aggregation across workers.")
+
+    # Only mark SKUs done (and schedule their next check) once their prices are committed
+    for sku, products in scraped.items():
+        record_sku_observation(schedule_db, sku, products)
+        mark_sku_done(schedule_db, run_id, sku, products)
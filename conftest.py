@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+# Never touch output/scraper_state.db from tests; each test gets its own database below
+os.environ.setdefault("LOCAL_DATABASE_URL", "sqlite://")
+
+
+def _memory_engine():
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+@pytest.fixture
+def local_db(monkeypatch):
+    """A fresh in-memory local state database, also served by get_local_db()."""
+    from sqlalchemy.orm import sessionmaker
+    import app.db.local as local
+
+    engine = _memory_engine()
+    local.LocalBase.metadata.create_all(engine)
+    monkeypatch.setattr(local, "LocalSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(local, "_tables_ready", True)
+    session = local.LocalSessionLocal()
+    yield session
+    session.close()
+    engine.dispose()
+
+@pytest.fixture
+def catalog_db():
+    """An in-memory stand-in for the nopCommerce database (Product, ProductPriceHistory)."""
+    from sqlalchemy.orm import sessionmaker
+    from app.db.models import Base
+
+    engine = _memory_engine()
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+@pytest.fixture
+def add_products(catalog_db):
+    """Adds published products to catalog_db: add_products("SKU-1", "SKU-2")."""
+    from app.db.models import Product
+
+    def add(*skus):
+        catalog_db.add_all([Product(Name=sku, Sku=sku, Price=999, OldPrice=0, ProductCost=0) for sku in skus])
+        catalog_db.commit()
+    return add
+
+@pytest.fixture
+def patch_job(monkeypatch, catalog_db):
+    """Points run_price_update_job at catalog_db and the given fake scrape_product_data."""
+    from app.service import scraping
+
+    def get_db():
+        yield catalog_db
+
+    def patch(scrape):
+        monkeypatch.setattr(scraping, "get_db", get_db)
+        monkeypatch.setattr(scraping, "scrape_product_data", scrape)
+    return patch
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from app.service.scraping import parse_agent_products
+
+
+def _names(parsed):
+    return [product.productName for product in parsed.products]
+
+
+def test_strict_json_is_parsed():
+    raw = json.dumps({"products": [{"productName": "A", "finalPriceVND": 100, "url": "https://phongvu.vn/a"}]})
+    parsed = parse_agent_products(raw)
+    assert _names(parsed) == ["A"]
+    assert parsed.products[0].finalPriceVND == 100
+
+def test_fenced_json_with_trailing_commas_is_repaired():
+    raw = '```json\n{"products": [{"productName": "A", "finalPriceVND": "12.990.000đ",},]}\n```'
+    parsed = parse_agent_products(raw)
+    assert _names(parsed) == ["A"]
+    assert parsed.products[0].finalPriceVND == 12990000
+
+def test_truncated_list_is_repaired():
+    assert _names(parse_agent_products('[{"productName": "A"}, {"productName": "B"')) == ["A", "B"]
+
+def test_invalid_products_are_dropped_and_the_rest_kept():
+    products = [{"productName": "A"}, {"finalPriceVND": 100}, "junk", {"productName": ["B"]}]
+    assert _names(parse_agent_products({"products": products})) == ["A"]
+    # The same through the repair stage: strict validation fails on the whole list first
+    assert _names(parse_agent_products(json.dumps({"products": products}) + ",")) == ["A"]
+
+@pytest.mark.parametrize("raw, error", [
+    ("Sorry, I could not find any offers.", ValueError),
+    ("   ", TypeError),
+    (None, TypeError),
+    ({"offers": []}, TypeError),
+    ('"just a string"', TypeError),
+])
+def test_garbage_is_rejected(raw, error):
+    with pytest.raises(error):
+        parse_agent_products(raw)
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+import time
+
+from app.db.async_db import run_db_sync
+
+
+def test_blocking_db_calls_run_on_the_db_threads_without_blocking_the_loop():
+    def blocking_query(sku, delay):
+        time.sleep(delay)
+        return sku, threading.current_thread().name
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+        task = asyncio.create_task(ticker())
+        result = await run_db_sync(blocking_query, "SKU-1", delay=0.2)
+        task.cancel()
+        return result, ticks
+
+    (sku, thread_name), ticks = asyncio.run(main())
+    assert sku == "SKU-1"
+    assert thread_name.startswith("db")
+    # The loop kept running while the query blocked its thread
+    assert ticks >= 5
@@ -0,0 +1,74 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from app.crud.run_ledger import (
+    finish_run, get_completed_skus, get_recent_results, mark_sku_done, start_batch_run, start_or_resume_run
+)
+from app.db.local import PriceUpdateRun, PriceUpdateRunItem
+from app.service import batch, scraping
+from app.service.batch import dedupe_skus, run_batch_lookup
+from app.service.scraping import ScrapeError
+
+
+def _offer(sku, price=100):
+    return {"sku": sku, "retailer": "FPT Shop", "finalPriceVND": price}
+
+
+class FakePool:
+    @asynccontextmanager
+    async def acquire(self):
+        yield object()
+
+
+def _patch_scrape(monkeypatch, scrape):
+    async def get_browser_pool():
+        return FakePool()
+    monkeypatch.setattr(batch, "_get_browser_pool", get_browser_pool)
+    monkeypatch.setattr(scraping, "scrape_product_data", scrape)
+
+
+def test_dedupe_keeps_first_spelling_and_order():
+    assert dedupe_skus([" abc-1 ", "ABC1", "", None, "xyz"]) == ["abc-1", "xyz"]
+
+def test_batch_results_do_not_count_as_completed_for_the_nightly_job(local_db):
+    nightly = start_or_resume_run(local_db)
+    mark_sku_done(local_db, nightly.id, "NIGHTLY", [_offer("NIGHTLY")])
+    lookup = start_batch_run(local_db)
+    mark_sku_done(local_db, lookup.id, "LOOKUP", [_offer("LOOKUP")])
+    assert get_completed_skus(local_db) == {"NIGHTLY"}
+
+def test_finishing_a_batch_run_keeps_its_status(local_db):
+    lookup = start_batch_run(local_db)
+    finish_run(local_db, lookup.id)
+    run = local_db.get(PriceUpdateRun, lookup.id)
+    assert run.status == "batch" and run.finished_at is not None
+
+def test_recent_results_match_normalized_skus_and_skip_empty_scrapes(local_db):
+    run = start_or_resume_run(local_db)
+    mark_sku_done(local_db, run.id, "ABC-1", [_offer("ABC-1")])
+    mark_sku_done(local_db, run.id, "EMPTY", [])
+    cached = get_recent_results(local_db, ["abc 1", "EMPTY", "OTHER"])
+    assert cached == {"abc 1": [_offer("ABC-1")]}
+
+def test_failed_and_empty_scrapes_are_not_served_from_the_cache(local_db, monkeypatch):
+    calls = []
+
+    async def scrape(searchQuery, limit, browser, raise_errors=False):
+        calls.append(searchQuery)
+        assert raise_errors
+        if searchQuery == "BROKEN":
+            raise ScrapeError("agent crashed")
+        return [_offer(searchQuery)] if searchQuery == "OK" else []
+    _patch_scrape(monkeypatch, scrape)
+
+    results = asyncio.run(run_batch_lookup(["OK", "EMPTY", "BROKEN"]))
+    assert results["OK"] == {"status": "scraped", "products": [_offer("OK")]}
+    assert results["EMPTY"] == {"status": "scraped", "products": []}
+    assert results["BROKEN"] == {"status": "failed", "error": "agent crashed"}
+    statuses = {item.sku: item.status for item in local_db.query(PriceUpdateRunItem).all()}
+    assert statuses == {"OK": "done", "EMPTY": "done", "BROKEN": "failed"}
+
+    calls.clear()
+    results = asyncio.run(run_batch_lookup(["ok", "EMPTY", "BROKEN"]))
+    assert results["ok"]["status"] == "cached"
+    assert sorted(calls) == ["BROKEN", "EMPTY"]
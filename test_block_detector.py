@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.crud.block_stats import get_block_rates
+from app.crud.serp_cache import save_serp_entry
+from app.db.local import DomainBlockStats
+from app.service import scraping
+from app.service.block_detector import check_response, detect_block, is_cooling_down
+from app.service.metrics import render_metrics
+from app.service.query_planner import normalize_query, run_query_plan
+
+GOOGLE = "https://www.google.com.vn/search?q=abc123"
+SKU = "ABC123"
+
+
+def _cache(db, query, *urls):
+    save_serp_entry(db, normalize_query(query), scraping.GOOGLE_SEARCH_LOCALE, query, [{"url": url} for url in urls])
+
+def _block_google():
+    check_response(GOOGLE, 429, "")
+
+
+def test_block_pages_are_classified_without_the_llm():
+    assert detect_block(302, "https://www.google.com/sorry/index?continue=x") == "unusual_traffic"
+    assert detect_block(200, GOOGLE, "<p>Our systems have detected unusual traffic</p>") == "unusual_traffic"
+    assert detect_block(403, "https://fptshop.com.vn", "", headers={"CF-Mitigated": "challenge"}) == "cloudflare"
+    assert detect_block(200, "https://fptshop.com.vn", "<title>Just a moment...</title>") == "cloudflare"
+    assert detect_block(200, GOOGLE, "", frame_urls=["https://www.google.com/recaptcha/api2/bframe?k=1"]) == "recaptcha"
+    assert detect_block(429, "https://phongvu.vn") == "http_429"
+    assert detect_block(403, "https://phongvu.vn", "<h1>Forbidden</h1>") == "http_403"
+
+def test_real_pages_are_not_blocks():
+    assert detect_block(200, "https://phongvu.vn/abc123", "<div class='price'>12.990.000₫</div>") is None
+    # A reCAPTCHA widget on a large page is a login or contact form
+    page = '<script src="https://www.google.com/recaptcha/api.js"></script><div class="g-recaptcha"></div>' + "x" * 60000
+    assert detect_block(200, "https://phongvu.vn/lien-he", page) is None
+
+def test_a_block_starts_a_cooldown_for_the_domain(local_db):
+    assert check_response("https://phongvu.vn/abc123", 200, "<p>ok</p>") is None
+    assert not is_cooling_down("phongvu.vn")
+    assert check_response("https://www.phongvu.vn/abc123", 429, "") == "http_429"
+    assert is_cooling_down("https://phongvu.vn/other")
+    assert get_block_rates(local_db)["phongvu.vn"]["block_rate"] == 0.5
+    assert 'scraper_domain_block_rate{domain="phongvu.vn"} 0.5' in render_metrics()
+
+    local_db.get(DomainBlockStats, "phongvu.vn").last_blocked = datetime.utcnow() - timedelta(hours=1)
+    local_db.commit()
+    assert not is_cooling_down("phongvu.vn")
+
+def test_cooldown_serves_cached_variants_and_skips_the_rest(local_db):
+    async def search(query):
+        # As scan_google_for_products does while Google cools down
+        searched.append(query)
+        return {"status": "blocked", "reason": "cooldown", "error": "cooling down"}
+    searched = []
+    _cache(local_db, f"{SKU} khuyến mãi", "https://fptshop.com.vn/abc123")
+
+    result = asyncio.run(run_query_plan(SKU, search, locale=scraping.GOOGLE_SEARCH_LOCALE, max_queries=10, patience=0))
+    assert result["status"] == "success" and result["blocked"] == "cooldown"
+    assert [c["url"] for c in result["candidates"]] == ["https://fptshop.com.vn/abc123"]
+    # Only the first uncached variant reached the search; it did not end the plan
+    assert len(searched) == 1
+
+def test_google_scan_fails_over_to_retailers_during_a_cooldown(local_db, monkeypatch):
+    _block_google()
+
+    async def direct(page, query, retailers):
+        return {"urls": ["https://phongvu.vn/abc123"]}
+    monkeypatch.setattr(scraping, "find_product_urls_directly_from_retailers", direct)
+
+    result = asyncio.run(scraping.scan_google_for_products(None, SKU))
+    assert result["source"] == "retailers" and result["blocked"] == "cooldown"
+    assert [c["url"] for c in result["candidates"]] == ["https://phongvu.vn/abc123"]
+
+def test_google_scan_keeps_cached_serps_during_a_cooldown(local_db, monkeypatch):
+    _block_google()
+    _cache(local_db, f"giá rẻ nhất {SKU}", "https://fptshop.com.vn/abc123")
+
+    async def direct(page, query, retailers):
+        raise AssertionError("cached SERPs must be used before failing over")
+    monkeypatch.setattr(scraping, "find_product_urls_directly_from_retailers", direct)
+
+    result = asyncio.run(scraping.scan_google_for_products(None, SKU))
+    assert result["status"] == "success" and result["blocked"] == "cooldown"
+    assert [c["url"] for c in result["candidates"]] == ["https://fptshop.com.vn/abc123"]
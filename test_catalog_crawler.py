@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import os
+import subprocess
+import sys
+
+import httpx
+
+from app.db.local import CatalogUrl
+from app.service.catalog_crawler import build_catalog_entry, crawl_sitemap, discover_sitemaps
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+INDEX = "https://phongvu.vn/sitemap.xml"
+LAPTOP = "https://phongvu.vn/laptop-dell-inspiron-15-3520-n5i5101w1.html"
+SERVER = "https://phongvu.vn/may-chu-dell-poweredge-r750xs.html"
+
+
+def _index(products_lastmod):
+    return (f'<sitemapindex {NS}>'
+            f'<sitemap><loc>https://phongvu.vn/sitemap-products.xml</loc><lastmod>{products_lastmod}</lastmod></sitemap>'
+            f'<sitemap><loc>https://phongvu.vn/sitemap-servers.xml.gz</loc></sitemap>'
+            f'</sitemapindex>')
+
+def _urlset(*urls):
+    return f'<urlset {NS}>' + "".join(f"<url><loc>{url}</loc><lastmod>{lastmod}</lastmod></url>"
+                                      for url, lastmod in urls) + "</urlset>"
+
+def _crawl(db, pages, requested):
+    def handler(request):
+        requested.append(str(request.url))
+        body = pages.get(str(request.url))
+        if body is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=body if isinstance(body, bytes) else body.encode())
+
+    async def crawl():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await crawl_sitemap(client, db, INDEX, "phongvu.vn")
+    return asyncio.run(crawl())
+
+
+def test_catalog_entries_are_built_for_product_urls_only():
+    entry = build_catalog_entry(LAPTOP, "phongvu.vn", "sitemap")
+    assert entry["retailer"] == "Phong Vũ" and entry["source"] == "sitemap"
+    assert "n5i5101w1" in entry["tokens"]
+    assert build_catalog_entry("https://phongvu.vn/tin-tuc/n5i5101w1-ra-mat", "phongvu.vn", "sitemap") is None
+    assert build_catalog_entry("https://phongvu.vn/gio-hang", "phongvu.vn", "sitemap") is None
+    assert build_catalog_entry("https://phongvu.vn/", "phongvu.vn", "sitemap") is None
+
+def test_sitemap_indexes_are_crawled_recursively(local_db):
+    pages = {
+        INDEX: _index("2024-06-01"),
+        "https://phongvu.vn/sitemap-products.xml": _urlset((LAPTOP, "2024-06-01")),
+        "https://phongvu.vn/sitemap-servers.xml.gz": gzip.compress(_urlset((SERVER, "2024-05-01")).encode()),
+    }
+    assert _crawl(local_db, pages, []) == 2
+    assert {row.url for row in local_db.query(CatalogUrl)} == {LAPTOP, SERVER}
+
+def test_unchanged_sitemaps_and_pages_are_skipped_on_refresh(local_db):
+    pages = {
+        INDEX: _index("2024-06-01"),
+        "https://phongvu.vn/sitemap-products.xml": _urlset((LAPTOP, "2024-06-01")),
+    }
+    assert _crawl(local_db, pages, []) == 1
+
+    requested = []
+    assert _crawl(local_db, pages, requested) == 0
+    # The index lastmod of the products sitemap did not change, so it is not fetched
+    assert "https://phongvu.vn/sitemap-products.xml" not in requested
+
+    pages[INDEX] = _index("2024-07-01")
+    pages["https://phongvu.vn/sitemap-products.xml"] = _urlset((LAPTOP, "2024-06-01"), (SERVER, "2024-07-01"))
+    # Only the page modified since the previous crawl is written
+    assert _crawl(local_db, pages, []) == 1
+    assert local_db.query(CatalogUrl).count() == 2
+
+def test_sitemaps_are_discovered_from_robots_txt():
+    def handler(request):
+        if request.url.host == "phongvu.vn":
+            return httpx.Response(200, text=f"User-agent: *\nSitemap: {INDEX}\n")
+        return httpx.Response(404)
+
+    async def discover():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await discover_sitemaps(client, "phongvu.vn"), await discover_sitemaps(client, "gearvn.com")
+    assert asyncio.run(discover()) == ([INDEX], ["https://gearvn.com/sitemap.xml"])
+
+def test_crawler_does_not_import_the_scraping_module():
+    # A fresh interpreter: the test session has imported scraping already
+    code = "import sys, app.service.catalog_crawler; print('app.service.scraping' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.strip() == "False", result.stderr
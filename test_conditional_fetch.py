@@ -0,0 +1,130 @@
+import asyncio
+import re
+
+from app.service.conditional_fetch import fetch_price_fragment
+from app.service.scraping import _extracted_offers, extract_final_price, mark_unchanged_offers, select_offers_to_write
+
+URL = "https://fptshop.com.vn/may-tinh-xach-tay/dell-latitude-3440"
+SELECTOR = ".st-price-main"
+
+
+class FakeResponse:
+    def __init__(self, status, body="", headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._body = body
+
+    async def text(self):
+        return self._body
+
+class FakeRequest:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    async def get(self, url, headers=None, timeout=None):
+        self.sent_headers.append(headers or {})
+        return self.responses.pop(0)
+
+class FakePage:
+    def __init__(self, responses):
+        self.request = FakeRequest(responses)
+
+class RenderingPage(FakePage):
+    """A page whose price only appears once JavaScript has rendered it."""
+
+    def __init__(self, responses, rendered):
+        super().__init__(responses)
+        self.rendered = list(rendered)
+        self.url = URL
+        self.frames = []
+        self._html = ""
+
+    async def goto(self, url):
+        self._html = self.rendered.pop(0)
+        return FakeResponse(200)
+
+    async def wait_for_selector(self, selector, timeout=None):
+        pass
+
+    async def content(self):
+        return self._html
+
+def parse_vnd(text: str) -> int:
+    return int(re.sub(r"\D", "", text))
+
+def _product_page(price: str, banner: str = "") -> str:
+    return f"<html><body><p>{banner}</p><div class='st-price-main'>{price}</div></body></html>"
+
+
+def test_fragment_hash_skips_parse_when_price_unchanged(local_db):
+    page = FakePage([
+        FakeResponse(200, _product_page("12.990.000₫", "Sale"), {"etag": '"v1"'}),
+        FakeResponse(200, _product_page("12.990.000₫", "New banner"), {"etag": '"v2"'}),
+    ])
+    first = asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=parse_vnd))
+    assert first == {"status": "changed", "price": 12990000}
+
+    def fail(_):
+        raise AssertionError("parse must not run for an unchanged fragment")
+    second = asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=fail))
+    assert second == {"status": "unchanged", "price": 12990000}
+    assert page.request.sent_headers[1]["If-None-Match"] == '"v1"'
+
+def test_not_modified_returns_previous_price(local_db):
+    page = FakePage([
+        FakeResponse(200, _product_page("9.490.000₫"), {"last-modified": "Mon, 01 Sep 2025 00:00:00 GMT"}),
+        FakeResponse(304),
+    ])
+    asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=parse_vnd))
+    result = asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=parse_vnd))
+    assert result == {"status": "not_modified", "price": 9490000}
+    assert page.request.sent_headers[1]["If-Modified-Since"] == "Mon, 01 Sep 2025 00:00:00 GMT"
+
+def test_rendered_prices_are_never_served_from_html_validators(local_db):
+    shell = "<html><body><div id='app'></div></body></html>"
+    page = RenderingPage(
+        [FakeResponse(200, _product_page("9.490.000₫"), {"etag": '"v1"'}),
+         FakeResponse(200, shell, {"etag": '"shell"'}),
+         FakeResponse(200, shell, {"etag": '"shell"'})],
+        rendered=[_product_page("9.290.000₫"), _product_page("8.990.000₫")],
+    )
+    assert asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=parse_vnd))["price"] == 9490000
+    # The price moved to JavaScript: the page is rendered and its HTML validators dropped
+    assert asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=parse_vnd)) == {"status": "changed", "price": 9290000}
+    # So the next fetch is not conditional, and the rendered price change is seen
+    assert asyncio.run(fetch_price_fragment(page, URL, SELECTOR, parse=parse_vnd)) == {"status": "changed", "price": 8990000}
+    assert page.request.sent_headers[1] == {"If-None-Match": '"v1"'} and page.request.sent_headers[2] == {}
+
+def test_extract_final_price_records_unchanged_offers(local_db, monkeypatch):
+    async def fake_fetch(page, url, selector, parse):
+        return {"status": "not_modified", "price": 15000000}
+    monkeypatch.setattr("app.service.scraping.fetch_price_fragment", fake_fetch)
+
+    async def run():
+        token = _extracted_offers.set({})
+        try:
+            await extract_final_price(None, URL, "fptshop")
+            return _extracted_offers.get()
+        finally:
+            _extracted_offers.reset(token)
+    extracted = asyncio.run(run())
+    assert extracted[URL]["unchanged"] is True
+
+    products = mark_unchanged_offers(
+        [{"url": URL, "finalPriceVND": 15000000}, {"url": URL, "finalPriceVND": 14000000}, {"url": "https://x.vn/p"}],
+        extracted,
+    )
+    # A different price than the one extracted means the agent saw something else: not unchanged
+    assert [p["unchanged"] for p in products] == [True, False, False]
+
+def test_unchanged_offers_are_not_written():
+    unchanged = [{"sku": "A", "finalPriceVND": 10, "unchanged": True}, {"sku": "A", "finalPriceVND": 12, "unchanged": True}]
+    assert select_offers_to_write(unchanged) == ([], [])
+
+    mixed = unchanged + [{"sku": "A", "finalPriceVND": 11, "unchanged": False}]
+    history, prices = select_offers_to_write(mixed)
+    assert history == [mixed[2]]
+    # The cheapest price still considers the unchanged offers
+    assert prices == mixed
+    assert select_offers_to_write([]) == ([], [])
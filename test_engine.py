@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.db import engine as db_engine
+from app.db.engine import build_engine, pool_metrics
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(monkeypatch):
+    monkeypatch.setattr(db_engine, "_engines", {})
+    monkeypatch.setattr(db_engine, "_pool_events", {})
+
+
+def test_engine_uses_explicit_pool_settings(tmp_path):
+    engine = build_engine("test", f"sqlite:///{tmp_path / 'pool.db'}", pool_size=3, max_overflow=2, pool_timeout=5)
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 2
+    assert engine.pool._timeout == 5
+    assert engine.pool._recycle == db_engine.DB_POOL_RECYCLE
+    assert engine.echo is db_engine.DB_ECHO
+
+def test_pool_metrics_count_connects_and_checkouts(tmp_path):
+    engine = build_engine("test", f"sqlite:///{tmp_path / 'pool.db'}", pool_size=2, max_overflow=0)
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    metrics = pool_metrics()["test"]
+    assert metrics["connects"] == 1 and metrics["checkouts"] == 3
+    assert metrics["checkedout"] == 0 and metrics["saturated_checkouts"] == 0
+
+def test_exhausted_pool_is_counted_and_times_out(tmp_path, caplog):
+    engine = build_engine("test", f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, pool_timeout=0.1)
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        metrics = pool_metrics()["test"]
+    assert metrics["saturated_checkouts"] == 1 and metrics["checkedout"] == 1
+    assert "Connection pool 'test' is exhausted" in caplog.text
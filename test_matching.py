@@ -0,0 +1,41 @@
+from app.service.matching import OfferFeatures, cluster_offers, match_score, model_codes, spec_fingerprint
+
+
+def _offer(title, price, retailer, sku=None):
+    return {"productName": title, "finalPriceVND": price, "retailer": retailer, "sku": sku}
+
+
+def test_spec_fingerprint_reads_screen_sizes_in_all_forms():
+    assert spec_fingerprint("Dell Inspiron 15 3530 i5-1334U 16GB 512GB SSD 15.6 FHD") == {
+        "cpu": "i5-1334u", "ram": "16gb", "storage": "512gb", "screen": "15.6"}
+    assert spec_fingerprint('Lenovo IdeaPad Slim 5 14" OLED')["screen"] == "14"
+    assert spec_fingerprint("HP Pavilion 15,6 inch")["screen"] == "15.6"
+    assert spec_fingerprint("Acer Swift 14 2.8K OLED")["screen"] == "14"
+    # A RAM size or a model number is not a screen
+    assert "screen" not in spec_fingerprint("Asus Vivobook 16 GB RAM 1TB")
+    assert "screen" not in spec_fingerprint("Dell Inspiron 15 3530")
+
+def test_model_codes_skip_specs_and_cpus():
+    codes = model_codes("Laptop Dell Inspiron 3530 N5I5101W1 i5-1334U 16GB 512GB WIN11 RTX3050", sku="n5i5101w1")
+    assert codes == {"N5I5101W1"}
+
+def test_different_makers_or_cpus_never_match():
+    dell = OfferFeatures(_offer("Dell Inspiron 3530 i5-1334U 16GB 512GB", 0, ""))
+    hp = OfferFeatures(_offer("HP Pavilion 15 i5-1334U 16GB 512GB", 0, ""))
+    dell_i7 = OfferFeatures(_offer("Dell Inspiron 3530 i7-1355U 16GB 512GB", 0, ""))
+    assert match_score(dell, hp) == 0.0
+    assert match_score(dell, dell_i7) == 0.0
+
+def test_cluster_offers_groups_one_product_across_retailers():
+    products = cluster_offers([
+        _offer("Laptop Dell Inspiron 15 3530 N5I5101W1 i5-1334U 16GB 512GB 15.6 FHD", 16990000, "FPT Shop"),
+        _offer('Dell Inspiron 3530 (N5I5101W1) Core i5 1334U/16GB/512GB/15.6"', 16490000, "Phong Vũ"),
+        _offer("Laptop Dell Inspiron 3530 i5-1334U 8GB 256GB 15.6 FHD", 13990000, "CellphoneS"),
+        _offer("", 100, "Nameless"),
+    ])
+    assert len(products) == 2
+    largest = products[0]
+    assert largest["brand"] == "Dell" and largest["model"] == "N5I5101W1"
+    assert largest["minPriceVND"] == 16490000
+    assert sorted(largest["retailers"]) == ["FPT Shop", "Phong Vũ"]
+    assert largest["specs"]["screen"] == "15.6"
@@ -0,0 +1,97 @@
+import asyncio
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+
+import app.crud.price_history as price_history
+import app.crud.products as products
+from app.db.local import PriceUpdateRunItem
+from app.db.models import Product, ProductPriceHistory
+from app.service import scraping, workers
+from app.service.metrics import Counter, Histogram, errors_total, merge_metrics, metrics_snapshot, render_metrics, span
+
+
+def _errors(stage):
+    return errors_total.snapshot().get((stage,), 0)
+
+@pytest.fixture
+def job(add_products, patch_job):
+    """One catalog SKU, scraped with a single offer."""
+    add_products("OK")
+
+    async def scrape(searchQuery, limit, raise_errors=False, **kwargs):
+        return [{"sku": "OK", "retailer": "FPT Shop", "finalPriceVND": 100, "url": "https://fptshop.com.vn/ok"}]
+    patch_job(scrape)
+
+
+def test_metrics_render_in_the_prometheus_text_format():
+    counter = Counter("test_total", "Test counter.", ("stage",))
+    counter.inc(stage='say "hi"')
+    counter.inc(2, stage='say "hi"')
+    assert counter.collect() == ["# HELP test_total Test counter.", "# TYPE test_total counter",
+                                 'test_total{stage="say \\"hi\\""} 3']
+    histogram = Histogram("test_seconds", "Test histogram.", buckets=(1, 5))
+    histogram.observe(2)
+    assert histogram.collect()[2:] == ['test_seconds_bucket{le="1"} 0.0', 'test_seconds_bucket{le="5"} 1.0',
+                                       'test_seconds_bucket{le="+Inf"} 1.0', "test_seconds_count 1.0",
+                                       "test_seconds_sum 2.0"]
+    assert "# TYPE scraper_stage_seconds histogram" in render_metrics()
+
+def test_span_times_the_stage_and_counts_errors():
+    before = _errors("test_stage")
+    with pytest.raises(ValueError):
+        with span("test_stage"):
+            raise ValueError("boom")
+    assert _errors("test_stage") == before + 1
+    assert 'scraper_stage_seconds_count{stage="test_stage"}' in render_metrics()
+
+def test_worker_metrics_are_merged_into_the_parent():
+    snapshot = pickle.loads(pickle.dumps(metrics_snapshot()))
+    before = _errors("worker_stage")
+    merge_metrics({"scraper_errors_total": {("worker_stage",): 2}, "unknown_metric": {}})
+    assert _errors("worker_stage") == before + 2
+    assert "scraper_errors_total" in snapshot
+
+def test_sharded_scrape_merges_the_metrics_of_every_shard(monkeypatch):
+    def shard_main(index, skus, pool_size):
+        return {sku: {"products": []} for sku in skus}, {"scraper_errors_total": {("shard_stage",): 1}}
+    monkeypatch.setattr(workers, "_shard_worker_main", shard_main)
+    monkeypatch.setattr(workers, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+    skus = [f"SKU{i}" for i in range(8)]
+    shards = [shard for shard in workers.shard_skus(skus, 3) if shard]
+    before = _errors("shard_stage")
+
+    results = asyncio.run(workers.run_sharded_scrape(skus, workers=3))
+    assert sorted(results) == skus
+    assert len(shards) > 1
+    assert _errors("shard_stage") == before + len(shards)
+
+def test_failed_price_history_write_is_counted_and_the_price_still_updated(local_db, catalog_db, job, monkeypatch,
+                                                                         caplog):
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("deadlock")
+    monkeypatch.setattr(price_history, "add_price_history", fail)
+    before = _errors("price_history_write")
+
+    asyncio.run(scraping.run_price_update_job(workers=1))
+    assert _errors("price_history_write") == before + 1
+    assert "Price history write failed for SKU OK" in caplog.text and "deadlock" in caplog.text
+    assert catalog_db.query(ProductPriceHistory).count() == 0
+    assert float(catalog_db.query(Product).one().Price) == 100
+    assert local_db.query(PriceUpdateRunItem).one().status == "done"
+
+def test_failed_price_update_is_counted_and_marks_the_sku_failed(local_db, job, monkeypatch):
+    update = products.update_price_for_sku
+
+    def update_then_fail(db, sku, new_price, sku_map=None, raise_errors=False):
+        db.execute(text("DROP TABLE Product"))
+        return update(db, sku, new_price, sku_map, raise_errors)
+    monkeypatch.setattr(products, "update_price_for_sku", update_then_fail)
+    before = _errors("db_update")
+
+    asyncio.run(scraping.run_price_update_job(workers=1))
+    assert _errors("db_update") == before + 1
+    assert local_db.query(PriceUpdateRunItem).one().status == "failed"
@@ -0,0 +1,94 @@
+import json
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.service import offer_store
+from app.service.offer_store import (
+    OfferBuffer, append_offers, compact_offer_store, import_legacy_outputs, normalize_offer, read_offers
+)
+
+
+def _offer(sku, price, scraped_at, retailer="FPT Shop"):
+    return {"sku": sku, "productName": f"Laptop {sku}", "retailer": retailer, "finalPriceVND": price,
+            "url": f"https://fptshop.com.vn/{sku}", "scrapedAt": scraped_at}
+
+
+def test_normalize_offer_coerces_types_and_drops_nameless_offers():
+    row = normalize_offer({"productName": "Laptop", "finalPriceVND": "9.490.000₫", "oldPriceVND": 10500000.0,
+                           "scrapedAt": "2025-08-21T11:24:05Z", "sku": 123}, search_query="ABC")
+    assert row["finalPriceVND"] == 9490000 and row["oldPriceVND"] == 10500000
+    assert row["scrapedAt"] == datetime(2025, 8, 21, 11, 24, 5, tzinfo=timezone.utc)
+    assert row["sku"] == "123" and row["searchQuery"] == "ABC"
+    assert normalize_offer({"finalPriceVND": 100}) is None
+
+def test_offers_are_partitioned_by_date_and_filtered_on_read(tmp_path):
+    root = str(tmp_path / "offers")
+    assert append_offers([
+        _offer("A", 100, "2025-08-20T10:00:00Z"),
+        _offer("A", 90, "2025-08-21T10:00:00Z", retailer="Phong Vũ"),
+        _offer("B", 200, "2025-08-21T12:00:00Z"),
+    ], root=root) == 3
+    assert sorted(os.listdir(root)) == ["date=2025-08-20", "date=2025-08-21"]
+
+    assert read_offers(root=root).num_rows == 3
+    day = read_offers(start=date(2025, 8, 21), end=date(2025, 8, 21), root=root)
+    assert sorted(day.column("sku").to_pylist()) == ["A", "B"]
+    assert read_offers(sku="A", retailer="Phong Vũ", root=root).column("finalPriceVND").to_pylist() == [90]
+    assert read_offers(root=str(tmp_path / "missing")).num_rows == 0
+
+def test_compaction_merges_each_partition_into_one_sorted_file(tmp_path):
+    root = str(tmp_path / "offers")
+    append_offers([_offer("B", 200, "2025-08-21T12:00:00Z")], root=root)
+    append_offers([_offer("A", 100, "2025-08-21T10:00:00Z")], root=root)
+    assert compact_offer_store(root) == {"date=2025-08-21": 2}
+
+    files = os.listdir(os.path.join(root, "date=2025-08-21"))
+    assert len(files) == 1 and files[0].startswith("compacted-")
+    assert read_offers(root=root).column("sku").to_pylist() == ["A", "B"]
+
+def test_legacy_import_reads_one_file_per_run(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    products = [{"sku": "A", "productName": "Laptop A", "finalPriceVND": 100}]
+    (output_dir / "agent_products_20250821_112405.json").write_text(json.dumps(products), encoding="utf-8")
+    (output_dir / "agent_output_20250821_112405.json").write_text(json.dumps({"products": products}), encoding="utf-8")
+    (output_dir / "products_output_20250821_112405.csv").write_text("sku,productName,finalPriceVND\nA,Laptop A,100\n",
+                                                                      encoding="utf-8")
+    root = str(tmp_path / "offers")
+
+    assert import_legacy_outputs(str(output_dir), root=root, delete=True) == 1
+    table = read_offers(root=root)
+    assert table.column("scrapedAt").to_pylist() == [datetime(2025, 8, 21, 11, 24, 5, tzinfo=timezone.utc)]
+    assert os.listdir(output_dir) == []
+
+def test_buffer_writes_one_file_per_partition_by_server_time(tmp_path):
+    root = str(tmp_path / "offers")
+    buffer = OfferBuffer(root=root)
+    today = datetime.now(timezone.utc).date()
+    # The model's scrapedAt does not choose the partition
+    for sku in ("A", "B", "C"):
+        assert buffer.add([_offer(sku, 100, "2024-06-01T00:00:00Z")], search_query=sku) == 1
+    assert not os.path.exists(root)
+
+    assert buffer.flush() == 3 and len(buffer) == 0
+    assert os.listdir(root) == [f"date={today}"]
+    assert len(os.listdir(os.path.join(root, f"date={today}"))) == 1
+    assert read_offers(root=root).column("searchQuery").to_pylist() == ["A", "B", "C"]
+
+def test_buffer_flushes_when_full_and_keeps_offers_after_a_failed_write(tmp_path, monkeypatch):
+    root = str(tmp_path / "offers")
+    buffer = OfferBuffer(root=root, flush_rows=2)
+    buffer.add([_offer("A", 100, None)])
+    buffer.add([_offer("B", 100, None)])
+    assert len(buffer) == 0 and read_offers(root=root).num_rows == 2
+
+    def fail(rows, root):
+        raise OSError("disk full")
+    monkeypatch.setattr(offer_store, "_write_rows", fail)
+    buffer.flush_rows = 10
+    buffer.add([_offer("C", 100, None)])
+    with pytest.raises(OSError):
+        buffer.flush()
+    assert len(buffer) == 1
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.crud.price_history import (
+    get_latest_prices_per_retailer, get_min_prices_over_window, get_price_series, insert_price_history
+)
+from app.db.models import ProductPriceHistory
+from app.schemas.products import parse_scraped_at
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def _offer(price, retailer, hours_ago, sku="abc1-vn"):
+    scraped_at = (NOW - timedelta(hours=hours_ago)).replace(tzinfo=timezone.utc).isoformat()
+    return {"sku": sku, "retailer": retailer, "finalPriceVND": price, "url": f"https://{retailer}/p", "scrapedAt": scraped_at}
+
+
+def test_parse_scraped_at_returns_aware_utc():
+    assert parse_scraped_at("2025-08-21T11:24:05Z") == datetime(2025, 8, 21, 11, 24, 5, tzinfo=timezone.utc)
+    assert parse_scraped_at("2025-08-21T18:24:05+07:00") == datetime(2025, 8, 21, 11, 24, 5, tzinfo=timezone.utc)
+    assert parse_scraped_at(datetime(2025, 8, 21)).tzinfo == timezone.utc
+    assert parse_scraped_at("yesterday") is None and parse_scraped_at(None) is None
+
+def test_history_is_stored_under_the_catalog_sku(catalog_db):
+    offers = [_offer(100, "fptshop", 1), _offer(None, "cellphones", 1), _offer(90, "phongvu", 2, sku=None)]
+    assert insert_price_history(catalog_db, "ABC-1", offers) == 2
+    rows = catalog_db.query(ProductPriceHistory).order_by(ProductPriceHistory.Price).all()
+    assert [row.Sku for row in rows] == ["ABC-1", "ABC-1"]
+    # Stored as naive UTC
+    assert rows[1].ScrapedOnUtc == NOW - timedelta(hours=1)
+
+def test_latest_price_per_retailer_and_window_queries(catalog_db):
+    insert_price_history(catalog_db, "A", [
+        _offer(120, "fptshop", 30),
+        _offer(100, "fptshop", 1),
+        _offer(80, "phongvu", 24 * 40),
+        _offer(95, "phongvu", 5),
+    ])
+    latest = get_latest_prices_per_retailer(catalog_db, "A")
+    assert [(row.Retailer, float(row.Price)) for row in latest] == [("phongvu", 95), ("fptshop", 100)]
+
+    assert get_min_prices_over_window(catalog_db, ["A", "B"], days=30) == {"A": 95.0}
+    assert [float(row.Price) for row in get_price_series(catalog_db, "A", days=30, retailer="fptshop")] == [120, 100]
+
+def test_history_rows_get_the_server_scrape_time_not_the_models(local_db, catalog_db, tmp_path, monkeypatch):
+    import browser_use
+    from app.service import scraping
+    from app.service.offer_store import OfferBuffer
+    tasks = []
+
+    class Result:
+        def final_result(self):
+            return '{"products": [{"productName": "A", "sku": "ABC-1", "retailer": "fptshop", ' \
+                   '"finalPriceVND": 100, "scrapedAt": "2024-06-01T00:00:00Z"}]}'
+
+    class Agent:
+        def __init__(self, task, **kwargs):
+            tasks.append(task)
+
+        async def run(self):
+            return Result()
+    class Sink:
+        def append(self, products, search_query=None):
+            return len(products)
+    monkeypatch.setattr(browser_use, "Agent", Agent)
+    monkeypatch.setattr(scraping, "get_result_sink", Sink)
+    monkeypatch.setattr(scraping, "get_offer_buffer", lambda: OfferBuffer(root=str(tmp_path)))
+
+    offers = asyncio.run(scraping.scrape_product_data("ABC-1", limit=4, browser=object()))
+    assert "scrapedAt" not in tasks[0] and "2025-08-21" not in tasks[0]
+    insert_price_history(catalog_db, "ABC-1", offers)
+    scraped_on = catalog_db.query(ProductPriceHistory).one().ScrapedOnUtc
+    assert abs(scraped_on - datetime.utcnow()) < timedelta(minutes=1)
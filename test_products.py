@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.crud.products import SkuIdMap, update_price_for_sku
+from app.db.migrations import PRODUCT_SKU_INDEX, ensure_product_sku_index, has_index
+from app.db.models import Product
+
+T0 = datetime(2025, 9, 1, 12, 0, 0)
+
+
+def _product(db, sku, deleted=False, updated=T0):
+    product = Product(Name=sku, Sku=sku, Price=999, OldPrice=0, ProductCost=0, Deleted=deleted, UpdatedOnUtc=updated)
+    db.add(product)
+    db.commit()
+    return product
+
+
+def test_sku_index_is_created_once(catalog_db):
+    catalog_db.execute(text(f"DROP INDEX {PRODUCT_SKU_INDEX}"))
+    assert not has_index(catalog_db, "Product", PRODUCT_SKU_INDEX)
+    assert ensure_product_sku_index(catalog_db)
+    assert has_index(catalog_db, "Product", PRODUCT_SKU_INDEX)
+    assert ensure_product_sku_index(catalog_db)
+
+def test_sku_map_matches_like_the_default_collation(catalog_db):
+    product = _product(catalog_db, "abc-1 ")
+    sku_map = SkuIdMap()
+    sku_map.refresh(catalog_db)
+    assert sku_map.get("ABC-1") == product.Id
+    # Separators are significant, as they are for the Sku index
+    assert sku_map.get("ABC1") is None
+
+def test_sku_map_refresh_follows_renames_and_soft_deletes(catalog_db):
+    kept = _product(catalog_db, "KEPT")
+    renamed = _product(catalog_db, "OLD")
+    deleted = _product(catalog_db, "GONE")
+    _product(catalog_db, "NEVER", deleted=True)
+    sku_map = SkuIdMap()
+    assert sku_map.refresh(catalog_db) == 3
+    assert sorted(sku_map.skus()) == ["GONE", "KEPT", "OLD"]
+
+    later = T0 + timedelta(hours=1)
+    renamed.Sku, renamed.UpdatedOnUtc = "NEW", later
+    deleted.Deleted, deleted.UpdatedOnUtc = True, later
+    catalog_db.commit()
+    added = _product(catalog_db, "ADDED", updated=later)
+
+    # The deleted products are read (NEVER too, by its new Id) but not mapped
+    assert sku_map.refresh(catalog_db) == 4
+    assert sorted(sku_map.skus()) == ["ADDED", "KEPT", "NEW"]
+    assert sku_map.get("NEW") == renamed.Id and sku_map.get("ADDED") == added.Id
+    assert sku_map.get("GONE") is None and sku_map.get("KEPT") == kept.Id
+
+def test_soft_deleted_product_is_not_updated(catalog_db):
+    product = _product(catalog_db, "GONE")
+    sku_map = SkuIdMap()
+    sku_map.refresh(catalog_db)
+    product.Deleted, product.UpdatedOnUtc = True, T0 + timedelta(hours=1)
+    catalog_db.commit()
+    sku_map.refresh(catalog_db)
+
+    update_price_for_sku(catalog_db, "GONE", 100, sku_map=sku_map)
+    catalog_db.refresh(product)
+    assert float(product.Price) == 999
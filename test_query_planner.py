@@ -0,0 +1,50 @@
+import asyncio
+
+from app.crud.query_stats import get_template_yields
+from app.crud.sku_index import record_sku_urls
+from app.db.local import QueryTemplateStats
+from app.service import query_planner
+from app.service.query_planner import normalize_query, plan_queries, run_query_plan
+
+SKU = "ABC123"
+URLS = ["https://fptshop.com.vn/abc123", "https://phongvu.vn/abc123", "https://cellphones.com.vn/abc123"]
+
+
+def _search(urls):
+    searched = []
+
+    async def search(query):
+        searched.append(query)
+        return {"status": "success", "candidates": [{"url": url} for url in urls]}
+    return search, searched
+
+def _stats(local_db):
+    return {row.template: (row.searches, row.new_urls) for row in local_db.query(QueryTemplateStats).all()}
+
+
+def test_accent_and_case_variants_share_one_query():
+    assert normalize_query("  Giá rẻ nhất  Đèn ") == "gia re nhat den"
+    queries = [normalize_query(query) for _, query in plan_queries("Laptop ABC")]
+    assert len(queries) == len(set(queries))
+
+def test_every_template_is_credited_for_its_own_results(local_db, monkeypatch):
+    monkeypatch.setattr(query_planner, "SEARCH_TEMPLATES", ["{q}", "{q} khuyến mãi"])
+    record_sku_urls(local_db, SKU, [{"url": URLS[0]}], source="agent", confidence=0.9)
+    search, searched = _search(URLS)
+
+    result = asyncio.run(run_query_plan(SKU, search, max_queries=2, patience=0))
+    assert searched == [SKU, f"{SKU} khuyến mãi"]
+    assert [c["url"] for c in result["candidates"]] == URLS
+    # The second template found the same two unknown URLs as the first one
+    assert _stats(local_db) == {"{q}": (1, 2), "{q} khuyến mãi": (1, 2)}
+
+def test_templates_are_planned_by_yield(local_db, monkeypatch):
+    monkeypatch.setattr(query_planner, "SEARCH_TEMPLATES", ["{q}", "{q} khuyến mãi"])
+    local_db.add_all([
+        QueryTemplateStats(template="{q}", searches=4, results=4, new_urls=0),
+        QueryTemplateStats(template="{q} khuyến mãi", searches=4, results=20, new_urls=12),
+    ])
+    local_db.commit()
+    yields = get_template_yields(local_db, ["{q}", "{q} khuyến mãi", "variant"])
+    assert yields["{q} khuyến mãi"] > yields["variant"] > yields["{q}"]
+    assert plan_queries(SKU)[0] == ("{q} khuyến mãi", f"{SKU} khuyến mãi")
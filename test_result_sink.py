@@ -0,0 +1,74 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from app.db.models import Product
+from app.service import scraping
+from app.service.result_sink import JsonlResultSink, iter_results
+
+NOW = datetime.utcnow()
+
+
+def _offer(price, retailer, hours_ago, sku="A"):
+    return {"sku": sku, "retailer": retailer, "finalPriceVND": price,
+            "loggedAt": (NOW - timedelta(hours=hours_ago)).isoformat() + "Z"}
+
+
+def test_sink_rotates_files_and_reader_skips_torn_lines(tmp_path):
+    directory = str(tmp_path / "results")
+    with JsonlResultSink(directory, max_bytes=1) as sink:
+        assert sink.append([{"sku": "A"}], search_query="A") == 1
+        first = sink.path
+        assert sink.append([{"sku": "B", "searchQuery": "b"}]) == 1
+        assert sink.path != first
+    with open(os.path.join(directory, sorted(os.listdir(directory))[-1]), "a", encoding="utf-8") as f:
+        f.write('{"sku": "C", "retai')
+
+    records = list(iter_results(directory))
+    assert [{k: v for k, v in record.items() if k != "loggedAt"} for record in records] == [
+        {"sku": "A", "searchQuery": "A"}, {"sku": "B", "searchQuery": "b"}]
+    # Every record carries the server time it was logged at
+    assert all(abs(datetime.utcnow() - datetime.fromisoformat(record["loggedAt"][:-1])) < timedelta(minutes=1)
+               for record in records)
+
+def test_missing_result_log_yields_nothing(tmp_path):
+    assert list(iter_results(str(tmp_path / "missing.jsonl"))) == []
+    assert list(iter_results(str(tmp_path / "missing"))) == []
+
+def test_latest_offer_per_retailer_within_the_window():
+    offers = [
+        _offer(80, "FPT Shop", 72),
+        _offer(90, "FPT Shop", 20),
+        _offer(120, "Phong Vũ", 2),
+        _offer(100, "FPT Shop", 1),
+        # Further down the log, but logged earlier than the 120 offer
+        _offer(70, "Phong Vũ", 3),
+    ]
+    latest = scraping.latest_offers_per_retailer(offers, since=NOW - timedelta(hours=48))
+    assert sorted((offer["retailer"], offer["finalPriceVND"]) for offer in latest) == [("FPT Shop", 100), ("Phong Vũ", 120)]
+
+def test_window_ignores_the_models_scraped_at_and_drops_unstamped_offers():
+    since = NOW - timedelta(hours=48)
+    fresh = {**_offer(100, "FPT Shop", 1), "scrapedAt": "2024-06-01T00:00:00Z"}
+    unstamped = {"sku": "A", "retailer": "Phong Vũ", "finalPriceVND": 50, "scrapedAt": "2024-06"}
+    assert scraping.latest_offers_per_retailer([fresh, unstamped], since=since) == [fresh]
+    # Without a window nothing is aged out
+    assert len(scraping.latest_offers_per_retailer([fresh, unstamped])) == 2
+
+def test_json_to_db_job_prices_from_the_latest_offers_only(local_db, catalog_db, tmp_path, monkeypatch):
+    catalog_db.add(Product(Name="A", Sku="A", Price=999, OldPrice=0, ProductCost=0))
+    catalog_db.commit()
+
+    def get_db():
+        yield catalog_db
+    monkeypatch.setattr(scraping, "get_db", get_db)
+    log = tmp_path / "results.jsonl"
+    log.write_text("".join(json.dumps(offer) + "\n" for offer in [
+        _offer(80, "FPT Shop", 72), _offer(90, "FPT Shop", 20), _offer(100, "FPT Shop", 1), _offer(110, "Phong Vũ", 2),
+    ]), encoding="utf-8")
+
+    scraping.run_json_to_db_update_job(str(log))
+    assert float(catalog_db.query(Product).one().Price) == 100
+
+    # A missing log is reported, not raised
+    scraping.run_json_to_db_update_job(str(tmp_path / "missing.jsonl"))
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.crud.run_ledger import (
+    finish_run, get_completed_skus, get_exhausted_skus, mark_sku_done, mark_sku_failed, mark_sku_started,
+    start_or_resume_run
+)
+from app.db.local import PriceUpdateRunItem
+from app.db.models import Product
+from app.service import scraping
+from app.service.scraping import ScrapeError
+
+
+def test_unfinished_run_is_resumed_and_finished_run_is_not(local_db):
+    run = start_or_resume_run(local_db)
+    assert start_or_resume_run(local_db).id == run.id
+    finish_run(local_db, run.id)
+    assert start_or_resume_run(local_db).id != run.id
+
+def test_failed_skus_are_retried_until_max_attempts(local_db):
+    run = start_or_resume_run(local_db)
+    for _ in range(3):
+        mark_sku_started(local_db, run.id, "FLAKY")
+        mark_sku_failed(local_db, run.id, "FLAKY", "Timeout")
+    mark_sku_started(local_db, run.id, "CRASHED")
+    mark_sku_started(local_db, run.id, "OK")
+    mark_sku_done(local_db, run.id, "OK", [])
+    assert get_exhausted_skus(local_db, run.id, max_attempts=3) == {"FLAKY"}
+    assert get_completed_skus(local_db) == {"OK"}
+
+
+def test_job_marks_failed_scrapes_failed_and_empty_scrapes_done(local_db, catalog_db, add_products, patch_job):
+    add_products("OK", "EMPTY", "BROKEN")
+    calls = []
+
+    async def scrape(searchQuery, limit, raise_errors=False, **kwargs):
+        calls.append(searchQuery)
+        assert raise_errors
+        if searchQuery == "BROKEN":
+            raise ScrapeError("agent crashed")
+        if searchQuery == "EMPTY":
+            return []
+        return [{"sku": "OK", "retailer": "FPT Shop", "finalPriceVND": 100, "url": "https://fptshop.com.vn/ok"}]
+    patch_job(scrape)
+
+    asyncio.run(scraping.run_price_update_job(workers=1))
+    items = {item.sku: item for item in local_db.query(PriceUpdateRunItem).all()}
+    assert {sku: item.status for sku, item in items.items()} == {"OK": "done", "EMPTY": "done", "BROKEN": "failed"}
+    assert items["BROKEN"].result == "agent crashed"
+    assert float(catalog_db.query(Product).filter(Product.Sku == "OK").one().Price) == 100
+
+    # The next run retries the failed SKU only
+    calls.clear()
+    asyncio.run(scraping.run_price_update_job(workers=1))
+    assert calls == ["BROKEN"]
+
+def test_job_spends_the_budget_on_the_most_valuable_skus_of_all_pages(local_db, add_products, patch_job,
+                                                                     monkeypatch):
+    add_products("P1-A", "P1-B", "P2-A", "P2-B", "P3-A", "P3-B")
+    calls = []
+
+    async def scrape(searchQuery, limit, raise_errors=False, **kwargs):
+        calls.append(searchQuery)
+        return []
+    patch_job(scrape)
+    monkeypatch.setattr(scraping, "SKU_PAGE_SIZE", 2)
+    monkeypatch.setattr(scraping, "CRAWL_BUDGET_PER_RUN", 3)
+
+    asyncio.run(scraping.run_price_update_job(sales_ranks={"P3-B": 1, "P2-A": 2, "P3-A": 3}, workers=1))
+    assert calls == ["P3-B", "P2-A", "P3-A"]
+
+def test_scrape_product_data_raises_scrape_error_on_request(local_db, monkeypatch):
+    import browser_use
+
+    class CrashingAgent:
+        def __init__(self, **kwargs):
+            pass
+
+        async def run(self):
+            raise RuntimeError("LLM unavailable")
+    monkeypatch.setattr(browser_use, "Agent", CrashingAgent)
+    events = []
+
+    assert asyncio.run(scraping.scrape_product_data("SKU-1", limit=4, browser=object(), on_event=events.append)) == []
+    assert events[-1]["event"] == "summary" and events[-1]["error"] == "LLM unavailable"
+    with pytest.raises(ScrapeError, match="LLM unavailable"):
+        asyncio.run(scraping.scrape_product_data("SKU-1", limit=4, browser=object(), raise_errors=True))
+
+def test_failed_browser_start_is_cleaned_up_and_summarized(local_db, monkeypatch):
+    stopped = []
+
+    class BrokenBrowser:
+        async def start(self):
+            raise RuntimeError("chromium not found")
+
+        async def stop(self):
+            stopped.append(True)
+    monkeypatch.setattr(scraping, "create_browser", lambda keep_alive=False: BrokenBrowser())
+    events = []
+
+    assert asyncio.run(scraping.scrape_product_data("SKU-1", limit=4, on_event=events.append)) == []
+    assert events[-1]["event"] == "summary" and events[-1]["status"] == "error"
+    assert events[-1]["error"] == "chromium not found"
+    assert stopped == [True]
+    assert scraping._scrape_event_sink.get() is None
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from app.db.local import SkuSchedule
+from app.service.scheduler import (
+    MAX_RECRAWL_HOURS, MIN_RECRAWL_HOURS, SkuPriorityQueue, build_sku_priority_queue, recrawl_interval,
+    record_sku_observation, select_due_skus, set_manual_boost, sku_priority
+)
+
+NOW = datetime(2025, 9, 1, 12, 0, 0)
+
+
+def _offers(price, retailer="FPT Shop"):
+    return [{"sku": "A", "retailer": retailer, "finalPriceVND": price}]
+
+
+def test_recrawl_interval_spans_min_to_max():
+    assert recrawl_interval(1.0) == timedelta(hours=MIN_RECRAWL_HOURS)
+    assert recrawl_interval(0.0) == timedelta(hours=MAX_RECRAWL_HOURS)
+    assert recrawl_interval(0.2) > recrawl_interval(0.8)
+    # Out-of-range volatilities are clamped
+    assert recrawl_interval(3.0) == recrawl_interval(1.0)
+
+def test_volatility_rises_on_changes_and_decays_when_stable(local_db):
+    record_sku_observation(local_db, "A", _offers(100), now=NOW)
+    start = local_db.get(SkuSchedule, "A").volatility
+
+    schedule = record_sku_observation(local_db, "A", _offers(90), now=NOW + timedelta(hours=1))
+    assert schedule.changes == 1 and schedule.volatility > start
+    volatile = schedule.volatility
+
+    for hour in range(2, 8):
+        schedule = record_sku_observation(local_db, "A", _offers(90), now=NOW + timedelta(hours=hour))
+    assert schedule.volatility < volatile
+    assert schedule.checks == 8 and schedule.last_price == 90
+
+def test_stable_sku_is_due_later_than_volatile_one(local_db):
+    for hour, price in enumerate([100, 100, 100, 100]):
+        stable = record_sku_observation(local_db, "STABLE", _offers(price, "Phong Vũ"), now=NOW + timedelta(hours=hour))
+    for hour, price in enumerate([100, 80, 120, 90]):
+        volatile = record_sku_observation(local_db, "VOLATILE", _offers(price, "CellphoneS"), now=NOW + timedelta(hours=hour))
+    assert volatile.next_due < stable.next_due
+
+def test_failed_scrape_is_retried_soon_without_changing_volatility(local_db):
+    record_sku_observation(local_db, "A", _offers(100), now=NOW)
+    before = local_db.get(SkuSchedule, "A").volatility
+    schedule = record_sku_observation(local_db, "A", [], now=NOW)
+    assert schedule.volatility == before
+    assert schedule.next_due <= NOW + timedelta(hours=6)
+
+def test_select_due_skus_puts_new_then_most_overdue_first(local_db):
+    local_db.add_all([
+        SkuSchedule(sku="NOT_DUE", volatility=0.5, next_due=NOW + timedelta(hours=1)),
+        SkuSchedule(sku="LATE", volatility=0.5, next_due=NOW - timedelta(hours=10)),
+        SkuSchedule(sku="LATER", volatility=0.5, next_due=NOW - timedelta(hours=20)),
+    ])
+    local_db.commit()
+    skus = ["NOT_DUE", "LATE", "NEW", "LATER"]
+    assert select_due_skus(local_db, skus, budget=None, now=NOW) == ["NEW", "LATER", "LATE"]
+    assert select_due_skus(local_db, skus, budget=2, now=NOW) == ["NEW", "LATER"]
+
+
+def test_priority_queue_pops_highest_first_and_keeps_ties_in_order():
+    queue = SkuPriorityQueue()
+    for sku, priority in [("low", 0.1), ("tie1", 0.5), ("high", 0.9), ("tie2", 0.5)]:
+        queue.push(sku, priority)
+    assert list(queue.drain(3)) == ["high", "tie1", "tie2"]
+    assert len(queue) == 1
+
+def test_bounded_priority_queue_keeps_the_top_k_across_pushes():
+    queue = SkuPriorityQueue(capacity=3)
+    for sku, priority in [("a", 0.2), ("b", 0.9), ("c", 0.1), ("d", 0.5), ("e", 0.9), ("f", 0.5)]:
+        queue.push(sku, priority)
+    assert len(queue) == 3
+    # On ties the earlier SKU is kept
+    assert list(queue.drain()) == ["b", "e", "d"]
+
+def test_sku_priority_weighs_sales_margin_and_staleness():
+    assert sku_priority(sales_rank=1) > sku_priority(sales_rank=100)
+    assert sku_priority(margin=0.4) > sku_priority(margin=0.1)
+    # Never scraped counts as fully stale
+    assert sku_priority(hours_since_success=None) > sku_priority(hours_since_success=1)
+    assert sku_priority(manual_boost=1.0) - sku_priority() == 1.0
+
+def test_build_priority_queue_uses_signals_and_manual_boost(local_db):
+    record_sku_observation(local_db, "FRESH", _offers(100), now=NOW)
+    set_manual_boost(local_db, "BOOSTED", 5.0)
+    queue = build_sku_priority_queue(
+        local_db, ["FRESH", "BESTSELLER", "BOOSTED", "PLAIN"],
+        sales_ranks={"BESTSELLER": 1}, margins={"PLAIN": 0.0}, now=NOW + timedelta(minutes=5),
+    )
+    assert list(queue.drain()) == ["BOOSTED", "BESTSELLER", "PLAIN", "FRESH"]
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.crud.serp_cache import claim_serp_refresh, get_serp_entry, save_serp_entry
+from app.db.local import SerpCacheEntry
+from app.service import serp_cache
+from app.service.serp_cache import cached_serp, purge_expired_serps
+
+KEY, LOCALE = "abc123 khuyen mai", "www.google.com.vn|vi"
+
+
+def _search(*outcomes):
+    searched = []
+
+    async def search(query):
+        searched.append(query)
+        return outcomes[min(len(searched), len(outcomes)) - 1]
+    return search, searched
+
+def _found(*urls):
+    return {"status": "success", "candidates": [{"url": url} for url in urls]}
+
+def _age(db, seconds):
+    entry = db.get(SerpCacheEntry, (KEY, LOCALE))
+    entry.fetched_at = datetime.utcnow() - timedelta(seconds=seconds)
+    db.commit()
+
+
+def test_miss_searches_once_and_then_serves_the_fresh_entry(local_db):
+    search, searched = _search(_found("u1"))
+
+    async def run():
+        return [await cached_serp(KEY, LOCALE, "ABC123 khuyến mãi", search) for _ in range(2)]
+    (first, first_source), (second, second_source) = asyncio.run(run())
+    assert (first_source, second_source) == ("search", "fresh")
+    assert first == second == _found("u1")
+    assert searched == ["ABC123 khuyến mãi"]
+
+def test_stale_entry_is_served_while_one_refresh_runs(local_db):
+    save_serp_entry(local_db, KEY, LOCALE, "q", [{"url": "old"}])
+    _age(local_db, serp_cache.SERP_CACHE_TTL_SECONDS + 60)
+    search, searched = _search(_found("new"))
+    revalidate, revalidated = _search(_found("new"))
+
+    async def run():
+        served = [await cached_serp(KEY, LOCALE, "q", search, revalidate) for _ in range(2)]
+        await asyncio.gather(*serp_cache._refreshes)
+        return served
+    served = asyncio.run(run())
+    # Both callers get the stale SERP; only the claim holder refetches it, in the background
+    assert served == [(_found("old"), "stale")] * 2
+    assert searched == [] and revalidated == ["q"]
+    local_db.expire_all()
+    entry = get_serp_entry(local_db, KEY, LOCALE)
+    assert entry.refreshing_until is None and "new" in entry.candidates
+
+def test_entry_past_the_stale_window_is_searched_again(local_db):
+    save_serp_entry(local_db, KEY, LOCALE, "q", [{"url": "old"}])
+    _age(local_db, serp_cache.SERP_CACHE_TTL_SECONDS + serp_cache.SERP_CACHE_STALE_SECONDS + 60)
+    search, searched = _search(_found("new"))
+    assert asyncio.run(cached_serp(KEY, LOCALE, "q", search)) == (_found("new"), "search")
+
+def test_failed_search_is_not_cached_and_releases_the_claim(local_db):
+    search, searched = _search({"status": "failure", "error": "timeout"}, _found("u1"))
+    outcome, source = asyncio.run(cached_serp(KEY, LOCALE, "q", search))
+    assert outcome["status"] == "failure" and source == "search"
+    local_db.expire_all()
+    assert get_serp_entry(local_db, KEY, LOCALE) is None
+    assert local_db.get(SerpCacheEntry, (KEY, LOCALE)).refreshing_until is None
+    assert asyncio.run(cached_serp(KEY, LOCALE, "q", search)) == (_found("u1"), "search")
+
+def test_only_one_worker_claims_a_refresh_until_the_lease_runs_out(local_db):
+    assert claim_serp_refresh(local_db, KEY, LOCALE, "q", lease_seconds=60)
+    assert not claim_serp_refresh(local_db, KEY, LOCALE, "q", lease_seconds=60)
+    local_db.get(SerpCacheEntry, (KEY, LOCALE)).refreshing_until = datetime.utcnow() - timedelta(seconds=1)
+    local_db.commit()
+    assert claim_serp_refresh(local_db, KEY, LOCALE, "q", lease_seconds=60)
+
+def test_waiting_worker_picks_up_the_entry_another_worker_fetched(local_db, monkeypatch):
+    monkeypatch.setattr(serp_cache, "SERP_CACHE_WAIT_SECONDS", 5)
+    assert claim_serp_refresh(local_db, KEY, LOCALE, "q", lease_seconds=60)
+    search, searched = _search(_found("mine"))
+
+    async def sleep(seconds):
+        save_serp_entry(local_db, KEY, LOCALE, "q", [{"url": "theirs"}])
+    monkeypatch.setattr(serp_cache.asyncio, "sleep", sleep)
+    assert asyncio.run(cached_serp(KEY, LOCALE, "q", search)) == (_found("theirs"), "fresh")
+    assert searched == []
+
+def test_purge_keeps_servable_entries(local_db):
+    save_serp_entry(local_db, KEY, LOCALE, "q", [])
+    save_serp_entry(local_db, "other", LOCALE, "other", [])
+    local_db.get(SerpCacheEntry, ("other", LOCALE)).fetched_at = datetime(2000, 1, 1)
+    local_db.commit()
+    assert purge_expired_serps() == 1
+    local_db.expire_all()
+    assert get_serp_entry(local_db, KEY, LOCALE) is not None
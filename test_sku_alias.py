@@ -0,0 +1,81 @@
+import asyncio
+
+from app.crud.run_ledger import start_or_resume_run
+from app.crud.sku_alias import SkuAliasMap, canonicalize_sku
+from app.db.local import SkuAlias
+from app.db.models import Product
+from app.service import scraping, work_queue, workers
+from app.service.scraping import offers_for_sku
+from app.service.work_queue import InMemoryWorkQueue, apply_queue_results
+
+SKU = "N5I5101W1"
+
+
+def _price(db, sku):
+    return float(db.query(Product).filter(Product.Sku == sku).one().Price)
+
+def _scraped():
+    return [
+        {"sku": "n5i5101w1-Black", "retailer": "FPT Shop", "finalPriceVND": 100, "productName": "Dell Inspiron 3530"},
+        {"sku": "DELL-3530-RT", "retailer": "Phong Vũ", "finalPriceVND": 95,
+         "productName": f"Laptop Dell Inspiron 3530 {SKU}", "url": "https://phongvu.vn/dell-3530"},
+        # Another product the agent picked up, cheaper
+        {"sku": "HP-15-FD0", "retailer": "CellphoneS", "finalPriceVND": 50, "productName": "HP 15 fd0"},
+    ]
+
+def _learned(local_db):
+    return {row.alias: row.catalog_sku for row in local_db.query(SkuAlias).all()}
+
+
+def test_canonical_form_drops_separators_and_colour_suffixes():
+    assert canonicalize_sku("n5i5101w1-Black") == SKU
+    assert canonicalize_sku("ABC-BOX-SILVER") == "ABC"
+    assert canonicalize_sku("BLACK") == "BLACK"
+
+def test_offers_for_sku_keeps_the_searched_product_and_learns_aliases(local_db):
+    aliases = SkuAliasMap().load(local_db, [SKU])
+    kept = offers_for_sku(SKU, _scraped(), aliases)
+    assert [offer["retailer"] for offer in kept] == ["FPT Shop", "Phong Vũ"]
+    assert aliases.save(local_db) == 1
+    assert _learned(local_db) == {"DELL3530RT": SKU}
+    # The learned alias now resolves on its own
+    assert SkuAliasMap().load(local_db, [SKU]).resolve("dell-3530-rt") == SKU
+
+def test_sequential_job_prices_only_offers_of_the_searched_sku(local_db, catalog_db, add_products, patch_job):
+    add_products(SKU)
+
+    async def scrape(searchQuery, limit, raise_errors=False, **kwargs):
+        return _scraped()
+    patch_job(scrape)
+
+    asyncio.run(scraping.run_price_update_job(workers=1))
+    assert _price(catalog_db, SKU) == 95
+    assert _learned(local_db) == {"DELL3530RT": SKU}
+
+def test_sharded_update_resolves_offers_through_aliases(local_db, catalog_db, add_products, monkeypatch):
+    add_products(SKU)
+
+    async def fake_scrape(skus, workers, pool_size):
+        return {SKU: {"products": _scraped()}}
+    monkeypatch.setattr(workers, "run_sharded_scrape", fake_scrape)
+    run = start_or_resume_run(local_db)
+
+    asyncio.run(workers.run_sharded_price_update(catalog_db, local_db, run.id, [SKU], workers=2))
+    assert _price(catalog_db, SKU) == 95
+    assert _learned(local_db) == {"DELL3530RT": SKU}
+
+def test_queue_collector_resolves_offers_through_aliases(local_db, catalog_db, add_products, monkeypatch):
+    import app.db.mydb
+    add_products(SKU)
+
+    def get_db():
+        yield catalog_db
+    monkeypatch.setattr(app.db.mydb, "get_db", get_db)
+    monkeypatch.setattr(work_queue, "_sku_id_map", None)
+    queue = InMemoryWorkQueue()
+    queue.publish([SKU])
+    queue.ack(queue.lease("w1"), _scraped())
+
+    assert apply_queue_results(queue) == 1
+    assert _price(catalog_db, SKU) == 95
+    assert _learned(local_db) == {"DELL3530RT": SKU}
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.crud.sku_index import MIN_TRUSTED_CONFIDENCE, demote_sku_urls, get_known_urls, record_sku_urls
+from app.db.local import SkuUrlIndex
+from app.service import scraping
+
+URL = "https://phongvu.vn/abc-123"
+
+
+def _urls(db, sku="ABC123", **kwargs):
+    return [row.url for row in get_known_urls(db, sku, **kwargs)]
+
+def _row(db, url=URL):
+    return db.query(SkuUrlIndex).filter(SkuUrlIndex.url == url).one()
+
+
+def test_urls_are_recorded_under_the_normalized_sku(local_db):
+    record_sku_urls(local_db, "abc-123", [{"url": URL, "retailer": "Phong Vũ"}, {"url": None}], source="agent",
+                    confidence=0.9)
+    assert _urls(local_db, "ABC 123") == [URL]
+    assert _row(local_db).sku == "ABC123" and _row(local_db).retailer == "Phong Vũ"
+
+def test_reconfirmed_urls_gain_confidence(local_db):
+    for _ in range(3):
+        record_sku_urls(local_db, "ABC123", [{"url": URL}], source="agent", confidence=0.9)
+    row = _row(local_db)
+    assert row.confidence == 1.0 and row.hit_count == 3
+
+def test_demoted_urls_drop_out_of_the_lookup(local_db):
+    record_sku_urls(local_db, "ABC123", [{"url": URL}], source="agent", confidence=0.9)
+    demote_sku_urls(local_db, "ABC123", [URL])
+    assert _row(local_db).confidence == pytest.approx(0.45)
+    assert _urls(local_db) == [URL]
+    demote_sku_urls(local_db, "ABC123", [URL])
+    assert _urls(local_db) == []
+
+def test_stale_urls_are_ignored(local_db):
+    record_sku_urls(local_db, "ABC123", [{"url": URL}], source="agent", confidence=0.9)
+    _row(local_db).last_seen = datetime.utcnow() - timedelta(hours=100)
+    local_db.commit()
+    assert _urls(local_db, max_age_hours=72) == []
+    assert _urls(local_db, max_age_hours=200) == [URL]
+
+def test_google_candidates_are_not_trusted_until_the_agent_confirms_them(local_db):
+    candidates = [{"url": URL, "productName": "Laptop ABC123"}, {"url": "https://example.com/abc123"}]
+    for _ in range(3):
+        scraping._index_google_candidates("giá rẻ nhất ABC123", candidates)
+    # Unknown retailers are not indexed; repeated sightings stay below the threshold
+    assert _urls(local_db, min_confidence=0.0) == [URL]
+    assert _row(local_db).confidence < MIN_TRUSTED_CONFIDENCE
+    assert _urls(local_db) == []
+
+    record_sku_urls(local_db, "ABC123", [{"url": URL}], source="agent", confidence=0.9)
+    assert _urls(local_db) == [URL] and _row(local_db).source == "agent"
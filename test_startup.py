@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the API and CLI entry points.
+
+Heavy subsystems (browser_use, playwright, pandas, bs4, the database drivers)
+must load on first use, not at import time.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+# Wall-clock budget for importing an entry point in a fresh interpreter
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+
+
+def _import_in_subprocess(module: str, watched: list) -> dict:
+    """Imports a module in a fresh interpreter; returns its import time and which watched modules got loaded."""
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {watched!r} if m in sys.modules]}}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def test_api_import_is_light():
+    result = _import_in_subprocess(
+        "app.main", ["browser_use", "playwright", "pandas", "bs4", "sqlalchemy", "pyodbc", "uvicorn"]
+    )
+    assert result["loaded"] == [], f"app.main imports heavy modules at startup: {result['loaded']}"
+    assert result["seconds"] < IMPORT_BUDGET_SECONDS, f"app.main took {result['seconds']:.2f}s to import"
+
+def test_scraping_module_defers_browser_stack():
+    result = _import_in_subprocess(
+        "app.service.scraping", ["browser_use", "playwright", "pandas", "bs4", "pyodbc"]
+    )
+    assert result["loaded"] == [], f"app.service.scraping imports heavy modules at startup: {result['loaded']}"
+    assert result["seconds"] < IMPORT_BUDGET_SECONDS, f"app.service.scraping took {result['seconds']:.2f}s to import"
+
+def test_mydb_does_not_connect_at_import():
+    result = _import_in_subprocess("app.db.mydb", ["pyodbc"])
+    assert result["loaded"] == []
+    import app.db.mydb as mydb
+    assert mydb.engine is None
+
+def test_health_check_does_not_load_the_browser_or_databases():
+    code = (
+        "import asyncio, json, sys, httpx\n"
+        "from app.main import app\n"
+        "async def get():\n"
+        "    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:\n"
+        "        return await client.get('/health')\n"
+        "response = asyncio.run(get())\n"
+        "watched = ['browser_use', 'playwright', 'pyodbc', 'app.service.scraping', 'app.db.mydb']\n"
+        "print(json.dumps({'body': response.json(), 'loaded': [m for m in watched if m in sys.modules]}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result["body"] == {"status": "ok"}
+    assert result["loaded"] == []
+
+
+if __name__ == "__main__":
+    for test in (test_api_import_is_light, test_scraping_module_defers_browser_stack, test_mydb_does_not_connect_at_import,
+                 test_health_check_does_not_load_the_browser_or_databases):
+        test()
+        print(f"{test.__name__}: OK")
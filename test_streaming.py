@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from app.service import scraping, streaming
+from app.service.streaming import format_ndjson, format_sse, stream_scrape_events
+
+
+async def _collect(stream, limit=None):
+    events = []
+    async for event in stream:
+        events.append(event)
+        if limit and len(events) == limit:
+            break
+    await stream.aclose()
+    return events
+
+
+def test_events_are_streamed_in_order_until_the_summary(monkeypatch):
+    async def scrape(searchQuery, limit, on_event, **kwargs):
+        on_event({"event": "step", "step": 1, "url": "https://www.google.com"})
+        await asyncio.sleep(0)
+        on_event({"event": "offer", "offer": {"sku": searchQuery, "finalPriceVND": 100}})
+        on_event({"event": "summary", "products": [{"sku": searchQuery}]})
+        return [{"sku": searchQuery}]
+    monkeypatch.setattr(scraping, "scrape_product_data", scrape)
+
+    events = asyncio.run(_collect(stream_scrape_events("SKU-1")))
+    assert [event["event"] for event in events] == ["step", "offer", "summary"]
+    assert events[1]["offer"]["sku"] == "SKU-1"
+
+def test_keepalive_is_sent_while_the_agent_is_idle(monkeypatch):
+    async def scrape(searchQuery, limit, on_event, **kwargs):
+        await asyncio.sleep(0.05)
+        on_event({"event": "summary", "products": []})
+        return []
+    monkeypatch.setattr(scraping, "scrape_product_data", scrape)
+    monkeypatch.setattr(streaming, "STREAM_KEEPALIVE_SECONDS", 0.01)
+
+    events = asyncio.run(_collect(stream_scrape_events("SKU-1")))
+    assert events[0] == {"event": "keepalive"}
+    assert events[-1]["event"] == "summary"
+
+def test_agent_is_cancelled_when_the_client_disconnects(monkeypatch):
+    cancelled = []
+
+    async def scrape(searchQuery, limit, on_event, **kwargs):
+        on_event({"event": "step", "step": 1})
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(searchQuery)
+            raise
+    monkeypatch.setattr(scraping, "scrape_product_data", scrape)
+
+    async def disconnect_after_first_event():
+        events = await _collect(stream_scrape_events("SKU-1"), limit=1)
+        await asyncio.sleep(0)
+        return events
+
+    assert asyncio.run(disconnect_after_first_event()) == [{"event": "step", "step": 1}]
+    assert cancelled == ["SKU-1"]
+
+def test_sse_and_ndjson_formats():
+    event = {"event": "offer", "offer": {"retailer": "Phong Vũ", "finalPriceVND": 100}}
+    sse = format_sse(event)
+    assert sse.startswith("event: offer\ndata: ") and sse.endswith("\n\n")
+    assert json.loads(sse.split("data: ", 1)[1]) == event
+    assert "Phong Vũ" in sse
+
+    line = format_ndjson(event)
+    assert line.endswith("\n") and line.count("\n") == 1
+    assert json.loads(line) == event
+
+def test_a_crashed_scrape_ends_the_stream_with_an_error_summary(monkeypatch):
+    async def scrape(searchQuery, limit, on_event, **kwargs):
+        on_event({"event": "step", "step": 1})
+        raise RuntimeError("browser did not start")
+    monkeypatch.setattr(scraping, "scrape_product_data", scrape)
+
+    events = asyncio.run(_collect(stream_scrape_events("SKU-1")))
+    assert [event["event"] for event in events] == ["step", "summary"]
+    assert events[-1]["status"] == "error" and events[-1]["error"] == "browser did not start"
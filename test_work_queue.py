@@ -0,0 +1,107 @@
+import pytest
+
+from app.db.local import SkuSchedule
+from app.db.models import Product
+from app.service.work_queue import InMemoryWorkQueue, RedisWorkQueue, SqlWorkQueue, WorkQueue, publish_catalog_skus
+
+
+@pytest.fixture(params=["memory", "sql", "redis"])
+def queue(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryWorkQueue(max_attempts=2)
+    if request.param == "sql":
+        return SqlWorkQueue(f"sqlite:///{tmp_path / 'queue.db'}", max_attempts=2)
+    # fakeredis runs the queue's Lua scripts through lupa
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisWorkQueue("redis://fake", max_attempts=2, client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_work_queue_is_abstract():
+    with pytest.raises(TypeError):
+        WorkQueue()
+
+def test_publish_skips_skus_already_queued_or_leased(queue):
+    assert queue.publish(["A", "B", "A"]) == 2
+    lease = queue.lease("w1")
+    assert queue.publish(["A", "B", "C"]) == 1
+    assert queue.active_skus() == {"A", "B", "C"}
+
+    queue.ack(lease, [])
+    assert queue.publish([lease.sku]) == 1
+
+def test_nacked_job_keeps_its_priority(queue):
+    queue.publish(["LOW", "HIGH", "MID"], {"LOW": 1.0, "HIGH": 3.0, "MID": 2.0})
+    lease = queue.lease("w1")
+    assert lease.sku == "HIGH"
+    assert queue.nack(lease, "Timeout")
+    assert [queue.lease("w1").sku for _ in range(3)] == ["HIGH", "MID", "LOW"]
+
+def test_expired_lease_is_requeued_at_its_priority(queue):
+    queue.publish(["LOW", "HIGH"], {"LOW": 1.0, "HIGH": 2.0})
+    expired = queue.lease("w1", visibility_timeout=-1)
+    assert expired.sku == "HIGH"
+    retry = queue.lease("w2")
+    assert retry.sku == "HIGH" and retry.attempts == 2
+    # The expired lease no longer owns the job
+    assert not queue.ack(expired, [])
+
+def test_expired_lease_at_max_attempts_is_dead_lettered(queue):
+    queue.publish(["A"])
+    for _ in range(2):
+        assert queue.lease("w1", visibility_timeout=-1).sku == "A"
+    assert queue.lease("w2") is None
+    assert queue.pending_count() == 0
+    assert queue.active_skus() == set()
+    assert queue.publish(["A"]) == 1
+
+def test_job_is_dead_lettered_after_max_attempts(queue):
+    queue.publish(["A"])
+    queue.nack(queue.lease("w1"), "Timeout")
+    queue.nack(queue.lease("w1"), "Timeout")
+    assert queue.lease("w1") is None
+    assert queue.pending_count() == 0
+    # A dead SKU can be published again by the next run
+    assert queue.publish(["A"]) == 1
+
+def test_results_are_collected_once(queue):
+    queue.publish(["A"])
+    queue.ack(queue.lease("w1"), [{"sku": "A", "finalPriceVND": 100}])
+    assert queue.collect_results() == {"A": [{"sku": "A", "finalPriceVND": 100}]}
+    assert queue.collect_results() == {}
+
+
+def test_publish_catalog_skus_skips_active_skus(local_db, catalog_db, monkeypatch):
+    import app.db.mydb
+
+    def get_db():
+        yield catalog_db
+    monkeypatch.setattr(app.db.mydb, "get_db", get_db)
+    catalog_db.add_all([Product(Name=sku, Sku=sku, Price=999, OldPrice=0, ProductCost=0) for sku in ["A", "B", "C"]])
+    catalog_db.commit()
+    local_db.add(SkuSchedule(sku="C", volatility=0.5, manual_boost=5.0))
+    local_db.commit()
+
+    queue = InMemoryWorkQueue()
+    queue.publish(["A"])
+    assert publish_catalog_skus(queue, page_size=1) == 2
+    assert queue.pending_count() == 3
+    # C is boosted, so it leads the newly published SKUs
+    assert [queue.lease("w1").sku for _ in range(3)] == ["C", "B", "A"]
+
+def test_publish_catalog_skus_keeps_the_best_skus_of_all_pages_within_the_budget(local_db, catalog_db, monkeypatch):
+    import app.db.mydb
+    import app.service.scheduler as scheduler
+
+    def get_db():
+        yield catalog_db
+    monkeypatch.setattr(app.db.mydb, "get_db", get_db)
+    monkeypatch.setattr(scheduler, "CRAWL_BUDGET_PER_RUN", 2)
+    catalog_db.add_all([Product(Name=sku, Sku=sku, Price=1000, OldPrice=0, ProductCost=cost)
+                        for sku, cost in [("A", 900), ("B", 100), ("C", 500), ("D", 200)]])
+    catalog_db.commit()
+
+    queue = InMemoryWorkQueue()
+    assert publish_catalog_skus(queue, page_size=2) == 2
+    # The highest margins, although they are on different pages
+    assert [queue.lease("w1").sku for _ in range(2)] == ["B", "D"]
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app.crud.products import SkuIdMap, bulk_update_prices
+from app.crud.run_ledger import start_or_resume_run
+from app.db.local import PriceUpdateRunItem, SkuSchedule
+from app.db.models import Product, ProductPriceHistory
+from app.service import workers
+from app.service.workers import run_sharded_price_update, shard_skus
+
+
+def _price(db, sku):
+    return float(db.query(Product).filter(Product.Sku == sku).one().Price)
+
+def _offer(sku, price, retailer="FPT Shop"):
+    return {"sku": sku, "retailer": retailer, "finalPriceVND": price, "url": f"https://fptshop.com.vn/{sku}"}
+
+def _statuses(local_db):
+    return {item.sku: item.status for item in local_db.query(PriceUpdateRunItem).all()}
+
+
+def test_shards_are_stable_and_keep_priority_order():
+    skus = [f"SKU-{i}" for i in range(50)]
+    shards = shard_skus(skus, 4)
+    assert shards == shard_skus(skus, 4)
+    assert sorted(sum(shards, [])) == sorted(skus)
+    for shard in shards:
+        assert shard == [sku for sku in skus if sku in shard]
+
+def test_bulk_update_matches_skus_case_insensitively_without_a_map(catalog_db, add_products):
+    # Sku compared case-insensitively, like under SQL Server's default collation
+    catalog_db.execute(text('DROP TABLE "Product"'))
+    catalog_db.execute(text(
+        'CREATE TABLE "Product" (Id INTEGER PRIMARY KEY AUTOINCREMENT, Name VARCHAR(400) NOT NULL, '
+        'Sku VARCHAR(400) COLLATE NOCASE, Price NUMERIC(18, 4) NOT NULL, OldPrice NUMERIC(18, 4) NOT NULL, '
+        'ProductCost NUMERIC(18, 4) NOT NULL, Published BOOLEAN NOT NULL, Deleted BOOLEAN NOT NULL, '
+        'CreatedOnUtc DATETIME DEFAULT CURRENT_TIMESTAMP, UpdatedOnUtc DATETIME DEFAULT CURRENT_TIMESTAMP)'
+    ))
+    add_products("abc-1", "XYZ-2")
+    assert bulk_update_prices(catalog_db, {"ABC-1": 100, "xyz-2": 200}) == 2
+    assert _price(catalog_db, "abc-1") == 100 and _price(catalog_db, "XYZ-2") == 200
+
+def test_bulk_update_writes_prices_and_history_in_one_transaction(catalog_db, add_products, monkeypatch):
+    add_products("A")
+    sku_map = SkuIdMap()
+    sku_map.refresh(catalog_db)
+
+    def failing_commit():
+        raise RuntimeError("deadlock victim")
+    monkeypatch.setattr(catalog_db, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        bulk_update_prices(catalog_db, {"A": 100}, sku_map=sku_map, history={"A": [_offer("A", 100)]})
+    monkeypatch.undo()
+    assert _price(catalog_db, "A") == 999
+    assert catalog_db.query(ProductPriceHistory).count() == 0
+
+def _run_sharded(local_db, catalog_db, monkeypatch, results):
+    async def fake_scrape(skus, workers, pool_size):
+        return results
+    monkeypatch.setattr(workers, "run_sharded_scrape", fake_scrape)
+    run = start_or_resume_run(local_db)
+    sku_map = SkuIdMap()
+    sku_map.refresh(catalog_db)
+    asyncio.run(run_sharded_price_update(catalog_db, local_db, run.id, list(results), workers=2, sku_map=sku_map))
+
+def test_sharded_update_marks_done_only_after_commit(local_db, catalog_db, add_products, monkeypatch):
+    add_products("A", "B")
+    _run_sharded(local_db, catalog_db, monkeypatch, {
+        "A": {"products": [_offer("A", 100), _offer("A", 90, "Phong Vũ")]},
+        "B": {"error": "Timeout"},
+    })
+    assert _statuses(local_db) == {"A": "done", "B": "failed"}
+    assert _price(catalog_db, "A") == 90
+    assert catalog_db.query(ProductPriceHistory).filter(ProductPriceHistory.Sku == "A").count() == 2
+    assert local_db.get(SkuSchedule, "A").last_price == 90
+
+def test_sharded_update_marks_skus_failed_when_the_write_fails(local_db, catalog_db, add_products, monkeypatch):
+    add_products("A")
+
+    def failing_commit():
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(catalog_db, "commit", failing_commit)
+    _run_sharded(local_db, catalog_db, monkeypatch, {"A": {"products": [_offer("A", 100)]}})
+    assert _statuses(local_db) == {"A": "failed"}
+    # Not scheduled as checked, so the retry is not pushed back
+    assert local_db.get(SkuSchedule, "A") is None